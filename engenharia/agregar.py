@@ -0,0 +1,177 @@
+from pathlib import Path
+import logging
+import pandas as pd
+import pyarrow as pa
+from esquema import (ESQUEMA_AGREGADOS, ESQUEMA_ATRIBUTOS, ler_parquet,
+                     para_dataframe, para_tabela, remover_artefato, salvar_tabela)
+from utils import medir, registrar_execucao, registrar_metricas, tamanho_em_disco
+
+
+# Colunas geográficas que identificam cada nível de agregação
+NIVEIS = {
+    'brasil': [],
+    'regiao': ['regiao'],
+    'estado': ['regiao', 'estado'],
+    'regiao_saude': ['regiao', 'estado', 'cod_regiao_saude', 'nome_regiao_saude'],
+}
+
+# Colunas que identificam cada período de agregação
+PERIODOS = {
+    'dia': ['data'],
+    'semana': ['ano_epi', 'semana_epi', 'inicio_semana'],
+}
+
+MEDIDAS = ['novos_casos_novos', 'obitos_novos']
+COLUNAS_LIDAS = (['codmun', 'populacao_tcu_2019', 'data'] + MEDIDAS
+                 + sorted({c for chaves in NIVEIS.values() for c in chaves}))
+
+
+def _semanas_epidemiologicas(datas):
+    """
+    Calcula a semana epidemiológica de cada data.
+
+    A semana epidemiológica vai de domingo a sábado e pertence ao ano da sua
+    quarta-feira; a semana 1 é a que contém a primeira quarta-feira do ano.
+    Assim, os últimos dias de dezembro podem cair na semana 1 do ano
+    seguinte, e os primeiros de janeiro na semana 52 ou 53 do ano anterior.
+
+    Args:
+        datas (pd.Series): Datas (datetime64).
+
+    Returns:
+        pd.DataFrame: Colunas 'ano_epi', 'semana_epi' e 'inicio_semana'
+        (o domingo da semana), com o índice de `datas`.
+    """
+    codigos, unicas = pd.factorize(datas)
+    unicas = pd.DatetimeIndex(unicas)
+
+    domingo = unicas - pd.to_timedelta((unicas.dayofweek + 1) % 7, unit='D')
+    quarta = domingo + pd.Timedelta(days=3)
+
+    semanas = pd.DataFrame({
+        'ano_epi': quarta.year,
+        'semana_epi': (quarta.dayofyear - 1) // 7 + 1,
+        'inicio_semana': domingo,
+    })
+    return pd.DataFrame(
+        {coluna: semanas[coluna].array.take(codigos) for coluna in semanas.columns},
+        index=datas.index)
+
+
+def _agregar_nivel(df, populacao, chaves, periodo):
+    """
+    Soma as medidas de um nível geográfico em um período e calcula as taxas.
+
+    Args:
+        df (pd.DataFrame): Atributos com as colunas de semana epidemiológica.
+        populacao (pd.Series | int): População de cada grupo do nível,
+            indexada pelas `chaves` (ou o total, no nível Brasil).
+        chaves (list[str]): Colunas do nível geográfico.
+        periodo (list[str]): Colunas do período.
+
+    Returns:
+        pd.DataFrame: Uma linha por grupo e período, com 'populacao', as
+        MEDIDAS e as taxas por 100 mil habitantes.
+    """
+    agregado = (df.groupby(chaves + periodo, observed=True, sort=True)[MEDIDAS]
+                .sum().reset_index())
+
+    if chaves:
+        agregado = agregado.join(populacao, on=chaves)
+    else:
+        agregado['populacao'] = populacao
+
+    agregado['casos_por_100k'] = agregado['novos_casos_novos'] / agregado['populacao'] * 1e5
+    agregado['obitos_por_100k'] = agregado['obitos_novos'] / agregado['populacao'] * 1e5
+    return agregado
+
+
+def _construir_agregados(df):
+    """
+    Calcula todas as combinações de NIVEIS e PERIODOS.
+
+    A população de um grupo é a soma de 'populacao_tcu_2019' dos seus
+    municípios, contados uma única vez (e não uma vez por dia).
+
+    Args:
+        df (pd.DataFrame): Atributos com as colunas COLUNAS_LIDAS.
+
+    Returns:
+        dict[str, pd.DataFrame]: Tabelas agregadas, com nomes no formato
+        '<nivel>_<periodo>' (ex.: 'estado_semana').
+    """
+    df = df.join(_semanas_epidemiologicas(df['data']))
+    municipios = df.drop_duplicates('codmun')
+
+    agregados = {}
+    for nivel, chaves in NIVEIS.items():
+        if chaves:
+            populacao = municipios.groupby(chaves, observed=True)[
+                'populacao_tcu_2019'].sum().rename('populacao')
+        else:
+            populacao = municipios['populacao_tcu_2019'].sum()
+
+        for periodo, colunas in PERIODOS.items():
+            with medir(f'{nivel}_{periodo}'):
+                agregados[f'{nivel}_{periodo}'] = _agregar_nivel(
+                    df, populacao, chaves, colunas)
+
+    return agregados
+
+
+@registrar_execucao
+def agregar(pasta, dados=None, em_memoria=False):
+    """
+    Materializa os agregados por região, estado e região de saúde.
+
+    Lê o '2.atributos.parquet' (ou os atributos em memória, em `dados`) e,
+    para cada nível geográfico de NIVEIS, soma os casos novos suavizados e
+    os óbitos novos por dia e por semana epidemiológica, com as taxas por
+    100 mil habitantes. Cada tabela é gravada em
+    '<pasta>/3.agregados/<nivel>_<periodo>.parquet', pequena o bastante para
+    que os gráficos não precisem reler e reagrupar os dados por município.
+
+    Args:
+        pasta (str): Caminho da pasta base contendo o '2.atributos.parquet'.
+        dados (pd.DataFrame, optional): Atributos já em memória, como
+            devolvidos por computar_atributos. Default=None
+        em_memoria (bool, optional): Devolve as tabelas agregadas. Default=False
+
+    Returns:
+        dict[str, pd.DataFrame] | None: Com em_memoria=True, as tabelas
+        agregadas por nome. Caso contrário não retorna valores, mas grava os
+        arquivos Parquet.
+
+    Example:
+        >>> agregar('dados')
+        # Grava 'dados/3.agregados/estado_dia.parquet', 'estado_semana.parquet', ...
+    """
+    nome_arquivo = f'{pasta}/2.atributos.parquet'
+    pasta_agregados = Path(f'{pasta}/3.agregados')
+
+    if dados is None:
+        logging.info(f"Lendo arquivo {nome_arquivo}")
+        registrar_metricas(bytes_lidos=tamanho_em_disco(nome_arquivo))
+        df = ler_parquet(nome_arquivo, ESQUEMA_ATRIBUTOS, colunas=COLUNAS_LIDAS)
+    elif isinstance(dados, pa.Table):
+        df = para_dataframe(dados.select(COLUNAS_LIDAS), ESQUEMA_ATRIBUTOS)
+    else:
+        df = dados[COLUNAS_LIDAS]
+
+    registrar_metricas(linhas_entrada=len(df))
+
+    agregados = _construir_agregados(df)
+
+    remover_artefato(pasta_agregados)
+    pasta_agregados.mkdir(parents=True)
+
+    for nome, agregado in agregados.items():
+        esquema = pa.schema([ESQUEMA_AGREGADOS.field(c) for c in agregado.columns])
+        salvar_tabela(para_tabela(agregado, esquema),
+                      pasta_agregados / f'{nome}.parquet')
+        registrar_metricas(linhas_saida=len(agregado))
+        logging.info(f"Agregado {nome} salvo com {len(agregado)} linhas")
+
+    registrar_metricas(bytes_gravados=tamanho_em_disco(pasta_agregados))
+
+    return agregados if em_memoria else None
@@ -1,45 +1,307 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import pandas as pd
+import queue
+import threading
+import pyarrow as pa
+import pyarrow.csv as pv
 import logging
-from utils import registrar_execucao
+from esquema import (ESQUEMA_RAW, caminho_artefato, com_particoes, gravar_lotes,
+                     salvar_dataset)
+from utils import (no_contexto_atual, registrar_execucao, registrar_metricas,
+                   tamanho_em_disco)
+
+
+# Blocos lidos de cada arquivo que podem aguardar a gravação na leitura
+# paralela; limita a memória a cerca de workers * BLOCOS_EM_ESPERA blocos
+BLOCOS_EM_ESPERA = 2
+
+# Marca o fim dos blocos de um arquivo na fila da leitura paralela
+_FIM = object()
+
+
+def _listar_arquivos(pasta):
+    """
+    Lista os arquivos CSV da subpasta 'raw' em ordem alfabética.
+
+    A ordenação garante que o Parquet gerado tenha sempre a mesma ordem de
+    linhas para o mesmo conjunto de arquivos (HIST_PAINEL_..._Parte1, Parte2...).
+
+    Args:
+        pasta (str): Caminho da pasta base que contém a subpasta 'raw'.
+
+    Returns:
+        list[Path]: Arquivos encontrados, excluindo '.gitkeep'.
+    """
+    directory_path = Path(f'{pasta}/raw')
+    return sorted(f for f in directory_path.iterdir() if f.is_file()
+                  and f.name != ".gitkeep")
+
+
+def _opcoes_csv(tamanho_bloco):
+    """
+    Monta as opções de leitura do pyarrow para os CSVs do Ministério da Saúde.
+
+    Args:
+        tamanho_bloco (int): Tamanho aproximado de cada bloco, em bytes.
+
+    Returns:
+        dict: Argumentos nomeados para pyarrow.csv.open_csv / read_csv.
+    """
+    return dict(
+        read_options=pv.ReadOptions(block_size=tamanho_bloco),
+        parse_options=pv.ParseOptions(delimiter=';'),
+        convert_options=pv.ConvertOptions(
+            column_types=ESQUEMA_RAW,
+            include_columns=ESQUEMA_RAW.names,
+            strings_can_be_null=True
+        )
+    )
+
+
+def _ler_em_blocos(arquivo, tamanho_bloco):
+    """
+    Lê um arquivo CSV do Ministério da Saúde em blocos com esquema fixo.
+
+    Utiliza o leitor em streaming do pyarrow, de modo que apenas um bloco
+    fica em memória por vez. Os tipos das colunas são fixados por ESQUEMA_RAW,
+    evitando inferência divergente entre arquivos.
+
+    Args:
+        arquivo (Path): Arquivo CSV separado por ';'.
+        tamanho_bloco (int): Tamanho aproximado de cada bloco, em bytes.
+
+    Yields:
+        pa.RecordBatch: Blocos de linhas com o esquema ESQUEMA_RAW.
+    """
+    leitor = pv.open_csv(arquivo, **_opcoes_csv(tamanho_bloco))
+
+    for bloco in leitor:
+        yield bloco
+
+
+def _colocar(fila, item, cancelado):
+    """
+    Coloca um item em uma fila limitada, desistindo se a leitura for cancelada.
+
+    Args:
+        fila (queue.Queue): Fila de blocos de um arquivo.
+        item: Bloco, exceção ou _FIM.
+        cancelado (threading.Event): Sinaliza que o consumidor parou.
+
+    Returns:
+        bool: True se o item foi colocado na fila.
+    """
+    while not cancelado.is_set():
+        try:
+            fila.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produzir_blocos(arquivo, opcoes, fila, cancelado):
+    """
+    Lê um arquivo CSV em streaming, colocando cada bloco em uma fila limitada.
+
+    A thread fica bloqueada quando a fila está cheia, de modo que no máximo
+    BLOCOS_EM_ESPERA blocos do arquivo ficam em memória aguardando a gravação.
+    Erros de leitura são repassados ao consumidor pela própria fila.
+
+    Args:
+        arquivo (Path): Arquivo CSV separado por ';'.
+        opcoes (dict): Opções de leitura (ver _opcoes_csv).
+        fila (queue.Queue): Fila de blocos do arquivo.
+        cancelado (threading.Event): Sinaliza que o consumidor parou.
+
+    Returns:
+        None
+    """
+    try:
+        for bloco in pv.open_csv(arquivo, **opcoes):
+            if not _colocar(fila, bloco, cancelado):
+                return
+    except Exception as erro:
+        _colocar(fila, erro, cancelado)
+        return
+    _colocar(fila, _FIM, cancelado)
+
+
+def _ler_em_paralelo(arquivos, workers, tamanho_bloco):
+    """
+    Lê vários arquivos CSV concorrentemente, devolvendo os blocos na ordem de entrada.
+
+    Até `workers` arquivos são lidos ao mesmo tempo, cada um em streaming
+    (pyarrow.csv.open_csv) por uma thread do pool; o parser CSV do pyarrow
+    libera o GIL, então as leituras ocorrem de fato em paralelo. Os blocos
+    de cada arquivo passam por uma fila limitada a BLOCOS_EM_ESPERA, então
+    a memória fica em torno de workers * BLOCOS_EM_ESPERA blocos,
+    independente do tamanho dos arquivos. A ordem de saída é sempre a ordem
+    da lista recebida e, dentro de cada arquivo, a ordem dos blocos.
+
+    Args:
+        arquivos (list[Path]): Arquivos CSV a serem lidos, já ordenados.
+        workers (int): Número de arquivos lidos simultaneamente.
+        tamanho_bloco (int): Tamanho aproximado de cada bloco, em bytes.
+
+    Yields:
+        tuple[Path, pa.RecordBatch]: O arquivo e cada um de seus blocos, com
+        o esquema ESQUEMA_RAW.
+    """
+    opcoes = _opcoes_csv(tamanho_bloco)
+    cancelado = threading.Event()
+    restantes = iter(arquivos)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pendentes = deque()
+
+        def iniciar_proximo():
+            arquivo = next(restantes, None)
+            if arquivo is not None:
+                fila = queue.Queue(maxsize=BLOCOS_EM_ESPERA)
+                executor.submit(_produzir_blocos, arquivo, opcoes, fila, cancelado)
+                pendentes.append((arquivo, fila))
+
+        try:
+            for _ in range(workers):
+                iniciar_proximo()
+
+            while pendentes:
+                arquivo, fila = pendentes.popleft()
+                while (item := fila.get()) is not _FIM:
+                    if isinstance(item, Exception):
+                        raise item
+                    yield arquivo, item
+                iniciar_proximo()
+        finally:
+            cancelado.set()
+
+
+def _ler_lotes(files, workers, tamanho_bloco):
+    """
+    Lê os arquivos CSV em ordem, sequencialmente ou em paralelo.
+
+    Args:
+        files (list[Path]): Arquivos CSV, já ordenados.
+        workers (int): Número de arquivos lidos em paralelo.
+        tamanho_bloco (int): Tamanho aproximado de cada bloco, em bytes.
+
+    Yields:
+        pa.RecordBatch: Lotes com o esquema ESQUEMA_RAW, na ordem dos arquivos.
+    """
+    if workers > 1:
+        logging.info(f"Lendo {len(files)} arquivos com {workers} workers")
+        atual = None
+        for file, bloco in _ler_em_paralelo(files, workers, tamanho_bloco):
+            if file != atual:
+                logging.info(f"Lendo arquivo {file.name}")
+                registrar_metricas(bytes_lidos=file.stat().st_size)
+                atual = file
+            registrar_metricas(linhas_entrada=bloco.num_rows)
+            yield bloco
+    else:
+        for file in files:
+            logging.info(f"Lendo arquivo {file.name}")
+            registrar_metricas(bytes_lidos=file.stat().st_size)
+            for bloco in _ler_em_blocos(file, tamanho_bloco):
+                registrar_metricas(linhas_entrada=bloco.num_rows)
+                yield bloco
+
+
+def _gravar(lotes, name_file, particionar):
+    """
+    Grava os lotes do bruto em um arquivo único ou em um dataset particionado.
+
+    Args:
+        lotes (Iterable[pa.RecordBatch]): Lotes com o esquema ESQUEMA_RAW.
+        name_file (str): Caminho do '0.raw.parquet' ou do '0.raw.arrow'.
+        particionar (bool): Grava um dataset particionado por estado e ano.
+
+    Returns:
+        None
+    """
+    if particionar:
+        lotes = no_contexto_atual(lotes)
+        salvar_dataset((com_particoes(lote) for lote in lotes), name_file,
+                       esquema=ESQUEMA_RAW.append(pa.field('ano', pa.int16())))
+    else:
+        gravar_lotes(lotes, name_file, ESQUEMA_RAW)
 
 
 @registrar_execucao
-def agrupar(pasta):
+def agrupar(pasta, tamanho_bloco=64 << 20, workers=1, particionar=False,
+            em_memoria=False, checkpoint=True, formato='parquet'):
     """
     Agrupa arquivos CSV de um diretório em um único arquivo Parquet.
 
-    Lê todos os arquivos CSV (excluindo '.gitkeep') de um diretório específico,
-    combina-os em um único DataFrame e salva o resultado em um arquivo Parquet.
+    Lê todos os arquivos CSV (excluindo '.gitkeep') de um diretório específico
+    em blocos e grava cada bloco como um row group de um único ParquetWriter.
+    O uso de memória fica próximo ao de um bloco e o tempo de execução cresce
+    linearmente com o número de arquivos.
+
+    Com workers > 1 até `workers` arquivos são lidos em paralelo, também em
+    blocos (ver _ler_em_paralelo), e gravados na mesma ordem determinística
+    da leitura sequencial; a memória continua limitada por alguns blocos
+    por worker, e não pelo tamanho dos arquivos.
+
+    Com particionar=True os blocos são gravados como um dataset particionado
+    por estado e ano (ver esquema.salvar_dataset). Por ser gravado em
+    streaming, o bruto mantém a ordem dos CSVs dentro de cada partição.
+
+    Com em_memoria=True os blocos são reunidos em uma tabela Arrow, que é
+    devolvida para a etapa seguinte; o Parquet passa a ser um checkpoint
+    opcional (checkpoint=False não grava nada em disco).
+
+    Com formato='arrow' o bruto é gravado como '0.raw.arrow' (Arrow IPC sem
+    compressão), que a limpeza lê com memory map, sem descompressão; o
+    artefato no outro formato é removido.
 
     Args:
         pasta (str): Caminho da pasta base onde os arquivos estão localizados.
             Espera-se que os arquivos CSV estejam em uma subpasta 'raw' dentro desta pasta.
+        tamanho_bloco (int, optional): Tamanho de cada bloco lido do CSV, em bytes.
+            Default=64 MiB
+        workers (int, optional): Número de arquivos lidos em paralelo. Default=1
+        particionar (bool, optional): Grava um dataset particionado. Default=False
+        em_memoria (bool, optional): Devolve os dados lidos. Default=False
+        checkpoint (bool, optional): Grava o Parquet em disco. Default=True
+        formato (str, optional): 'parquet' ou 'arrow' (ver esquema.FORMATOS).
+            Default='parquet'
 
     Returns:
-        None: A função não retorna valores, mas salva um arquivo Parquet no diretório especificado.
+        pa.Table | None: Com em_memoria=True, os dados com o esquema ESQUEMA_RAW.
+        Caso contrário não retorna valores, mas salva um arquivo Parquet no
+        diretório especificado.
 
     Example:
         >>> agrupar('dados/entrada')
         # Isso irá ler todos os CSVs em 'dados/entrada/raw/',
-        # combinar em um DataFrame e salvar como 'dados/entrada/0.raw.parquet'
+        # gravar bloco a bloco em 'dados/entrada/0.raw.parquet'
     """
 
     logging.info(f"Processo {__name__} iniciado")
-    df = pd.DataFrame()
 
-    directory_path = Path(f'{pasta}/raw')
-    files = [f for f in directory_path.iterdir() if f.is_file()
-             and f.name != ".gitkeep"]
+    name_file = caminho_artefato(pasta, '0.raw', formato, particionar)
+
+    lotes = _ler_lotes(_listar_arquivos(pasta), workers, tamanho_bloco)
+
+    if em_memoria:
+        tabela = pa.Table.from_batches(lotes, ESQUEMA_RAW)
+        logging.info(f"{tabela.num_rows} linhas mantidas em memória")
+        registrar_metricas(linhas_saida=tabela.num_rows)
+
+        if checkpoint:
+            _gravar(tabela.to_batches(), name_file, particionar)
+            registrar_metricas(bytes_gravados=tamanho_em_disco(name_file))
+            logging.info(f"Checkpoint salvo com nome {name_file}")
 
-    for file in files:
-        logging.info(f"Lendo arquivo {file.name}")
-        aux_df = pd.read_csv(f"{directory_path}/{file.name}", sep=';')
-        df = pd.concat([df, aux_df])
+        logging.info(f"Processo {__name__} finalizado")
+        return tabela
 
-    name_file = f'{pasta}/0.raw.parquet'
-    df.to_parquet(name_file, index=False)
+    _gravar(lotes, name_file, particionar)
+    registrar_metricas(bytes_gravados=tamanho_em_disco(name_file))
 
-    logging.info(f"Parquet salvo com nome {name_file}")
+    logging.info(f"Bruto salvo com nome {name_file}")
 
     logging.info(f"Processo {__name__} finalizado")
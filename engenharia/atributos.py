@@ -1,32 +1,60 @@
+import numpy as np
 import pandas as pd
 import logging
-from utils import registrar_execucao
+import pyarrow as pa
+from esquema import (DEFASAGENS, ESQUEMA_ATRIBUTOS, ESQUEMA_LIMPO, JANELAS_MOVEIS,
+                     SERIES_TEMPORAIS, ler_parquet, localizar_artefato,
+                     para_dataframe, para_tabela, salvar_parquet)
+from motores import consultar, validar_motor
+from utils import medir, registrar_execucao, registrar_metricas, tamanho_em_disco
+
+
+# Colunas descartadas pela etapa; nem chegam a ser lidas do '1.limpo.parquet'
+COLUNAS_DESCARTADAS = ["Recuperadosnovos", "emAcompanhamentoNovos"]
+COLUNAS_LIDAS = [c for c in ESQUEMA_LIMPO.names if c not in COLUNAS_DESCARTADAS]
+
+# Nomes padronizados (snake_case) das colunas, aplicados por _limpar_nomes_de_colunas
+NOMES_DE_COLUNAS = {
+    'regiao': 'regiao',
+    'estado': 'estado',
+    'municipio': 'municipio',
+    'coduf': 'coduf',
+    'codmun': 'codmun',
+    'codRegiaoSaude': 'cod_regiao_saude',
+    'nomeRegiaoSaude': 'nome_regiao_saude',
+    'data': 'data',
+    'semanaEpi': 'semana_epi',
+    'populacaoTCU2019': 'populacao_tcu_2019',
+    'casosAcumulado': 'casos_acumulados',
+    'casosNovos': 'casos_novos',
+    'novos_casos_novos': 'novos_casos_novos',
+    'obitosAcumulado': 'obitos_acumulados',
+    'obitosNovos': 'obitos_novos',
+    'Recuperadosnovos': 'recuperados_novos',
+    'emAcompanhamentoNovos': 'em_acompanhamento_novos',
+    'interior/metropolitana': 'interior_metropolitana',
+    'novos_casos_acumulados': 'novos_casos_acumulados'
+}
 
 
 def _remover_colunas(df):
     """
-    Remove colunas específicas de uma cópia do DataFrame.
+    Remove as colunas COLUNAS_DESCARTADAS do DataFrame.
 
-    Cria uma cópia do DataFrame original e remove as colunas 'Recuperadosnovos' e
-    'emAcompanhamentoNovos' do novo DataFrame. A operação é realizada inplace
-    na cópia, não afetando o DataFrame original.
+    Usa df.drop(columns=COLUNAS_DESCARTADAS, errors='ignore'), que devolve
+    um novo DataFrame sem alterar o original. Colunas que já não foram
+    lidas (ver COLUNAS_LIDAS) são ignoradas.
 
     Args:
-        df (pd.DataFrame): DataFrame original que será copiado para remoção das colunas.
+        df (pd.DataFrame): DataFrame com os dados limpos.
 
     Returns:
-        None: A função não retorna explicitamente, pois a operação drop é feita inplace
-        na cópia. Observação: há um possível erro de implementação, pois o retorno seria None
-        devido ao parâmetro inplace=True.
+        pd.DataFrame: DataFrame sem 'Recuperadosnovos' e 'emAcompanhamentoNovos'.
 
     Example:
-        >>> novo_df = df.copy()
-        >>> _remover_colunas(df)
-        # Cria cópia e remove colunas da cópia (retornando None)
+        >>> df = _remover_colunas(df)
     """
-    novo_df = df.copy()
-    return novo_df.drop(columns=["Recuperadosnovos",
-                                 "emAcompanhamentoNovos"])
+    return df.drop(columns=COLUNAS_DESCARTADAS, errors='ignore')
 
 
 def _obter_estacao(data):
@@ -144,6 +172,43 @@ def _traduzir_mes(ingles):
     return portuguese[ingles]
 
 
+def _construir_calendario(datas):
+    """
+    Constrói a dimensão de calendário para um conjunto de datas distintas.
+
+    Calcula, uma única vez por data, as mesmas informações temporais que
+    _adicionar_feature_datas adiciona a cada linha. Como o conjunto de dados
+    tem poucas datas distintas e dezenas de milhões de linhas, as traduções
+    e a estação são calculadas apenas sobre esta tabela pequena.
+
+    Args:
+        datas (pd.DatetimeIndex): Datas distintas.
+
+    Returns:
+        pd.DataFrame: Uma linha por data, na mesma ordem de `datas`, com as
+        colunas ano, mes, mes_numerico, mes_traduzido, dia_semana,
+        dia_semana_traduzido, dia_semana_numerico e estacao.
+
+    Example:
+        >>> _construir_calendario(pd.DatetimeIndex(['2023-01-15']))
+        # Retorna uma linha com ano=2023, mes='January', estacao='Verão', ...
+    """
+    datas = pd.Series(datas)
+
+    calendario = pd.DataFrame({"data": datas})
+    calendario["ano"] = datas.dt.year
+    calendario["mes"] = datas.dt.month_name()
+    calendario["mes_numerico"] = datas.dt.month
+    calendario["mes_traduzido"] = calendario["mes"].apply(_traduzir_mes)
+    calendario["dia_semana"] = datas.dt.day_name()
+    calendario["dia_semana_traduzido"] = calendario["dia_semana"].apply(
+        _traduzir_dias_da_semana)
+    calendario["dia_semana_numerico"] = datas.dt.day_of_week
+    calendario["estacao"] = datas.apply(_obter_estacao)
+
+    return calendario.drop(columns=["data"])
+
+
 def _adicionar_feature_datas(df):
     """
     Adiciona colunas de informações temporais traduzidas a um DataFrame.
@@ -153,6 +218,9 @@ def _adicionar_feature_datas(df):
     - Dia da semana em inglês e português
     - Estação do ano correspondente
 
+    As informações são calculadas uma vez por data distinta
+    (_construir_calendario) e replicadas para as linhas via índice.
+
     Args:
         df (pd.DataFrame): DataFrame contendo uma coluna 'data' do tipo datetime.
 
@@ -172,19 +240,14 @@ def _adicionar_feature_datas(df):
         >>> df_completo = _adicionar_feature_datas(df)
         # Retorna DataFrame com colunas adicionais de informações temporais
     """
-    novo_df = df.copy()
-
-    novo_df["ano"] = novo_df.data.dt.year
-    novo_df["mes"] = novo_df.data.dt.month_name()
-    novo_df["mes_numerico"] = novo_df.data.dt.month
-    novo_df["mes_traduzido"] = novo_df["mes"].apply(_traduzir_mes)
-    novo_df["dia_semana"] = novo_df.data.dt.day_name()
-    novo_df["dia_semana_traduzido"] = novo_df["dia_semana"].apply(
-        _traduzir_dias_da_semana)
-    novo_df["dia_semana_numerico"] = novo_df.data.dt.day_of_week
-    novo_df["estacao"] = novo_df["data"].apply(_obter_estacao)
+    codigos, datas_unicas = pd.factorize(df["data"])
+    calendario = _construir_calendario(datas_unicas)
 
-    return novo_df
+    # assign devolve um novo DataFrame sem copiar as colunas existentes
+    return df.assign(**{
+        coluna: calendario[coluna].array.take(codigos, allow_fill=True)
+        for coluna in calendario.columns
+    })
 
 
 def _limpar_nomes_de_colunas(df):
@@ -205,31 +268,178 @@ def _limpar_nomes_de_colunas(df):
         >>> df_limpo = _limpar_nomes_de_colunas(df_original)
         # Retorna o DataFrame com colunas renomeadas (ex: 'casosNovos' -> 'casos_novos')
     """
-    colunas = {
-        'regiao': 'regiao',
-        'estado': 'estado',
-        'municipio': 'municipio',
-        'coduf': 'coduf',
-        'codmun': 'codmun',
-        'codRegiaoSaude': 'cod_regiao_saude',
-        'nomeRegiaoSaude': 'nome_regiao_saude',
-        'data': 'data',
-        'semanaEpi': 'semana_epi',
-        'populacaoTCU2019': 'populacao_tcu_2019',
-        'casosAcumulado': 'casos_acumulados',
-        'casosNovos': 'casos_novos',
-        'novos_casos_novos': 'novos_casos_novos',
-        'obitosAcumulado': 'obitos_acumulados',
-        'obitosNovos': 'obitos_novos',
-        'Recuperadosnovos': 'recuperados_novos',
-        'emAcompanhamentoNovos': 'em_acompanhamento_novos',
-        'interior/metropolitana': 'interior_metropolitana',
-        'novos_casos_acumulados': 'novos_casos_acumulados'
-    }
-    return df.rename(columns=colunas)
+    return df.rename(columns=NOMES_DE_COLUNAS)
+
+
+def _calendario_e_nomes_duckdb(df):
+    """
+    Remove colunas, adiciona as informações temporais e padroniza os nomes no DuckDB.
+
+    Equivale a _remover_colunas, _adicionar_feature_datas e
+    _limpar_nomes_de_colunas em uma única consulta, executada em paralelo.
+    As traduções vêm de _traduzir_mes e _traduzir_dias_da_semana, e a
+    estação segue as mesmas datas de _obter_estacao (dia 21 de março,
+    junho, setembro e dezembro).
+
+    Args:
+        df (pd.DataFrame): DataFrame limpo, contendo a coluna 'data'.
+
+    Returns:
+        pd.DataFrame: Novo DataFrame, na ordem de `df`, com as colunas e os
+        tipos de ESQUEMA_ATRIBUTOS que _rodar_engenharia_de_atributos
+        produz antes das séries temporais.
+
+    Example:
+        >>> df_calendario = _calendario_e_nomes_duckdb(df_limpo)
+    """
+    meses = ' '.join(
+        f"WHEN {n} THEN '{_traduzir_mes(pd.Timestamp(2020, n, 1).month_name())}'"
+        for n in range(1, 13))
+    # 6 de janeiro de 2020 foi uma segunda-feira (isodow = 1)
+    dias = ' '.join(
+        f"WHEN {n} THEN '{_traduzir_dias_da_semana(pd.Timestamp(2020, 1, 5 + n).day_name())}'"
+        for n in range(1, 8))
+    colunas = ', '.join(f'"{c}" AS {NOMES_DE_COLUNAS.get(c, c)}'
+                        for c in df.columns if c not in COLUNAS_DESCARTADAS)
+
+    sql = f"""
+        SELECT {colunas},
+               year(data) AS ano,
+               monthname(data) AS mes,
+               month(data) AS mes_numerico,
+               CASE month(data) {meses} END AS mes_traduzido,
+               dayname(data) AS dia_semana,
+               CASE isodow(data) {dias} END AS dia_semana_traduzido,
+               isodow(data) - 1 AS dia_semana_numerico,
+               CASE WHEN month(data) * 100 + day(data) >= 1221
+                      OR month(data) * 100 + day(data) < 321 THEN 'Verão'
+                    WHEN month(data) * 100 + day(data) < 621 THEN 'Outono'
+                    WHEN month(data) * 100 + day(data) < 921 THEN 'Inverno'
+                    ELSE 'Primavera' END AS estacao
+        FROM entrada
+        ORDER BY linha
+    """
+    resultado = consultar(sql, entrada=df.assign(linha=np.arange(len(df))))
+
+    df_resultado = para_dataframe(resultado, ESQUEMA_ATRIBUTOS)
+    df_resultado.index = df.index
+    return df_resultado
+
+
+def _soma_no_intervalo(chave, acumulado, inicio, fim):
+    """
+    Soma, para cada linha, os valores do mesmo município entre dois dias.
+
+    Considera as linhas com data entre (data - inicio) e (data - fim),
+    inclusive, usando a soma acumulada e uma busca binária na chave
+    ordenada (município, dia). Dias ausentes na série simplesmente não
+    contribuem para a soma.
+
+    Args:
+        chave (np.ndarray): Chave ordenada município * 2**32 + dia.
+        acumulado (np.ndarray): Soma acumulada dos valores, precedida de 0.
+        inicio (int): Dias antes da data em que o intervalo começa.
+        fim (int): Dias antes da data em que o intervalo termina.
+
+    Returns:
+        np.ndarray: Soma de cada linha.
+    """
+    primeira = np.searchsorted(chave, chave - inicio, side='left')
+    ultima = np.searchsorted(chave, chave - fim, side='right')
+    return acumulado[ultima] - acumulado[primeira]
 
 
-def _rodar_engenharia_de_atributos(df):
+def _adicionar_series_temporais(df, series=SERIES_TEMPORAIS, defasagens=DEFASAGENS,
+                                janelas=JANELAS_MOVEIS):
+    """
+    Adiciona defasagens, janelas móveis, incidência e crescimento por município.
+
+    Para cada série, adiciona as colunas:
+    - <serie>_lag_<n>: valor de n dias antes
+    - <serie>_soma_movel_<j> e <serie>_media_movel_<j>: soma e média dos j
+      dias anteriores
+    - <serie>_incidencia_7: soma dos 7 dias anteriores por 100 mil
+      habitantes (populacao_tcu_2019)
+    - <serie>_crescimento_semanal: variação relativa entre a soma dos 7
+      dias anteriores e a dos 7 dias antes desses
+
+    As janelas terminam no dia anterior, para que nenhum atributo use o
+    valor do próprio dia (que é o alvo dos modelos). As defasagens e
+    janelas são por data, não por posição, e ficam nulas quando o período
+    não está inteiro na série do município. Tudo é calculado em uma passada
+    sobre o DataFrame ordenado por município e data, com somas acumuladas e
+    buscas binárias, sem groupby-apply.
+
+    Args:
+        df (pd.DataFrame): DataFrame com 'codmun', 'data',
+            'populacao_tcu_2019' e as colunas de `series`.
+        series (list[str], optional): Colunas das séries. Default=SERIES_TEMPORAIS
+        defasagens (list[int], optional): Defasagens, em dias. Default=DEFASAGENS
+        janelas (list[int], optional): Tamanhos das janelas móveis, em dias.
+            Default=JANELAS_MOVEIS
+
+    Returns:
+        pd.DataFrame: Novo DataFrame, na ordem de `df`, com as colunas adicionadas.
+
+    Example:
+        >>> df = _adicionar_series_temporais(df, series=['obitos_novos'], defasagens=[1])
+    """
+    codmun = df['codmun'].to_numpy('int64')
+    dia = df['data'].to_numpy('datetime64[D]').astype('int64')
+    ordem = np.lexsort((dia, codmun))
+
+    chave = (codmun[ordem] << 32) + dia[ordem]
+    dia_ordenado = dia[ordem]
+    inicio_do_grupo = np.r_[True, codmun[ordem][1:] != codmun[ordem][:-1]]
+    primeiro_dia = np.maximum.accumulate(
+        np.where(inicio_do_grupo, np.arange(len(ordem)), 0))
+    primeiro_dia = dia_ordenado[primeiro_dia]
+
+    populacao = df['populacao_tcu_2019'].to_numpy('float64', na_value=np.nan)[ordem]
+
+    def completo(dias):
+        return dia_ordenado - dias >= primeiro_dia
+
+    def janela(acumulado, inicio, fim=1):
+        return np.where(completo(inicio),
+                        _soma_no_intervalo(chave, acumulado, inicio, fim), np.nan)
+
+    colunas = {}
+    for serie in series:
+        valores = df[serie].to_numpy('float64', na_value=np.nan)[ordem]
+        acumulado = np.r_[0, np.nan_to_num(valores).cumsum()]
+        contagem = np.r_[0, (~np.isnan(valores)).cumsum()]
+
+        for dias in defasagens:
+            posicao = np.searchsorted(chave, chave - dias)
+            posicao = np.minimum(posicao, len(chave) - 1)
+            encontrado = chave[posicao] == chave - dias
+            colunas[f'{serie}_lag_{dias}'] = np.where(
+                encontrado, valores[posicao], np.nan)
+
+        for dias in janelas:
+            soma = janela(acumulado, dias)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                media = soma / janela(contagem, dias)
+            colunas[f'{serie}_soma_movel_{dias}'] = soma
+            colunas[f'{serie}_media_movel_{dias}'] = media
+
+        semana = janela(acumulado, 7)
+        semana_anterior = janela(acumulado, 14, 8)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            colunas[f'{serie}_incidencia_7'] = semana / populacao * 1e5
+            crescimento = semana / semana_anterior - 1
+        colunas[f'{serie}_crescimento_semanal'] = np.where(
+            np.isfinite(crescimento), crescimento, np.nan)
+
+    # Devolve os valores da ordem (município, data) para a ordem de df
+    posicoes = np.empty_like(ordem)
+    posicoes[ordem] = np.arange(len(ordem))
+    return df.assign(**{coluna: valores[posicoes]
+                        for coluna, valores in colunas.items()})
+
+
+def _rodar_engenharia_de_atributos(df, motor='pandas'):
     """
     Executa o pipeline completo de engenharia de atributos em um DataFrame.
 
@@ -237,9 +447,15 @@ def _rodar_engenharia_de_atributos(df):
     1. Remove colunas desnecessárias
     2. Adiciona features temporais (datas, meses, estações)
     3. Padroniza os nomes das colunas
+    4. Adiciona defasagens, janelas móveis, incidência e crescimento semanal
+
+    Com motor='duckdb' os passos 1 a 3 são feitos por
+    _calendario_e_nomes_duckdb.
 
     Args:
         df (pd.DataFrame): DataFrame original a ser processado.
+        motor (str, optional): 'pandas' ou 'duckdb' (ver motores.MOTORES).
+            Default='pandas'
 
     Returns:
         pd.DataFrame: DataFrame processado com colunas removidas, features adicionadas
@@ -249,15 +465,52 @@ def _rodar_engenharia_de_atributos(df):
         >>> df_processado = _rodar_engenharia_de_atributos(df_original)
         # Retorna o DataFrame após todas as transformações
     """
-    df = _remover_colunas(df)
-    df = _adicionar_feature_datas(df)
-    df = _limpar_nomes_de_colunas(df)
+    if motor == 'duckdb':
+        with medir('duckdb'):
+            df = _calendario_e_nomes_duckdb(df)
+    else:
+        df = _remover_colunas(df)
+        with medir('calendario'):
+            df = _adicionar_feature_datas(df)
+        df = _limpar_nomes_de_colunas(df)
+    with medir('series_temporais'):
+        df = _adicionar_series_temporais(df)
 
     return df
 
 
+def verificar_paridade(df, motor='duckdb'):
+    """
+    Compara a engenharia de atributos de um motor com a do pandas.
+
+    O pandas é a implementação de referência: as duas saídas, convertidas
+    para ESQUEMA_ATRIBUTOS como ao serem gravadas, devem ter as mesmas
+    colunas, categorias e valores, na mesma ordem de linhas.
+
+    Args:
+        df (pd.DataFrame): Amostra dos dados limpos (ex.: alguns estados).
+        motor (str, optional): Motor comparado (ver motores.MOTORES).
+            Default='duckdb'
+
+    Returns:
+        None
+
+    Raises:
+        AssertionError: Se os dois motores divergirem.
+
+    Example:
+        >>> verificar_paridade(ler_parquet('dados/1.limpo.parquet', ESQUEMA_LIMPO))
+    """
+    esperado = _rodar_engenharia_de_atributos(df)
+    obtido = _rodar_engenharia_de_atributos(df, motor)
+    pd.testing.assert_frame_equal(
+        para_dataframe(para_tabela(esperado, ESQUEMA_ATRIBUTOS), ESQUEMA_ATRIBUTOS),
+        para_dataframe(para_tabela(obtido, ESQUEMA_ATRIBUTOS), ESQUEMA_ATRIBUTOS))
+
+
 @registrar_execucao
-def computar_atributos(pasta):
+def computar_atributos(pasta, particionar=False, dados=None, em_memoria=False,
+                       checkpoint=True, motor='pandas'):
     """
     Processa e computa atributos adicionais em um DataFrame a partir de um arquivo Parquet.
 
@@ -265,13 +518,34 @@ def computar_atributos(pasta):
     de engenharia de atributos através da função _rodar_engenharia_de_atributos
     e salva o resultado em um novo arquivo Parquet.
 
+    No modo em memória os dados limpos podem vir de limpar em `dados`, em vez
+    de relidos do '1.limpo.parquet', e com em_memoria=True o resultado é
+    devolvido para a carga no banco. O '2.atributos.parquet' passa a ser um
+    checkpoint opcional (checkpoint=False não grava nada em disco).
+
+    A limpeza é lida no formato em que foi gravada ('1.limpo.parquet' ou
+    '1.limpo.arrow', este com memory map); os atributos são sempre Parquet.
+
+    Com motor='duckdb' a remoção de colunas, o calendário e a padronização
+    dos nomes são executados no DuckDB, com todos os núcleos (ver
+    verificar_paridade).
+
     Args:
         pasta (str): Caminho da pasta base contendo o arquivo '1.limpo.parquet'
             e onde será salvo o resultado ('2.atributos.parquet').
+        particionar (bool, optional): Grava um dataset particionado por estado
+            e ano (ver esquema.salvar_dataset). Default=False
+        dados (pa.Table | pd.DataFrame, optional): Dados limpos já em
+            memória, como devolvidos por limpar. Default=None
+        em_memoria (bool, optional): Devolve os atributos calculados. Default=False
+        checkpoint (bool, optional): Grava o Parquet em disco. Default=True
+        motor (str, optional): 'pandas' ou 'duckdb' (ver motores.MOTORES).
+            Default='pandas'
 
     Returns:
-        None: A função não retorna valores, mas gera um novo arquivo Parquet
-        com os atributos processados.
+        pd.DataFrame | None: Com em_memoria=True, os dados com o esquema
+        ESQUEMA_ATRIBUTOS. Caso contrário não retorna valores, mas gera um
+        novo arquivo Parquet com os atributos processados.
 
     Example:
         >>> computar_atributos('dados/processados')
@@ -279,30 +553,37 @@ def computar_atributos(pasta):
         # e salva em 'dados/processados/2.atributos.parquet'
     """
 
-    nome_arquivo = f'{pasta}/1.limpo.parquet'
+    validar_motor(motor)
+    nome_arquivo = localizar_artefato(pasta, '1.limpo')
+
+    if dados is None:
+        logging.info(f"Lendo arquivo {nome_arquivo}")
 
-    logging.info(f"Lendo arquivo {nome_arquivo}")
+        registrar_metricas(bytes_lidos=tamanho_em_disco(nome_arquivo))
+        df = ler_parquet(nome_arquivo, ESQUEMA_LIMPO, colunas=COLUNAS_LIDAS)
 
-    df = pd.read_parquet(
-        nome_arquivo).astype({'data': 'datetime64[ns]'})
+        logging.info(f"Arquivo lido")
+    elif isinstance(dados, pa.Table):
+        df = para_dataframe(dados.select(COLUNAS_LIDAS), ESQUEMA_LIMPO)
+    else:
+        df = dados
 
-    logging.info(f"Arquivo lido")
+    registrar_metricas(linhas_entrada=len(df))
 
     logging.info("Processando engenharia de atributos")
 
-    df = _rodar_engenharia_de_atributos(df)
+    df = _rodar_engenharia_de_atributos(df, motor)
 
     logging.info("Processado")
+    registrar_metricas(linhas_saida=len(df))
+
+    if checkpoint:
+        logging.info("Salvando arquivo")
 
-    logging.info("Salvando arquivo")
+        nome_arquivo = f'{pasta}/2.atributos.parquet'
+        salvar_parquet(df, nome_arquivo, ESQUEMA_ATRIBUTOS, particionar=particionar)
+        registrar_metricas(bytes_gravados=tamanho_em_disco(nome_arquivo))
 
-    nome_arquivo = f'{pasta}/2.atributos.parquet'
-    df.to_parquet(
-        nome_arquivo,
-        engine='pyarrow',
-        coerce_timestamps='ms',
-        allow_truncated_timestamps=True,
-        index=False
-    )
+        logging.info(f"Parquet salvo com nome {nome_arquivo}")
 
-    logging.info(f"Parquet salvo com nome {nome_arquivo}")
+    return df if em_memoria else None
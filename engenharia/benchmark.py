@@ -0,0 +1,155 @@
+from datetime import datetime
+from pathlib import Path
+import argparse
+import json
+import logging
+import shutil
+import tempfile
+import time
+import pandas as pd
+from agrupar import agrupar
+from limpar import limpar
+from atributos import computar_atributos
+from salvar_sql import salvar_sql
+from sintetico import gerar_dados
+from utils import EXECUCAO
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+
+# (municípios, dias) de cada tamanho medido; o maior se aproxima do painel real
+TAMANHOS = [(100, 180), (1000, 365), (5570, 730)]
+
+# Tabela separada para que o benchmark nunca sobrescreva a tabela do pipeline
+TABELA_BENCHMARK = 'benchmark_new_new_covid'
+
+
+def _cronometrar(etapa, repeticoes, *args, **kwargs):
+    """
+    Executa uma etapa algumas vezes e devolve o menor tempo de parede.
+
+    O menor tempo é o menos afetado por ruído da máquina (cache de disco
+    frio, outros processos), o que o torna comparável entre execuções.
+
+    Args:
+        etapa (callable): Etapa do pipeline.
+        repeticoes (int): Número de execuções.
+        *args: Argumentos posicionais da etapa.
+        **kwargs: Argumentos nomeados da etapa.
+
+    Returns:
+        float: Menor duração observada, em segundos.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        etapa(*args, **kwargs)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def executar_benchmark(pasta, tamanhos=TAMANHOS, arquivos=4, taxa_outliers=0.01,
+                       workers=1, dsn=None, repeticoes=1):
+    """
+    Mede o tempo de cada etapa do pipeline em vários tamanhos de entrada.
+
+    Para cada tamanho, gera dados sintéticos (ver sintetico.gerar_dados) em
+    '<pasta>/<municipios>x<dias>' e cronometra agrupar, limpar,
+    computar_atributos e, se houver `dsn`, a carga de salvar_sql em uma
+    tabela própria do benchmark. Os resultados são acrescentados a
+    '<pasta>/benchmark.jsonl', com o identificador da execução, para
+    comparar versões do código e detectar regressões.
+
+    Args:
+        pasta (str): Pasta de trabalho do benchmark.
+        tamanhos (list[tuple[int, int]], optional): Pares (municípios, dias).
+            Default=TAMANHOS
+        arquivos (int, optional): Número de CSVs gerados por tamanho. Default=4
+        taxa_outliers (float, optional): Fração de dias atípicos. Default=0.01
+        workers (int, optional): Workers repassados a agrupar e limpar. Default=1
+        dsn (str, optional): URL de um PostgreSQL local. Sem ela, salvar_sql
+            não é medido. Default=None
+        repeticoes (int, optional): Execuções de cada etapa; vale a menor.
+            Default=1
+
+    Returns:
+        pd.DataFrame: Uma linha por tamanho e etapa, com duração e vazão.
+
+    Example:
+        >>> executar_benchmark('/tmp/benchmark', tamanhos=[(100, 180), (1000, 365)])
+    """
+    resultados = []
+
+    for municipios, dias in tamanhos:
+        pasta_tamanho = Path(pasta) / f'{municipios}x{dias}'
+        if pasta_tamanho.exists():
+            shutil.rmtree(pasta_tamanho)
+
+        logging.info(f"Gerando {municipios} municípios x {dias} dias")
+        gerar_dados(pasta_tamanho, municipios, dias, arquivos, taxa_outliers)
+
+        etapas = [
+            ('agrupar', agrupar, {'workers': workers}),
+            ('limpar', limpar, {'workers': workers}),
+            ('computar_atributos', computar_atributos, {}),
+        ]
+        if dsn:
+            etapas.append(('salvar_sql', salvar_sql,
+                           {'dsn': dsn, 'tabela': TABELA_BENCHMARK}))
+
+        linhas = municipios * dias
+        for nome, etapa, kwargs in etapas:
+            segundos = _cronometrar(etapa, repeticoes, pasta_tamanho, **kwargs)
+            resultados.append({
+                'execucao': EXECUCAO,
+                'data_hora': datetime.now().isoformat(timespec='seconds'),
+                'municipios': municipios,
+                'dias': dias,
+                'linhas': linhas,
+                'workers': workers,
+                'etapa': nome,
+                'segundos': round(segundos, 3),
+                'linhas_por_s': round(linhas / max(segundos, 1e-9)),
+            })
+            logging.info(f"{nome} com {linhas} linhas: {segundos:.2f}s")
+
+    with open(Path(pasta) / 'benchmark.jsonl', 'a', encoding='utf-8') as arquivo:
+        for resultado in resultados:
+            arquivo.write(json.dumps(resultado) + '\n')
+
+    return pd.DataFrame(resultados)
+
+
+def _tamanho(texto):
+    municipios, dias = texto.lower().split('x')
+    return int(municipios), int(dias)
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(
+        description='Benchmark das etapas do pipeline com dados sintéticos')
+    parser.add_argument('--pasta', default=str(Path(tempfile.gettempdir()) / 'covid_benchmark'),
+                        help='Pasta de trabalho do benchmark')
+    parser.add_argument('--tamanhos', nargs='+', type=_tamanho,
+                        default=TAMANHOS,
+                        help='Tamanhos no formato MUNICIPIOSxDIAS (ex.: 1000x365)')
+    parser.add_argument('--arquivos', type=int, default=4)
+    parser.add_argument('--taxa-outliers', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeticoes', type=int, default=1)
+    parser.add_argument('--dsn', default=None,
+                        help='URL de um PostgreSQL local para medir salvar_sql')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _argumentos()
+    resumo = executar_benchmark(args.pasta, args.tamanhos, args.arquivos,
+                                args.taxa_outliers, args.workers, args.dsn,
+                                args.repeticoes)
+    print(resumo.pivot(index='linhas', columns='etapa', values='segundos')
+          .to_string())
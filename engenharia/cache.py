@@ -0,0 +1,221 @@
+from pathlib import Path
+import ast
+import hashlib
+import json
+import logging
+
+
+# Pasta dos módulos do pipeline; os módulos importados de dentro dela, direta
+# ou indiretamente, fazem parte do código de cada etapa
+PASTA_CODIGO = Path(__file__).resolve().parent
+
+
+def _hash_arquivo(caminho):
+    """
+    Calcula o hash BLAKE2b do conteúdo de um arquivo, lido em blocos de 1 MiB.
+
+    Args:
+        caminho (Path): Arquivo a ser lido.
+
+    Returns:
+        str: Hash em hexadecimal.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _arquivos(caminho):
+    """
+    Lista os arquivos de um caminho (o próprio arquivo ou o conteúdo do diretório).
+
+    Args:
+        caminho (Path): Arquivo ou diretório.
+
+    Returns:
+        list[Path]: Arquivos em ordem alfabética, excluindo '.gitkeep'.
+    """
+    if caminho.is_dir():
+        return sorted(a for a in caminho.rglob('*')
+                      if a.is_file() and a.name != '.gitkeep')
+    return [caminho] if caminho.exists() else []
+
+
+def _hash_entradas(entradas, anterior):
+    """
+    Calcula o hash do conteúdo de cada arquivo de entrada.
+
+    Arquivos com o mesmo tamanho e mtime registrados no manifesto anterior
+    reaproveitam o hash já calculado, então uma execução sem mudanças não
+    relê os arquivos de vários GB.
+
+    Args:
+        entradas (list[str]): Arquivos ou diretórios lidos pela etapa.
+        anterior (dict): Seção 'entradas' do manifesto anterior.
+
+    Returns:
+        dict: Para cada arquivo, tamanho, mtime e hash do conteúdo.
+    """
+    resultado = {}
+
+    for entrada in entradas:
+        for arquivo in _arquivos(Path(entrada)):
+            estado = arquivo.stat()
+            registro = {'tamanho': estado.st_size, 'mtime': estado.st_mtime_ns}
+            antigo = anterior.get(str(arquivo), {})
+
+            if all(antigo.get(k) == v for k, v in registro.items()):
+                registro['hash'] = antigo['hash']
+            else:
+                registro['hash'] = _hash_arquivo(arquivo)
+
+            resultado[str(arquivo)] = registro
+
+    return resultado
+
+
+def _modulos_importados(nome):
+    """
+    Lista os módulos do pipeline usados por um módulo, direta ou indiretamente.
+
+    Os imports são lidos do código-fonte (inclusive os feitos dentro de
+    funções, como os opcionais) e seguidos apenas quando apontam para um
+    arquivo em PASTA_CODIGO; bibliotecas externas ficam de fora.
+
+    Args:
+        nome (str): Nome do módulo da etapa (ex.: 'limpar').
+
+    Returns:
+        list[Path]: Arquivos do módulo e dos módulos importados, em ordem
+        alfabética.
+    """
+    arquivos = set()
+    pendentes = [nome]
+
+    while pendentes:
+        arquivo = PASTA_CODIGO / f'{pendentes.pop()}.py'
+        if arquivo in arquivos or not arquivo.exists():
+            continue
+        arquivos.add(arquivo)
+
+        for no in ast.walk(ast.parse(arquivo.read_bytes())):
+            if isinstance(no, ast.Import):
+                pendentes.extend(alias.name for alias in no.names)
+            elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+                pendentes.append(no.module)
+
+    return sorted(arquivos)
+
+
+def _hash_codigo(funcao):
+    """
+    Calcula o hash do código-fonte do módulo da etapa e dos módulos que ele importa.
+
+    Args:
+        funcao (callable): Função da etapa.
+
+    Returns:
+        str: Hash em hexadecimal.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for arquivo in _modulos_importados(funcao.__module__):
+        h.update(arquivo.name.encode())
+        h.update(arquivo.read_bytes())
+    return h.hexdigest()
+
+
+def _hash_parametros(parametros):
+    """
+    Calcula o hash dos parâmetros da etapa.
+
+    Apenas o hash é guardado no manifesto, para não gravar em disco valores
+    sensíveis como a URL do banco.
+
+    Args:
+        parametros (dict): Parâmetros serializáveis em JSON.
+
+    Returns:
+        str: Hash em hexadecimal.
+    """
+    texto = json.dumps(parametros, sort_keys=True, default=str)
+    return hashlib.blake2b(texto.encode(), digest_size=16).hexdigest()
+
+
+def _assinatura(manifesto):
+    """
+    Extrai do manifesto apenas o que identifica a execução.
+
+    Args:
+        manifesto (dict): Manifesto completo.
+
+    Returns:
+        dict: Hashes de entradas, parâmetros e código.
+    """
+    return {
+        'entradas': {k: v['hash'] for k, v in manifesto['entradas'].items()},
+        'parametros': manifesto['parametros'],
+        'codigo': manifesto['codigo'],
+    }
+
+
+def executar_com_cache(funcao, pasta, entradas, saidas, parametros=None,
+                       opcoes=None, forcar=False):
+    """
+    Executa uma etapa do pipeline apenas se algo relevante mudou.
+
+    Cada etapa mantém um manifesto em '<pasta>/.cache/<etapa>.json' com o
+    hash do conteúdo das entradas, dos parâmetros e do código da etapa.
+    Se o manifesto atual for igual ao da última execução bem-sucedida e
+    todas as saídas existirem, a etapa é pulada e os artefatos anteriores
+    são reaproveitados.
+
+    Args:
+        funcao (callable): Etapa, chamada como funcao(pasta, **parametros, **opcoes).
+        pasta (str): Pasta base do pipeline.
+        entradas (list[str]): Arquivos ou diretórios lidos pela etapa.
+        saidas (list[str]): Arquivos ou diretórios gerados pela etapa.
+        parametros (dict, optional): Parâmetros que alteram o resultado. Default=None
+        opcoes (dict, optional): Parâmetros que não alteram o resultado
+            (ex.: número de workers) e não entram no hash. Default=None
+        forcar (bool, optional): Executa a etapa mesmo sem mudanças. Default=False
+
+    Returns:
+        bool: True se a etapa foi executada, False se foi reaproveitada.
+
+    Example:
+        >>> executar_com_cache(limpar, 'dados', ['dados/0.raw.parquet'],
+        ...                    ['dados/1.limpo.parquet'], {'window_size': 3})
+    """
+    parametros = parametros or {}
+    opcoes = opcoes or {}
+
+    etapa = funcao.__name__
+    caminho_manifesto = Path(pasta) / '.cache' / f'{etapa}.json'
+
+    anterior = {}
+    if caminho_manifesto.exists():
+        anterior = json.loads(caminho_manifesto.read_text())
+
+    atual = {
+        'entradas': _hash_entradas(entradas, anterior.get('entradas', {})),
+        'parametros': _hash_parametros(parametros),
+        'codigo': _hash_codigo(funcao),
+    }
+
+    saidas_existem = all(Path(s).exists() for s in saidas)
+    if (not forcar and anterior and saidas_existem
+            and _assinatura(anterior) == _assinatura(atual)):
+        logging.info(f"Etapa {etapa} sem mudanças, reaproveitando {saidas}")
+        return False
+
+    # Remove o manifesto antes de executar: se a etapa falhar no meio,
+    # a próxima execução não pode reaproveitar uma saída incompleta
+    caminho_manifesto.unlink(missing_ok=True)
+
+    funcao(pasta, **parametros, **opcoes)
+
+    caminho_manifesto.parent.mkdir(parents=True, exist_ok=True)
+    caminho_manifesto.write_text(json.dumps(atual, indent=2))
+    return True
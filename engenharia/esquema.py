@@ -0,0 +1,574 @@
+from pathlib import Path
+import json
+import shutil
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+
+# Strings de baixa cardinalidade são gravadas como dicionário (categorical no pandas)
+TEXTO = pa.dictionary(pa.int32(), pa.string())
+
+ESQUEMA_RAW = pa.schema([
+    ('regiao', TEXTO),
+    ('estado', TEXTO),
+    ('municipio', TEXTO),
+    ('coduf', pa.int8()),
+    ('codmun', pa.int32()),
+    ('codRegiaoSaude', pa.int32()),
+    ('nomeRegiaoSaude', TEXTO),
+    ('data', pa.date32()),
+    ('semanaEpi', pa.int8()),
+    ('populacaoTCU2019', pa.int32()),
+    ('casosAcumulado', pa.int32()),
+    ('casosNovos', pa.int32()),
+    ('obitosAcumulado', pa.int32()),
+    ('obitosNovos', pa.int32()),
+    ('Recuperadosnovos', pa.int32()),
+    ('emAcompanhamentoNovos', pa.int32()),
+    ('interior/metropolitana', pa.int8()),
+])
+
+ESQUEMA_LIMPO = pa.schema(list(ESQUEMA_RAW) + [
+    ('novos_casos_novos', pa.int32()),
+    ('novos_casos_acumulados', pa.int32()),
+])
+
+# Partições hive usadas quando as etapas gravam datasets (estado=MG/ano=2021)
+PARTICOES = ['estado', 'ano']
+ORDEM_DATASET = [('codmun', 'ascending'), ('data', 'ascending')]
+LINHAS_POR_ROW_GROUP = 32768
+# Na leitura as partições chegam como string (e não dicionário), pois o
+# pyarrow não unifica dicionários com a partição nula de estado
+PARTICIONAMENTO = ds.HivePartitioning.discover()
+
+# Formatos dos artefatos intermediários (0.raw e 1.limpo). 'arrow' é Arrow
+# IPC (Feather v2) sem compressão, lido com memory map; o 2.atributos é
+# sempre Parquet
+FORMATOS = ['parquet', 'arrow']
+
+# Atributos de série temporal calculados por computar_atributos, por
+# município, sobre as séries abaixo (ver atributos._adicionar_series_temporais)
+SERIES_TEMPORAIS = ['novos_casos_novos', 'obitos_novos']
+DEFASAGENS = [1, 7, 14]
+JANELAS_MOVEIS = [7, 14]
+COLUNAS_TEMPORAIS = [
+    coluna
+    for serie in SERIES_TEMPORAIS
+    for coluna in (
+        [f'{serie}_lag_{dias}' for dias in DEFASAGENS]
+        + [f'{serie}_{medida}_movel_{dias}' for dias in JANELAS_MOVEIS
+           for medida in ('soma', 'media')]
+        + [f'{serie}_incidencia_7', f'{serie}_crescimento_semanal']
+    )
+]
+
+ESQUEMA_ATRIBUTOS = pa.schema([
+    ('regiao', TEXTO),
+    ('estado', TEXTO),
+    ('municipio', TEXTO),
+    ('coduf', pa.int8()),
+    ('codmun', pa.int32()),
+    ('cod_regiao_saude', pa.int32()),
+    ('nome_regiao_saude', TEXTO),
+    ('data', pa.date32()),
+    ('semana_epi', pa.int8()),
+    ('populacao_tcu_2019', pa.int32()),
+    ('casos_acumulados', pa.int32()),
+    ('casos_novos', pa.int32()),
+    ('obitos_acumulados', pa.int32()),
+    ('obitos_novos', pa.int32()),
+    ('interior_metropolitana', pa.int8()),
+    ('novos_casos_novos', pa.int32()),
+    ('novos_casos_acumulados', pa.int32()),
+    ('ano', pa.int16()),
+    ('mes', TEXTO),
+    ('mes_numerico', pa.int8()),
+    ('mes_traduzido', TEXTO),
+    ('dia_semana', TEXTO),
+    ('dia_semana_traduzido', TEXTO),
+    ('dia_semana_numerico', pa.int8()),
+    ('estacao', TEXTO),
+] + [(coluna, pa.float64()) for coluna in COLUNAS_TEMPORAIS])
+
+# Layout estrela dos atributos (ver estrela.py): as colunas descritivas do
+# município e do calendário saem da tabela fato, chaveada por (codmun, data),
+# e vão para uma dimensão chaveada por 'codmun' e outra por 'data'
+COLUNAS_MUNICIPIO = ['codmun', 'regiao', 'estado', 'municipio', 'coduf',
+                     'cod_regiao_saude', 'nome_regiao_saude',
+                     'populacao_tcu_2019', 'interior_metropolitana']
+COLUNAS_CALENDARIO = ['data', 'ano', 'mes', 'mes_numerico', 'mes_traduzido',
+                      'dia_semana', 'dia_semana_traduzido',
+                      'dia_semana_numerico', 'estacao']
+ESQUEMA_FATO = pa.schema([
+    campo for campo in ESQUEMA_ATRIBUTOS
+    if campo.name in ('codmun', 'data')
+    or campo.name not in COLUNAS_MUNICIPIO + COLUNAS_CALENDARIO
+])
+ESQUEMA_DIM_MUNICIPIO = pa.schema([ESQUEMA_ATRIBUTOS.field(c) for c in COLUNAS_MUNICIPIO])
+ESQUEMA_DIM_CALENDARIO = pa.schema([ESQUEMA_ATRIBUTOS.field(c) for c in COLUNAS_CALENDARIO])
+
+# Colunas das tabelas agregadas (ver agregar.py); cada tabela usa as chaves
+# do seu nível geográfico e período, mais as medidas
+ESQUEMA_AGREGADOS = pa.schema([
+    ('regiao', TEXTO),
+    ('estado', TEXTO),
+    ('cod_regiao_saude', pa.int32()),
+    ('nome_regiao_saude', TEXTO),
+    ('data', pa.date32()),
+    ('ano_epi', pa.int16()),
+    ('semana_epi', pa.int8()),
+    ('inicio_semana', pa.date32()),
+    ('populacao', pa.int64()),
+    ('novos_casos_novos', pa.int64()),
+    ('obitos_novos', pa.int64()),
+    ('casos_por_100k', pa.float64()),
+    ('obitos_por_100k', pa.float64()),
+])
+
+
+def _ordenar_categorias(df):
+    """
+    Ordena alfabeticamente as categorias das colunas categóricas.
+
+    O pyarrow cria as categorias na ordem em que aparecem no dicionário;
+    ordená-las mantém sort_values e groupby em ordem alfabética, como
+    acontecia com as colunas do tipo object.
+
+    Args:
+        df (pd.DataFrame): DataFrame recém convertido de uma tabela Arrow.
+
+    Returns:
+        pd.DataFrame: O mesmo DataFrame, com as categorias ordenadas.
+    """
+    for coluna in df.select_dtypes('category').columns:
+        df[coluna] = df[coluna].cat.reorder_categories(
+            sorted(df[coluna].cat.categories))
+    return df
+
+
+def caminho_artefato(pasta, nome, formato='parquet', particionar=False):
+    """
+    Monta o caminho de um artefato intermediário no formato escolhido.
+
+    Args:
+        pasta (str): Pasta base do pipeline.
+        nome (str): Nome do artefato, sem extensão (ex.: '0.raw').
+        formato (str, optional): Um de FORMATOS. Default='parquet'
+        particionar (bool, optional): O artefato será um dataset particionado.
+            Default=False
+
+    Returns:
+        str: Caminho do artefato (ex.: 'dados/0.raw.arrow').
+
+    Raises:
+        ValueError: Se o formato não existe ou se um artefato Arrow IPC for
+            pedido particionado (os datasets particionados são sempre Parquet).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato {formato} inválido; use um de {FORMATOS}")
+    if particionar and formato != 'parquet':
+        raise ValueError("Apenas artefatos Parquet podem ser particionados")
+    return f'{pasta}/{nome}.{formato}'
+
+
+def localizar_artefato(pasta, nome):
+    """
+    Encontra um artefato intermediário, qualquer que seja o seu formato.
+
+    Como a gravação de um formato remove o outro (ver remover_artefato),
+    existe no máximo um deles.
+
+    Args:
+        pasta (str): Pasta base do pipeline.
+        nome (str): Nome do artefato, sem extensão (ex.: '1.limpo').
+
+    Returns:
+        str: Caminho do artefato existente, ou o caminho Parquet se não houver.
+    """
+    for formato in FORMATOS:
+        caminho = caminho_artefato(pasta, nome, formato)
+        if Path(caminho).exists():
+            return caminho
+    return caminho_artefato(pasta, nome)
+
+
+def _e_arrow(caminho):
+    return str(caminho).endswith('.arrow')
+
+
+def _unificar_dicionarios(lote, dicionarios):
+    """
+    Reescreve as colunas dicionário de um lote sobre um dicionário único por coluna.
+
+    Cada lote gravado em streaming chega com o seu próprio dicionário, e um
+    arquivo Arrow IPC só admite que o dicionário de uma coluna cresça de um
+    lote para o outro (delta). Os valores novos do lote são acrescentados
+    ao fim do dicionário acumulado da coluna e os índices são traduzidos
+    para ele, então o arquivo é gravado com as colunas TEXTO como
+    dicionário e lido sem recodificar as strings (ver ler_tabela).
+
+    Args:
+        lote (pa.RecordBatch): Lote no esquema da etapa.
+        dicionarios (dict): Dicionário acumulado de cada coluna, atualizado
+            a cada lote (vazio no primeiro).
+
+    Returns:
+        pa.RecordBatch: Lote com os dicionários acumulados.
+    """
+    colunas = []
+
+    for campo, coluna in zip(lote.schema, lote.columns):
+        if pa.types.is_dictionary(campo.type):
+            posicoes, valores = dicionarios.setdefault(campo.name, ({}, []))
+            do_lote = coluna.dictionary.to_pylist()
+            for valor in do_lote:
+                if valor not in posicoes:
+                    posicoes[valor] = len(valores)
+                    valores.append(valor)
+
+            traducao = pa.array([posicoes[valor] for valor in do_lote],
+                                campo.type.index_type)
+            coluna = pa.DictionaryArray.from_arrays(
+                pc.take(traducao, coluna.indices),
+                pa.array(valores, campo.type.value_type))
+        colunas.append(coluna)
+
+    return pa.record_batch(colunas, schema=lote.schema)
+
+
+def abrir_dataset(caminho):
+    """
+    Abre um artefato do pipeline como pyarrow.dataset, em qualquer formato.
+
+    Arquivos Arrow IPC são abertos com memory map.
+
+    Args:
+        caminho (str): Arquivo Parquet ou Arrow IPC, ou dataset particionado.
+
+    Returns:
+        ds.Dataset: Dataset do artefato.
+    """
+    if _e_arrow(caminho):
+        return ds.dataset(str(caminho), format='ipc',
+                          filesystem=pafs.LocalFileSystem(use_mmap=True))
+    return ds.dataset(caminho, format='parquet', partitioning=PARTICIONAMENTO)
+
+
+def gravar_lotes(lotes, caminho, esquema):
+    """
+    Grava lotes em streaming em um único arquivo Parquet ou Arrow IPC.
+
+    O formato segue a extensão de `caminho` ('.parquet' ou '.arrow'). O
+    Arrow IPC é gravado sem compressão, para ser lido com memory map, e
+    com as colunas TEXTO como dicionário: um único por coluna, que cresce
+    com deltas a cada lote (ver _unificar_dicionarios).
+
+    Args:
+        lotes (Iterable[pa.RecordBatch | pa.Table]): Dados no esquema `esquema`.
+        caminho (str): Caminho do arquivo.
+        esquema (pa.Schema): Esquema da etapa, com os metadados do pipeline.
+
+    Returns:
+        None
+    """
+    remover_artefato(caminho)
+
+    if _e_arrow(caminho):
+        dicionarios = {}
+        opcoes = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+        with pa.ipc.new_file(caminho, esquema, options=opcoes) as writer:
+            for lote in lotes:
+                for parte in pa.table(lote).cast(esquema).to_batches():
+                    writer.write(_unificar_dicionarios(parte, dicionarios))
+        return
+
+    with pq.ParquetWriter(caminho, esquema) as writer:
+        for lote in lotes:
+            writer.write(lote)
+
+
+def ler_parquet(caminho, esquema, colunas=None, filtros=None):
+    """
+    Lê um Parquet do pipeline garantindo o esquema da etapa.
+
+    As colunas são convertidas para os tipos de `esquema` e a coluna 'data'
+    chega ao pandas como datetime64, não como objetos datetime.date.
+
+    Args:
+        caminho (str): Caminho do arquivo (ou diretório) Parquet.
+        esquema (pa.Schema): Esquema da etapa (ex.: ESQUEMA_RAW).
+        colunas (list[str], optional): Subconjunto de colunas a ler. Default=None
+        filtros (list, optional): Filtros repassados a pyarrow.parquet.read_table.
+            Default=None
+
+    Returns:
+        pd.DataFrame: Dados lidos, com strings como categorical e inteiros estreitos.
+
+    Example:
+        >>> df = ler_parquet('dados/0.raw.parquet', ESQUEMA_RAW)
+    """
+    return para_dataframe(ler_tabela(caminho, esquema, colunas, filtros), esquema)
+
+
+def ler_tabela(caminho, esquema, colunas=None, filtros=None):
+    """
+    Lê um Parquet do pipeline como tabela Arrow, sem converter para pandas.
+
+    Usada quando parte das colunas só é repassada para a saída: elas ficam
+    em Arrow e nunca são materializadas como DataFrame. Arquivos Arrow IPC
+    ('.arrow') são lidos com memory map, sem cópia das colunas, e já
+    chegam nos tipos de `esquema` (ver gravar_lotes).
+
+    Args:
+        caminho (str): Caminho do arquivo (ou diretório) Parquet, ou do
+            arquivo Arrow IPC.
+        esquema (pa.Schema): Esquema da etapa (ex.: ESQUEMA_RAW).
+        colunas (list[str], optional): Subconjunto de colunas a ler. Default=None
+        filtros (list, optional): Filtros repassados a pyarrow.parquet.read_table.
+            Default=None
+
+    Returns:
+        pa.Table: Tabela com as colunas pedidas, nos tipos de `esquema`.
+    """
+    colunas = colunas or esquema.names
+
+    if _e_arrow(caminho):
+        # As colunas lidas continuam válidas depois de fechar o arquivo:
+        # o mapeamento só é desfeito quando elas são liberadas
+        with pa.memory_map(str(caminho)) as fonte:
+            tabela = pa.ipc.open_file(fonte).read_all()
+        if filtros:
+            tabela = tabela.filter(pq.filters_to_expression(filtros))
+        tabela = tabela.select(colunas)
+    else:
+        tabela = pq.read_table(caminho, columns=colunas, filters=filtros,
+                               partitioning=PARTICIONAMENTO)
+    destino = pa.schema([esquema.field(c) for c in colunas])
+    if tabela.schema.equals(destino):
+        return tabela
+    return tabela.cast(destino)
+
+
+def para_dataframe(tabela, esquema):
+    """
+    Converte uma tabela Arrow de uma etapa para DataFrame.
+
+    É a mesma conversão feita por ler_parquet, usada quando as etapas
+    trocam os dados em memória sem passar pelo disco.
+
+    Args:
+        tabela (pa.Table): Tabela com um subconjunto das colunas de `esquema`.
+        esquema (pa.Schema): Esquema da etapa (ex.: ESQUEMA_RAW).
+
+    Returns:
+        pd.DataFrame: Dados com strings como categorical e inteiros estreitos.
+    """
+    tabela = tabela.cast(pa.schema([esquema.field(c) for c in tabela.schema.names]))
+    return _ordenar_categorias(tabela.to_pandas(date_as_object=False))
+
+
+def para_tabela(df, esquema):
+    """
+    Converte um DataFrame para uma tabela Arrow no esquema da etapa.
+
+    Colunas fora do esquema são descartadas; a conversão falha se faltar
+    alguma coluna ou se um valor não couber no tipo declarado.
+
+    Args:
+        df (pd.DataFrame): DataFrame produzido pela etapa.
+        esquema (pa.Schema): Esquema da etapa.
+
+    Returns:
+        pa.Table: Tabela com exatamente os campos de `esquema`.
+    """
+    return pa.Table.from_pandas(df, schema=esquema, preserve_index=False)
+
+
+def com_metadados(esquema, metadados):
+    """
+    Anexa ao esquema os metadados do pipeline (ex.: parâmetros da etapa).
+
+    Args:
+        esquema (pa.Schema): Esquema da etapa.
+        metadados (dict): Valores serializáveis em JSON.
+
+    Returns:
+        pa.Schema: Esquema com a chave 'pipeline' nos metadados.
+    """
+    return esquema.with_metadata({'pipeline': json.dumps(metadados)})
+
+
+def ler_metadados(caminho):
+    """
+    Lê os metadados do pipeline gravados em um artefato por salvar_parquet.
+
+    Args:
+        caminho (str): Caminho do arquivo Parquet ou Arrow IPC.
+
+    Returns:
+        dict: Metadados gravados, ou dicionário vazio se não houver.
+    """
+    metadados = abrir_dataset(caminho).schema.metadata or {}
+    return json.loads(metadados.get(b'pipeline', b'{}'))
+
+
+def montar_filtros(estado=None, codmun=None, inicio=None, fim=None):
+    """
+    Monta filtros de leitura por estado, município e período.
+
+    Usados com ler_parquet, permitem que o pyarrow descarte partições
+    (estado/ano) e row groups (pelas estatísticas de codmun e data) sem
+    lê-los.
+
+    Args:
+        estado (str, optional): Sigla do estado. Default=None
+        codmun (int, optional): Código do município. Default=None
+        inicio (str, optional): Data inicial (inclusive), 'AAAA-MM-DD'. Default=None
+        fim (str, optional): Data final (inclusive), 'AAAA-MM-DD'. Default=None
+
+    Returns:
+        list | None: Filtros no formato de pyarrow.parquet.read_table.
+
+    Example:
+        >>> ler_parquet('dados/2.atributos.parquet', ESQUEMA_ATRIBUTOS,
+        ...             filtros=montar_filtros(estado='MG', inicio='2021-01-01'))
+    """
+    filtros = []
+    if estado is not None:
+        filtros.append(('estado', '==', estado))
+    if codmun is not None:
+        filtros.append(('codmun', '==', codmun))
+    if inicio is not None:
+        filtros.append(('data', '>=', pa.scalar(inicio).cast(pa.date32())))
+    if fim is not None:
+        filtros.append(('data', '<=', pa.scalar(fim).cast(pa.date32())))
+    return filtros or None
+
+
+def remover_artefato(caminho):
+    """
+    Remove um artefato anterior, seja ele um arquivo ou um dataset.
+
+    Remove também o mesmo artefato gravado no outro formato (ex.: o
+    '0.raw.arrow' ao gravar o '0.raw.parquet'), para que as etapas
+    seguintes nunca leiam uma versão antiga (ver localizar_artefato).
+
+    Args:
+        caminho (str): Caminho do artefato.
+
+    Returns:
+        None
+    """
+    caminho = Path(caminho)
+    versoes = [caminho]
+    if caminho.suffix[1:] in FORMATOS:
+        versoes = [caminho.with_suffix(f'.{formato}') for formato in FORMATOS]
+
+    for versao in versoes:
+        if versao.is_dir():
+            shutil.rmtree(versao)
+        elif versao.exists():
+            versao.unlink()
+
+
+def com_particoes(tabela):
+    """
+    Adiciona a coluna de partição 'ano' (derivada de 'data') se ela faltar.
+
+    Args:
+        tabela (pa.Table | pa.RecordBatch): Dados da etapa.
+
+    Returns:
+        pa.Table | pa.RecordBatch: Dados com a coluna 'ano'.
+    """
+    if 'ano' in tabela.schema.names:
+        return tabela
+    return tabela.append_column('ano', pc.year(tabela['data']).cast(pa.int16()))
+
+
+def salvar_dataset(dados, caminho, esquema=None, nome_base='parte-{i}.parquet',
+                   substituir=True):
+    """
+    Grava dados em um dataset Parquet particionado por estado e ano.
+
+    Os arquivos ficam em '<caminho>/estado=XX/ano=AAAA/' com row groups
+    pequenos e estatísticas de coluna, de modo que leituras filtradas por
+    estado, município ou data (ver montar_filtros) tocam só o necessário.
+
+    Args:
+        dados (pa.Table | Iterable[pa.RecordBatch]): Dados com a coluna 'ano'
+            (ver com_particoes).
+        caminho (str): Diretório do dataset.
+        esquema (pa.Schema, optional): Obrigatório quando `dados` é um
+            iterável de lotes. Default=None
+        nome_base (str, optional): Modelo do nome dos arquivos. Default='parte-{i}.parquet'
+        substituir (bool, optional): Remove o artefato anterior antes. Default=True
+
+    Returns:
+        None
+    """
+    if substituir:
+        remover_artefato(caminho)
+
+    ds.write_dataset(
+        dados, caminho, schema=esquema, format='parquet',
+        partitioning=PARTICOES, partitioning_flavor='hive',
+        basename_template=nome_base,
+        existing_data_behavior='overwrite_or_ignore',
+        max_rows_per_group=LINHAS_POR_ROW_GROUP,
+        min_rows_per_group=0
+    )
+
+
+def salvar_parquet(df, caminho, esquema, metadados=None, particionar=False):
+    """
+    Grava um DataFrame em Parquet no esquema da etapa.
+
+    Args:
+        df (pd.DataFrame): DataFrame produzido pela etapa.
+        caminho (str): Caminho do arquivo Parquet.
+        esquema (pa.Schema): Esquema da etapa (ex.: ESQUEMA_LIMPO).
+        metadados (dict, optional): Metadados do pipeline (ver com_metadados).
+            Default=None
+        particionar (bool, optional): Grava um dataset particionado por
+            estado e ano, ordenado por (codmun, data), em vez de um único
+            arquivo (ver salvar_dataset). Default=False
+
+    Returns:
+        None
+
+    Example:
+        >>> salvar_parquet(df, 'dados/1.limpo.parquet', ESQUEMA_LIMPO)
+    """
+    salvar_tabela(para_tabela(df, esquema), caminho, metadados, particionar)
+
+
+def salvar_tabela(tabela, caminho, metadados=None, particionar=False):
+    """
+    Grava uma tabela Arrow já no esquema da etapa (ver salvar_parquet).
+
+    Args:
+        tabela (pa.Table): Tabela produzida pela etapa.
+        caminho (str): Caminho do arquivo Parquet.
+        metadados (dict, optional): Metadados do pipeline (ver com_metadados).
+            Default=None
+        particionar (bool, optional): Grava um dataset particionado por
+            estado e ano (ver salvar_dataset). Default=False
+
+    Returns:
+        None
+    """
+    if metadados is not None:
+        tabela = tabela.replace_schema_metadata(
+            com_metadados(tabela.schema, metadados).metadata)
+
+    if particionar:
+        salvar_dataset(com_particoes(tabela.sort_by(ORDEM_DATASET)), caminho)
+    elif _e_arrow(caminho):
+        gravar_lotes([tabela], caminho, tabela.schema)
+    else:
+        remover_artefato(caminho)
+        pq.write_table(tabela, caminho)
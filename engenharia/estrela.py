@@ -0,0 +1,150 @@
+from pathlib import Path
+import logging
+import pyarrow as pa
+from esquema import (COLUNAS_CALENDARIO, COLUNAS_MUNICIPIO, ESQUEMA_ATRIBUTOS,
+                     ESQUEMA_DIM_CALENDARIO, ESQUEMA_DIM_MUNICIPIO, ESQUEMA_FATO,
+                     ler_tabela, para_dataframe, para_tabela, remover_artefato,
+                     salvar_tabela)
+from utils import medir, registrar_execucao, registrar_metricas, tamanho_em_disco
+
+
+# Tabelas do layout estrela, na ordem em que são gravadas e carregadas,
+# com o esquema e a chave primária de cada uma
+TABELAS_ESTRELA = {
+    'fato': (ESQUEMA_FATO, ['codmun', 'data']),
+    'dim_municipio': (ESQUEMA_DIM_MUNICIPIO, ['codmun']),
+    'dim_calendario': (ESQUEMA_DIM_CALENDARIO, ['data']),
+}
+
+
+def _dim_municipio(tabela):
+    """
+    Extrai a dimensão de municípios dos atributos.
+
+    As combinações distintas das colunas COLUNAS_MUNICIPIO são calculadas
+    em Arrow, sem converter as linhas diárias para pandas (os dicionários
+    das partes de um dataset particionado são unificados antes). Se um
+    município aparecer com descrições diferentes ao longo da série (ex.:
+    população revisada), vale a da data mais recente.
+
+    Args:
+        tabela (pa.Table): Atributos com o esquema ESQUEMA_ATRIBUTOS.
+
+    Returns:
+        pa.Table: Uma linha por 'codmun', com o esquema ESQUEMA_DIM_MUNICIPIO.
+    """
+    distintos = (tabela.select(COLUNAS_MUNICIPIO + ['data'])
+                 .unify_dictionaries()
+                 .group_by(COLUNAS_MUNICIPIO)
+                 .aggregate([('data', 'max')]))
+
+    df = para_dataframe(distintos.rename_columns(COLUNAS_MUNICIPIO + ['data']),
+                        ESQUEMA_ATRIBUTOS)
+    df = (df.sort_values(['codmun', 'data'], kind='mergesort')
+          .drop_duplicates('codmun', keep='last'))
+    return para_tabela(df, ESQUEMA_DIM_MUNICIPIO)
+
+
+def _dim_calendario(tabela):
+    """
+    Extrai a dimensão de calendário dos atributos.
+
+    Args:
+        tabela (pa.Table): Atributos com o esquema ESQUEMA_ATRIBUTOS.
+
+    Returns:
+        pa.Table: Uma linha por 'data', em ordem cronológica, com o esquema
+        ESQUEMA_DIM_CALENDARIO.
+    """
+    distintos = (tabela.select(COLUNAS_CALENDARIO)
+                 .unify_dictionaries()
+                 .group_by(COLUNAS_CALENDARIO)
+                 .aggregate([]))
+    return distintos.sort_by('data').cast(ESQUEMA_DIM_CALENDARIO)
+
+
+def construir_estrela(tabela):
+    """
+    Separa os atributos em uma tabela fato e nas dimensões de município e calendário.
+
+    A tabela fato mantém, por (codmun, data), apenas as medidas e os
+    atributos de série temporal (ESQUEMA_FATO); as descrições repetidas em
+    todas as linhas de um município ou de uma data ficam uma única vez nas
+    dimensões. Juntar a fato às dimensões por 'codmun' e 'data' reconstrói
+    os atributos originais.
+
+    Args:
+        tabela (pa.Table): Atributos com o esquema ESQUEMA_ATRIBUTOS.
+
+    Returns:
+        dict[str, pa.Table]: Tabelas de TABELAS_ESTRELA, por nome.
+
+    Example:
+        >>> estrela = construir_estrela(ler_tabela('dados/2.atributos.parquet', ESQUEMA_ATRIBUTOS))
+        >>> estrela['dim_municipio'].num_rows
+        5570
+    """
+    with medir('dim_municipio'):
+        dim_municipio = _dim_municipio(tabela)
+    with medir('dim_calendario'):
+        dim_calendario = _dim_calendario(tabela)
+
+    return {
+        'fato': tabela.select(ESQUEMA_FATO.names).cast(ESQUEMA_FATO),
+        'dim_municipio': dim_municipio,
+        'dim_calendario': dim_calendario,
+    }
+
+
+@registrar_execucao
+def exportar_estrela(pasta, dados=None, em_memoria=False):
+    """
+    Grava os atributos no layout estrela.
+
+    Lê o '2.atributos.parquet' (ou os atributos em memória, em `dados`) e
+    grava em '<pasta>/3.estrela' a tabela fato ('fato.parquet') e as
+    dimensões ('dim_municipio.parquet' e 'dim_calendario.parquet'), ver
+    construir_estrela. É o layout carregado por salvar_sql com estrela=True.
+
+    Args:
+        pasta (str): Caminho da pasta base contendo o '2.atributos.parquet'.
+        dados (pa.Table | pd.DataFrame, optional): Atributos já em memória,
+            como devolvidos por computar_atributos. Default=None
+        em_memoria (bool, optional): Devolve as tabelas. Default=False
+
+    Returns:
+        dict[str, pa.Table] | None: Com em_memoria=True, as tabelas por nome.
+        Caso contrário não retorna valores, mas grava os arquivos Parquet.
+
+    Example:
+        >>> exportar_estrela('dados')
+        # Grava 'dados/3.estrela/fato.parquet', 'dim_municipio.parquet' e
+        # 'dim_calendario.parquet'
+    """
+    nome_arquivo = f'{pasta}/2.atributos.parquet'
+    pasta_estrela = Path(f'{pasta}/3.estrela')
+
+    if dados is None:
+        logging.info(f"Lendo arquivo {nome_arquivo}")
+        registrar_metricas(bytes_lidos=tamanho_em_disco(nome_arquivo))
+        tabela = ler_tabela(nome_arquivo, ESQUEMA_ATRIBUTOS)
+    elif isinstance(dados, pa.Table):
+        tabela = dados.select(ESQUEMA_ATRIBUTOS.names).cast(ESQUEMA_ATRIBUTOS)
+    else:
+        tabela = para_tabela(dados, ESQUEMA_ATRIBUTOS)
+
+    registrar_metricas(linhas_entrada=tabela.num_rows)
+
+    estrela = construir_estrela(tabela)
+
+    remover_artefato(pasta_estrela)
+    pasta_estrela.mkdir(parents=True)
+
+    for nome, saida in estrela.items():
+        salvar_tabela(saida, pasta_estrela / f'{nome}.parquet')
+        registrar_metricas(linhas_saida=saida.num_rows)
+        logging.info(f"Tabela {nome} salva com {saida.num_rows} linhas")
+
+    registrar_metricas(bytes_gravados=tamanho_em_disco(pasta_estrela))
+
+    return estrela if em_memoria else None
@@ -1,7 +1,73 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 from tqdm import tqdm
+import json
 import logging
+import os
+import shutil
+import numpy as np
 import pandas as pd
-from utils import registrar_execucao
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from esquema import (ESQUEMA_LIMPO, ESQUEMA_RAW, ORDEM_DATASET, PARTICIONAMENTO,
+                     abrir_dataset,
+                     caminho_artefato, com_metadados, com_particoes, gravar_lotes,
+                     ler_metadados, ler_parquet, ler_tabela, localizar_artefato,
+                     para_dataframe, para_tabela, remover_artefato,
+                     salvar_dataset, salvar_tabela)
+from motores import consultar
+from utils import (medir, no_contexto_atual, registrar_execucao,
+                   registrar_metricas, tamanho_em_disco)
+
+
+class FalhaNaLimpeza(RuntimeError):
+    """Municípios ou shards que falharam; a limpeza não é gravada incompleta."""
+
+
+CHAVES_MUNICIPIO = ['municipio', 'estado']
+
+# Colunas do bruto lidas pela limpeza; as demais são apenas repassadas para
+# a saída, por posição, sem passar pelo pandas (ver _costurar)
+COLUNAS_LIMPEZA = CHAVES_MUNICIPIO + ['codmun', 'data', 'casosNovos']
+COLUNAS_GERADAS = ['novos_casos_novos', 'novos_casos_acumulados']
+
+# Linhas lidas do bruto por vez no modo fora da memória
+LINHAS_POR_LOTE = 1 << 20
+
+# Municípios por lote gravado no spool da limpeza retomável
+MUNICIPIOS_POR_LOTE = 500
+
+# Margem, relativa ao valor, que um caso precisa ultrapassar além de
+# threshold*desvio para ser outlier (ver _eh_outlier)
+TOLERANCIA_OUTLIER = 1e-9
+
+
+def _eh_outlier(valores, media, desvio, threshold):
+    """
+    Marca os valores fora do intervalo média ± threshold*desvio.
+
+    Valores exatamente sobre o limite (comuns em séries de inteiros
+    pequenos) não são outliers, e o limite precisa ser ultrapassado por
+    mais que TOLERANCIA_OUTLIER * max(1, |valor|): cada motor calcula o
+    desvio padrão com um arredondamento diferente, e sem a margem esses
+    empates seriam decididos pelo arredondamento. A mesma regra é usada
+    por _suavizar, _substituir_outliers e _limpar_duckdb.
+
+    Args:
+        valores (np.ndarray | pd.Series): Casos novos.
+        media (np.ndarray | pd.Series): Média móvel de cada linha.
+        desvio (np.ndarray | pd.Series): Desvio padrão móvel de cada linha
+            (nulo nunca é outlier).
+        threshold (float): Número de desvios padrão para definir outliers.
+
+    Returns:
+        np.ndarray | pd.Series: True nas linhas que são outliers.
+    """
+    margem = TOLERANCIA_OUTLIER * np.maximum(1, np.abs(valores))
+    with np.errstate(invalid='ignore'):
+        return np.abs(valores - media) - threshold * desvio > margem
 
 
 def _suavizar(df, window_size=3, threshold=2):
@@ -37,11 +103,8 @@ def _suavizar(df, window_size=3, threshold=2):
         window=window_size, center=True, min_periods=1).std()
 
     # Identify outliers (values outside mean ± threshold*std)
-    lower_bound = rolling_mean - threshold * rolling_std
-    upper_bound = rolling_mean + threshold * rolling_std
-
-    is_outlier = (df['novos_casos_novos'] < lower_bound) | (
-        df['novos_casos_novos'] > upper_bound)
+    is_outlier = _eh_outlier(df['novos_casos_novos'], rolling_mean,
+                             rolling_std, threshold)
 
     # Replace outliers with previous day's value
     df_smoothed['novos_casos_novos'] = df['novos_casos_novos'].where(
@@ -78,7 +141,7 @@ def _recalcula_casos_acumulados(df):
     return new_df
 
 
-def _limpar(df):
+def _limpar(df, window_size=3, threshold=2):
     """
     Executa o pipeline completo de limpeza e processamento dos dados.
 
@@ -88,6 +151,8 @@ def _limpar(df):
 
     Args:
         df (pd.DataFrame): DataFrame original a ser processado, deve conter a coluna 'casosNovos'.
+        window_size (int, optional): Tamanho da janela repassado a _suavizar. Default=3
+        threshold (int, optional): Número de desvios padrão repassado a _suavizar. Default=2
 
     Returns:
         pd.DataFrame: DataFrame processado com:
@@ -98,78 +163,1413 @@ def _limpar(df):
         >>> df_limpo = _limpar(df_original)
         # Retorna o DataFrame após suavização e cálculo de acumulados
     """
-    df = _suavizar(df)
+    df = _suavizar(df, window_size, threshold)
     df = _recalcula_casos_acumulados(df)
     return df
 
 
-def _processar(df):
+def _ordenar_por_municipio(df):
+    """
+    Ordena o DataFrame por município, estado e data, de forma estável.
+
+    Deixa as linhas de cada município contíguas e em ordem cronológica,
+    que é a pré-condição das operações agrupadas vetorizadas.
+
+    Args:
+        df (pd.DataFrame): DataFrame com as colunas 'municipio', 'estado' e 'data'.
+
+    Returns:
+        pd.DataFrame: DataFrame ordenado, preservando os índices originais.
+    """
+    return df.sort_values(CHAVES_MUNICIPIO + ['data'], kind='mergesort')
+
+
+def _estatisticas_moveis(valores, grupo, window_size):
+    """
+    Calcula média e desvio padrão móveis centrados, segmentados por grupo.
+
+    Equivale a rolling(window_size, center=True, min_periods=1) aplicado a
+    cada grupo, mas cada janela é calculada diretamente a partir dos seus
+    próprios valores (duas passadas: média e depois soma dos quadrados dos
+    desvios). Assim o resultado de uma linha depende apenas da sua janela,
+    e não de todo o histórico anterior como no algoritmo online do pandas,
+    o que permite recalcular só um trecho da série (ver _limpar_incremental).
+
+    Args:
+        valores (np.ndarray): Valores float64, com grupos contíguos.
+        grupo (np.ndarray): Identificador do grupo de cada linha.
+        window_size (int): Tamanho da janela.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Média e desvio padrão (ddof=1) de cada linha.
+    """
+    n = len(valores)
+    left = window_size // 2
+    posicoes = np.arange(n)
+
+    vizinhos = []
+    for deslocamento in range(-left, window_size - left):
+        indice = np.clip(posicoes + deslocamento, 0, max(n - 1, 0))
+        valido = ((posicoes + deslocamento >= 0)
+                  & (posicoes + deslocamento < n)
+                  & (grupo[indice] == grupo))
+        vizinhos.append(np.where(valido, valores[indice], np.nan))
+
+    contagem = sum(~np.isnan(v) for v in vizinhos)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = sum(np.nan_to_num(v) for v in vizinhos) / contagem
+        soma_quadrados = sum(np.nan_to_num((v - media) ** 2) for v in vizinhos)
+        desvio = np.sqrt(soma_quadrados / (contagem - 1))
+
+    desvio[contagem < 2] = np.nan
+    return media, desvio
+
+
+def _suavizar_vetorizado(df, window_size=3, threshold=2):
+    """
+    Versão vetorizada de _suavizar aplicada a todos os municípios de uma vez.
+
+    Em vez de iterar sobre cada município, calcula média e desvio padrão
+    móveis segmentados por (municipio, estado) (ver _estatisticas_moveis), e
+    o deslocamento do dia anterior/seguinte também por grupo. Mantém a mesma
+    regra da primeira linha de cada município: quando ela é outlier, usa o
+    valor seguinte.
+
+    Args:
+        df (pd.DataFrame): DataFrame ordenado por _ordenar_por_municipio,
+            contendo 'municipio', 'estado' e 'casosNovos'.
+        window_size (int, optional): Tamanho da janela para cálculo da média móvel. Default=3
+        threshold (int, optional): Número de desvios padrão para definir outliers. Default=2
+
+    Returns:
+        pd.DataFrame: Cópia do DataFrame com a coluna 'novos_casos_novos'.
+
+    Example:
+        >>> df_suavizado = _suavizar_vetorizado(_ordenar_por_municipio(df))
+    """
+    valores, grupo, substituto = _preparar_suavizacao(df)
+    rolling_mean, rolling_std = _estatisticas_moveis(valores, grupo, window_size)
+
+    df_smoothed = df.copy()
+    df_smoothed['novos_casos_novos'] = _substituir_outliers(
+        valores, rolling_mean, rolling_std, substituto, threshold)
+    return df_smoothed
+
+
+def _preparar_suavizacao(df):
+    """
+    Calcula as partes da suavização que não dependem dos parâmetros.
+
+    Args:
+        df (pd.DataFrame): DataFrame ordenado por _ordenar_por_municipio,
+            contendo 'municipio', 'estado' e 'casosNovos'.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: Casos novos em float64,
+        identificador do município de cada linha e o valor que substitui a
+        linha quando ela é outlier (dia anterior, ou seguinte na primeira
+        linha do município).
+    """
+    casos = df['casosNovos'].astype('float64')
+    grupos = casos.groupby([df[c] for c in CHAVES_MUNICIPIO], sort=False,
+                           observed=True)
+
+    primeira_linha = (grupos.cumcount() == 0).to_numpy()
+    substituto = np.where(primeira_linha,
+                          grupos.shift(-1).to_numpy(),
+                          grupos.shift(1).to_numpy())
+    return casos.to_numpy(), grupos.ngroup().to_numpy(), substituto
+
+
+def _substituir_outliers(valores, media, desvio, substituto, threshold):
+    """
+    Troca os outliers (fora de média ± threshold*desvio, ver _eh_outlier) pelo substituto.
+
+    Args:
+        valores (np.ndarray): Casos novos em float64.
+        media (np.ndarray): Média móvel de cada linha.
+        desvio (np.ndarray): Desvio padrão móvel de cada linha.
+        substituto (np.ndarray): Valor usado quando a linha é outlier.
+        threshold (float): Número de desvios padrão para definir outliers.
+
+    Returns:
+        np.ndarray: Casos novos suavizados.
+    """
+    is_outlier = _eh_outlier(valores, media, desvio, threshold)
+    return np.where(is_outlier, substituto, valores)
+
+
+def _limpar_vetorizado(df, window_size=3, threshold=2):
+    """
+    Executa a limpeza completa de todos os municípios em uma única passada.
+
+    Equivalente a aplicar _limpar em cada grupo (municipio, estado) e
+    concatenar os resultados: suaviza os casos novos e recalcula os casos
+    acumulados com soma cumulativa por município.
+
+    Args:
+        df (pd.DataFrame): DataFrame com 'municipio', 'estado', 'data' e 'casosNovos'.
+        window_size (int, optional): Tamanho da janela para cálculo da média móvel. Default=3
+        threshold (int, optional): Número de desvios padrão para definir outliers. Default=2
+
+    Returns:
+        pd.DataFrame: DataFrame ordenado por município e data, com as colunas
+        'novos_casos_novos' e 'novos_casos_acumulados'.
+
+    Example:
+        >>> df_limpo = _limpar_vetorizado(df_original)
+    """
+    df = _ordenar_por_municipio(df.dropna(subset=CHAVES_MUNICIPIO))
+    df = _suavizar_vetorizado(df, window_size, threshold)
+    df['novos_casos_acumulados'] = df.groupby(
+        CHAVES_MUNICIPIO, sort=False, observed=True)['novos_casos_novos'].cumsum()
+    return df
+
+
+def _limpar_duckdb(df, window_size=3, threshold=2):
+    """
+    Executa a limpeza de _limpar_vetorizado no DuckDB, com todos os núcleos.
+
+    A média e o desvio padrão móveis centrados, o valor substituto (dia
+    anterior, ou seguinte na primeira linha do município) e a soma
+    cumulativa são funções de janela particionadas por (municipio, estado)
+    e ordenadas por data, seguindo as mesmas regras de _estatisticas_moveis:
+    janela de window_size linhas com window_size // 2 antes da linha atual,
+    nulos ignorados e desvio nulo com menos de duas observações. O teste de
+    outlier é o de _eh_outlier, com a mesma margem TOLERANCIA_OUTLIER.
+    Empates de data mantêm a ordem original das linhas, como o mergesort de
+    _ordenar_por_municipio.
+
+    Args:
+        df (pd.DataFrame): DataFrame com 'municipio', 'estado', 'data' e 'casosNovos'.
+        window_size (int, optional): Tamanho da janela para cálculo da média móvel. Default=3
+        threshold (int, optional): Número de desvios padrão para definir outliers. Default=2
+
+    Returns:
+        pd.DataFrame: DataFrame ordenado por município e data, com as colunas
+        'novos_casos_novos' e 'novos_casos_acumulados' e os índices originais.
+
+    Example:
+        >>> df_limpo = _limpar_duckdb(df_original)
+    """
+    antes = window_size // 2
+    depois = window_size - 1 - antes
+
+    sql = f"""
+        WITH janelas AS (
+            SELECT *,
+                   avg(casos) OVER movel AS media,
+                   stddev_samp(casos) OVER movel AS desvio,
+                   CASE WHEN row_number() OVER municipio = 1
+                        THEN lead(casos) OVER municipio
+                        ELSE lag(casos) OVER municipio END AS substituto
+            FROM (SELECT *, CAST("casosNovos" AS DOUBLE) AS casos
+                  FROM entrada
+                  WHERE municipio IS NOT NULL AND estado IS NOT NULL)
+            WINDOW municipio AS (PARTITION BY municipio, estado
+                                 ORDER BY data, linha),
+                   movel AS (municipio ROWS BETWEEN {antes} PRECEDING
+                             AND {depois} FOLLOWING)
+        ), suavizado AS (
+            SELECT * EXCLUDE (casos, media, desvio, substituto),
+                   CASE WHEN abs(casos - media) - ? * desvio
+                             > ? * greatest(1, abs(casos))
+                        THEN substituto ELSE casos END AS novos_casos_novos
+            FROM janelas
+        )
+        SELECT *,
+               CASE WHEN novos_casos_novos IS NOT NULL
+                    THEN sum(novos_casos_novos) OVER (
+                        PARTITION BY municipio, estado ORDER BY data, linha
+                        ROWS UNBOUNDED PRECEDING) END AS novos_casos_acumulados
+        FROM suavizado
+        ORDER BY municipio, estado, data, linha
+    """
+    resultado = consultar(sql, [threshold, TOLERANCIA_OUTLIER],
+                          entrada=df.assign(linha=df.index))
+
+    return (resultado.to_pandas()
+            .set_index('linha')
+            .rename_axis(df.index.name))
+
+
+def suavizar_em_lote(df, grade):
+    """
+    Limpa os dados para várias combinações de window_size e threshold.
+
+    Equivale a rodar _limpar_vetorizado uma vez para cada par da grade, mas
+    a ordenação, o agrupamento por município e o substituto dos outliers
+    são calculados uma única vez, e a média e o desvio móveis uma vez por
+    window_size, compartilhados entre os thresholds da mesma janela.
+
+    Args:
+        df (pd.DataFrame): DataFrame com 'municipio', 'estado', 'codmun',
+            'data' e 'casosNovos'.
+        grade (Iterable[tuple[int, float]]): Pares (window_size, threshold).
+
+    Returns:
+        pd.DataFrame: Resultado longo, com uma linha por linha de `df` e par
+        da grade: 'window_size', 'threshold', 'codmun', 'data',
+        'novos_casos_novos' e 'novos_casos_acumulados'.
+
+    Example:
+        >>> suavizar_em_lote(df, [(3, 2), (3, 3), (7, 2), (7, 3)])
+    """
+    df = _ordenar_por_municipio(df.dropna(subset=CHAVES_MUNICIPIO))
+    valores, grupo, substituto = _preparar_suavizacao(df)
+
+    por_janela = {}
+    for window_size, threshold in grade:
+        por_janela.setdefault(window_size, []).append(threshold)
+
+    partes = []
+    for window_size, thresholds in por_janela.items():
+        media, desvio = _estatisticas_moveis(valores, grupo, window_size)
+
+        for threshold in thresholds:
+            novos = pd.Series(_substituir_outliers(valores, media, desvio,
+                                                   substituto, threshold),
+                              index=df.index)
+            partes.append(pd.DataFrame({
+                'window_size': window_size,
+                'threshold': threshold,
+                'codmun': df['codmun'],
+                'data': df['data'],
+                'novos_casos_novos': novos,
+                'novos_casos_acumulados': novos.groupby(grupo).cumsum(),
+            }))
+
+    return pd.concat(partes)
+
+
+def varrer_parametros(pasta, grade, referencia_municipios=None):
+    """
+    Lê o Parquet bruto e aplica suavizar_em_lote a todos os municípios válidos.
+
+    Permite comparar candidatos de window_size e threshold (ex.: na
+    modelagem) com o custo de uma única limpeza, sem gravar um
+    '1.limpo.parquet' por candidato.
+
+    Args:
+        pasta (str): Pasta base contendo o arquivo '0.raw.parquet'.
+        grade (Iterable[tuple[int, float]]): Pares (window_size, threshold).
+        referencia_municipios (str, optional): Tabela de municípios do IBGE
+            usada para validar 'codmun'. Default=None
+
+    Returns:
+        pd.DataFrame: Resultado longo de suavizar_em_lote.
+
+    Example:
+        >>> varrer_parametros('dados', [(w, t) for w in (3, 5, 7) for t in (1.5, 2, 3)])
+    """
+    nome_arquivo = localizar_artefato(pasta, '0.raw')
+    logging.info(f"Lendo {nome_arquivo}")
+
+    df = _filtrar_municipios_validos(
+        ler_parquet(nome_arquivo, ESQUEMA_RAW, colunas=COLUNAS_LIMPEZA),
+        referencia_municipios)
+    return suavizar_em_lote(df, grade)
+
+
+def _hash_linhas(df, colunas):
+    """
+    Calcula um hash por linha, independente dos tipos numéricos das colunas.
+
+    O mesmo dado pode chegar como int32 ou float64 (com nulos) dependendo do
+    arquivo lido, então as colunas numéricas são convertidas para float64
+    antes do hash.
+
+    Args:
+        df (pd.DataFrame): DataFrame a ser comparado.
+        colunas (list[str]): Colunas que entram no hash.
+
+    Returns:
+        pd.Series: Hash de cada linha, com tipo UInt64 (aceita nulos após merge).
+    """
+    valores = df[colunas].copy()
+    numericas = valores.select_dtypes('number').columns
+    valores[numericas] = valores[numericas].astype('float64')
+    return pd.util.hash_pandas_object(valores, index=False).astype('UInt64')
+
+
+def _limpar_incremental(df, anterior, window_size=3, threshold=2):
+    """
+    Atualiza uma limpeza anterior recalculando apenas o que pode ter mudado.
+
+    Compara o bruto atual com o resultado anterior (hash de cada linha bruta
+    por município e data) e encontra, em cada município, a primeira posição k
+    alterada (linha nova, removida ou com valores diferentes). Como a linha i
+    suavizada depende apenas das linhas brutas de i-left-1 a i+right+1 (janela
+    centrada mais o dia anterior/seguinte), somente as linhas a partir de
+    e = k-right-1 são recalculadas, usando como contexto as linhas desde
+    e-left-1. Os acumulados continuam a partir da soma anterior a e.
+    Municípios sem mudança são copiados do resultado anterior.
+
+    O resultado é idêntico ao de _limpar_vetorizado sobre o bruto completo,
+    desde que `anterior` tenha sido gerado com os mesmos parâmetros. Como em
+    _limpar_vetorizado, o índice do resultado aponta para as linhas de `df`,
+    inclusive nas linhas copiadas do resultado anterior.
+
+    Args:
+        df (pd.DataFrame): Bruto atual, já filtrado por município válido.
+        anterior (pd.DataFrame): Conteúdo do '1.limpo.parquet' anterior.
+        window_size (int, optional): Tamanho da janela da suavização. Default=3
+        threshold (int, optional): Número de desvios padrão da suavização. Default=2
+
+    Returns:
+        pd.DataFrame: Resultado completo, ordenado por município e data e
+        indexado pelas linhas de `df`.
+
+    Example:
+        >>> df_limpo = _limpar_incremental(bruto_df, limpo_anterior_df)
+    """
+    left = window_size // 2
+    right = window_size - 1 - left
+    colunas_brutas = [c for c in df.columns if c in anterior.columns]
+
+    df = _ordenar_por_municipio(df.dropna(subset=CHAVES_MUNICIPIO))
+    linhas = df.index.to_numpy()
+    df = df.reset_index(drop=True)
+    anterior = _ordenar_por_municipio(anterior).reset_index(drop=True)
+
+    chaves = CHAVES_MUNICIPIO + ['data']
+    atual = df[chaves].assign(
+        posicao=df.groupby(CHAVES_MUNICIPIO, observed=True).cumcount(),
+        hash=_hash_linhas(df, colunas_brutas), linha=linhas)
+    previo = anterior[chaves].assign(
+        posicao=anterior.groupby(CHAVES_MUNICIPIO, observed=True).cumcount(),
+        hash=_hash_linhas(anterior, colunas_brutas))
+
+    comparacao = atual.merge(previo, on=chaves, how='outer',
+                             suffixes=('', '_anterior'), indicator=True)
+    alterada = ((comparacao['_merge'] != 'both')
+                | (comparacao['hash'] != comparacao['hash_anterior']).fillna(True))
+    comparacao['k'] = comparacao[['posicao', 'posicao_anterior']].min(axis=1)
+    primeira_alteracao = comparacao[alterada].groupby(
+        CHAVES_MUNICIPIO, observed=True)['k'].min()
+
+    # Posição e (primeira linha recalculada) de cada linha do bruto atual
+    inicio = (primeira_alteracao - right - 1).clip(lower=0)
+    inicio = pd.merge(atual[CHAVES_MUNICIPIO], inicio.rename('e').reset_index(),
+                      on=CHAVES_MUNICIPIO, how='left')['e']
+    logging.info(f"{len(primeira_alteracao)} municípios com alterações")
+
+    contexto = df[atual['posicao'] >= inicio - left - 1]
+    recalculado = _suavizar_vetorizado(contexto, window_size, threshold)
+    recalculado = recalculado[atual.loc[recalculado.index, 'posicao']
+                              >= inicio.loc[recalculado.index]]
+
+    # Linhas anteriores a e são mantidas, e a soma delas é a base do acumulado
+    inicio_anterior = pd.merge(
+        previo[CHAVES_MUNICIPIO], primeira_alteracao.rename('e').reset_index(),
+        on=CHAVES_MUNICIPIO, how='left')['e']
+    inicio_anterior = (inicio_anterior - right - 1).clip(lower=0)
+    municipios_atuais = pd.MultiIndex.from_frame(atual[CHAVES_MUNICIPIO]).unique()
+    mantida = (pd.MultiIndex.from_frame(previo[CHAVES_MUNICIPIO])
+               .isin(municipios_atuais)
+               & ~(previo['posicao'] >= inicio_anterior))
+    mantido = anterior[mantida]
+    mantido.index = pd.merge(mantido[chaves], atual[chaves + ['linha']],
+                             on=chaves, how='left')['linha'].to_numpy()
+    recalculado.index = linhas[recalculado.index]
+
+    base = mantido.groupby(CHAVES_MUNICIPIO, observed=True)[
+        'novos_casos_novos'].sum().rename('base').reset_index()
+    base = pd.merge(recalculado[CHAVES_MUNICIPIO], base,
+                    on=CHAVES_MUNICIPIO, how='left')['base'].fillna(0)
+    recalculado['novos_casos_acumulados'] = base.to_numpy() + recalculado.groupby(
+        CHAVES_MUNICIPIO, sort=False, observed=True)['novos_casos_novos'].cumsum()
+
+    resultado = pd.concat([mantido, recalculado])
+    return _ordenar_por_municipio(resultado)
+
+
+def verificar_paridade(df, window_size=3, threshold=2, estrategia='vetorizada'):
+    """
+    Compara a limpeza vetorizada com a implementação por grupo.
+
+    Ordena a entrada por município e data, roda _limpar em cada grupo e
+    _limpar_vetorizado (ou _limpar_duckdb, com estrategia='duckdb') no
+    DataFrame inteiro, e verifica se as colunas 'novos_casos_novos' e
+    'novos_casos_acumulados' coincidem, em todas as linhas e na mesma ordem.
+    Os valores sobre o limite de outlier são decididos pela mesma regra em
+    todas as implementações (ver _eh_outlier).
+
+    Args:
+        df (pd.DataFrame): Amostra dos dados brutos (ex.: alguns estados).
+        window_size (int, optional): Tamanho da janela para cálculo da média móvel. Default=3
+        threshold (int, optional): Número de desvios padrão para definir outliers. Default=2
+        estrategia (str, optional): 'vetorizada' ou 'duckdb'. Default='vetorizada'
+
+    Returns:
+        None
+
+    Raises:
+        AssertionError: Se as duas implementações divergirem.
+
+    Example:
+        >>> verificar_paridade(ler_parquet('dados/0.raw.parquet', ESQUEMA_RAW))
+        >>> verificar_paridade(amostra, estrategia='duckdb')
+    """
+    df = _ordenar_por_municipio(df.dropna(subset=CHAVES_MUNICIPIO))
+
+    esperado = pd.concat([
+        _recalcula_casos_acumulados(_suavizar(grupo.copy(), window_size, threshold))
+        for _, grupo in df.groupby(CHAVES_MUNICIPIO, sort=False, observed=True)
+    ])
+    if estrategia == 'duckdb':
+        obtido = _limpar_duckdb(df, window_size, threshold)
+    else:
+        obtido = _limpar_vetorizado(df, window_size, threshold)
+
+    for coluna in COLUNAS_GERADAS:
+        pd.testing.assert_series_equal(esperado[coluna].astype('float64'),
+                                       obtido[coluna])
+
+
+def _carregar_codigos_ibge(caminho):
+    """
+    Carrega os códigos de município de uma tabela de referência do IBGE.
+
+    A tabela deve possuir uma coluna 'codmun'. Códigos de 7 dígitos (com
+    dígito verificador) são convertidos para os 6 dígitos usados pelo
+    Ministério da Saúde.
+
+    Args:
+        caminho (str): Arquivo CSV (separador detectado automaticamente) ou Parquet.
+
+    Returns:
+        np.ndarray: Códigos de município de 6 dígitos, sem repetições.
+    """
+    if str(caminho).endswith('.parquet'):
+        referencia = pd.read_parquet(caminho, columns=['codmun'])
+    else:
+        referencia = pd.read_csv(caminho, sep=None, engine='python',
+                                 usecols=['codmun'])
+
+    codigos = pd.to_numeric(referencia['codmun'], errors='coerce').dropna()
+    codigos = codigos.astype('int64')
+    codigos = codigos.where(codigos < 1_000_000, codigos // 10)
+    return codigos.unique()
+
+
+def _filtrar_municipios_validos(df, referencia=None):
+    """
+    Mantém apenas as linhas que correspondem a municípios válidos.
+
+    Remove as linhas agregadas (Brasil e estados), que não possuem
+    município ou código de município. Se uma tabela de referência for
+    informada, também remove os códigos que não constam nela. A busca é
+    feita com isin sobre 'codmun', sem chamadas Python por linha.
+
+    Args:
+        df (pd.DataFrame): DataFrame com as colunas 'municipio', 'estado' e 'codmun'.
+        referencia (str, optional): Caminho da tabela de municípios do IBGE
+            (ver _carregar_codigos_ibge). Default=None
+
+    Returns:
+        pd.DataFrame: DataFrame filtrado.
+
+    Example:
+        >>> filtrado_df = _filtrar_municipios_validos(df, 'dados/municipios_ibge.csv')
+    """
+    mascara = df[CHAVES_MUNICIPIO + ['codmun']].notna().all(axis=1)
+
+    if referencia is not None:
+        mascara &= df['codmun'].isin(_carregar_codigos_ibge(referencia))
+
+    removidas = len(df) - int(mascara.sum())
+    logging.info(f"{removidas} linhas removidas por município inválido")
+
+    return df[mascara]
+
+
+def _processar(df, estrategia='vetorizada', referencia=None, falhas=None,
+               window_size=3, threshold=2):
     """
     Processa e limpa os dados de COVID-19 agrupados por município e estado.
 
     Realiza as seguintes operações:
-    1. Identifica municípios únicos (combinação município/estado)
-    2. Filtra o DataFrame para garantir consistência nos dados
+    1. Remove linhas sem município ou com código fora da referência do IBGE
+    2. Registra no log quantas linhas foram descartadas
     3. Agrupa os dados por município e estado
     4. Aplica a função _limpar para cada grupo (suavização e cálculo de acumulados)
     5. Combina todos os grupos processados em um único DataFrame
 
+    Com estrategia='vetorizada' os passos 3 a 5 são feitos de uma vez por
+    _limpar_vetorizado, sobre o DataFrame ordenado por município e data.
+    Com estrategia='duckdb' são feitos por _limpar_duckdb, em paralelo e
+    com despejo em disco quando os dados não cabem na memória.
+
     Args:
         df (pd.DataFrame): DataFrame contendo os dados de COVID-19 com colunas:
             - municipio: nome do município
             - estado: sigla do estado
             - casosNovos: casos novos diários
+        estrategia (str, optional): 'vetorizada', 'duckdb' ou 'por_grupo'
+            (loop original sobre cada município). Default='vetorizada'
+        referencia (str, optional): Tabela de municípios do IBGE usada no
+            filtro de validade. Default=None
+        falhas (list, optional): Se informada, recebe uma mensagem para cada
+            município que falhou no processamento, e a decisão de interromper
+            a limpeza fica com quem chamou. Default=None
+        window_size (int, optional): Tamanho da janela da suavização. Default=3
+        threshold (int, optional): Número de desvios padrão da suavização. Default=2
 
     Returns:
         pd.DataFrame: DataFrame consolidado com todos os municípios processados,
         contendo colunas suavizadas e recalculadas.
 
+    Raises:
+        FalhaNaLimpeza: Se algum município falhar e `falhas` não for informada.
+
     Example:
         >>> df_processado = _processar(df_original)
         # Retorna DataFrame com dados limpos e processados por município/estado
     """
-    logging.info("Processando municipios_unicos")
-    municipios_unicos = set(zip(df['municipio'], df['estado']))
-    logging.info("Processamento concluído")
-
     logging.info("Filtrando o dataframe ")
-    mascara = df.apply(lambda x: (
-        x['municipio'], x['estado']) in municipios_unicos, axis=1)
-    filtrado_df = df[mascara]
+    with medir('filtro'):
+        registrar_metricas(linhas_entrada=len(df))
+        filtrado_df = _filtrar_municipios_validos(df, referencia)
+        registrar_metricas(linhas_saida=len(filtrado_df))
     logging.info("Processamento concluído")
 
+    if estrategia == 'vetorizada':
+        logging.info("Limpando todos os municípios de forma vetorizada")
+        with medir('vetorizado'):
+            registrar_metricas(linhas_entrada=len(filtrado_df))
+            return _limpar_vetorizado(filtrado_df, window_size, threshold)
+
+    if estrategia == 'duckdb':
+        logging.info("Limpando todos os municípios no DuckDB")
+        with medir('duckdb'):
+            registrar_metricas(linhas_entrada=len(filtrado_df))
+            return _limpar_duckdb(filtrado_df, window_size, threshold)
+
     logging.info("Processando grupos")
-    agrupado = filtrado_df.groupby(['municipio', 'estado'])
+    with medir('groupby'):
+        agrupado = filtrado_df.groupby(['municipio', 'estado'], observed=True)
     logging.info("Processamento concluído")
 
     resultado_df = []
+    erros = []
 
-    for (municipio, estado), group_df in tqdm(agrupado, desc="Processando"):
-        try:
-            resultado_df.append(_limpar(group_df))
-        except Exception as e:
-            logging.error(f"{estado}_{municipio} não foi salvo")
-            logging.error(e)
+    with medir('grupos'):
+        registrar_metricas(linhas_entrada=len(filtrado_df))
+        for (municipio, estado), group_df in tqdm(agrupado, desc="Processando"):
+            try:
+                resultado_df.append(_limpar(group_df, window_size, threshold))
+            except Exception as e:
+                logging.error(f"{estado}_{municipio} não foi salvo")
+                logging.error(e)
+                erros.append(f"{estado}_{municipio}: {e}")
 
-    resultado_df = pd.concat(resultado_df)
+    if falhas is not None:
+        falhas.extend(erros)
+    elif erros:
+        raise FalhaNaLimpeza(f"{len(erros)} município(s) falharam na limpeza")
+
+    with medir('concat'):
+        resultado_df = pd.concat(resultado_df)
+        registrar_metricas(linhas_saida=len(resultado_df))
     return resultado_df
 
 
+def _projetar(tabela):
+    """
+    Converte para pandas apenas as colunas usadas no cálculo da limpeza.
+
+    Args:
+        tabela (pa.Table): Bruto com o esquema ESQUEMA_RAW.
+
+    Returns:
+        pd.DataFrame: Colunas COLUNAS_LIMPEZA, indexadas pela posição da
+        linha em `tabela`.
+    """
+    return para_dataframe(tabela.select(COLUNAS_LIMPEZA), ESQUEMA_RAW)
+
+
+def _costurar(tabela, processado_df):
+    """
+    Monta a saída da limpeza a partir do bruto e das colunas calculadas.
+
+    As linhas do bruto são tomadas, em Arrow, na ordem e nas posições do
+    índice de `processado_df`, e recebem as colunas COLUNAS_GERADAS. As
+    colunas repassadas nunca passam pelo pandas.
+
+    Args:
+        tabela (pa.Table): Bruto com o esquema ESQUEMA_RAW.
+        processado_df (pd.DataFrame): Resultado de _processar sobre
+            _projetar(tabela).
+
+    Returns:
+        pa.Table: Tabela com o esquema ESQUEMA_LIMPO.
+    """
+    saida = tabela.select(ESQUEMA_RAW.names).take(
+        pa.array(processado_df.index.to_numpy(), pa.int64()))
+
+    for coluna in COLUNAS_GERADAS:
+        saida = saida.append_column(
+            coluna, pa.array(processado_df[coluna], from_pandas=True))
+
+    return saida.cast(ESQUEMA_LIMPO)
+
+
+def _limpar_shard(nome_arquivo, estado, pasta_shards, estrategia, referencia,
+                  window_size, threshold):
+    """
+    Limpa os municípios de um único estado e grava o resultado em um shard.
+
+    Executado em um processo do pool criado por _limpar_em_shards. Lê do
+    Parquet bruto apenas as linhas do estado (filtro aplicado na leitura).
+
+    Args:
+        nome_arquivo (str): Caminho do '0.raw.parquet'.
+        estado (str): Sigla do estado que forma o shard.
+        pasta_shards (Path): Pasta onde o shard será gravado.
+        estrategia (str): Estratégia repassada a _processar.
+        referencia (str): Tabela de municípios do IBGE repassada a _processar.
+        window_size (int): Tamanho da janela da suavização.
+        threshold (int): Número de desvios padrão da suavização.
+
+    Returns:
+        tuple[str, int, list[str]]: Estado, número de linhas gravadas e as
+        falhas ocorridas (por município, ou do shard inteiro).
+    """
+    falhas = []
+
+    try:
+        tabela = ler_tabela(nome_arquivo, ESQUEMA_RAW,
+                            filtros=[('estado', '==', estado)])
+        processado_df = _processar(_projetar(tabela), estrategia, referencia,
+                                   falhas, window_size, threshold)
+        salvar_tabela(_costurar(tabela, processado_df),
+                      pasta_shards / f'{estado}.parquet')
+        return estado, len(processado_df), falhas
+    except Exception as e:
+        falhas.append(f"{estado}: {e}")
+        return estado, 0, falhas
+
+
+def _limpar_estado(df, estado, estrategia, referencia, window_size, threshold):
+    """
+    Limpa os municípios de um estado já carregado em memória.
+
+    Versão de _limpar_shard usada no modo em memória: recebe as linhas do
+    estado em vez de lê-las do Parquet e devolve o resultado ao processo
+    principal em vez de gravar um shard.
+
+    Args:
+        df (pd.DataFrame): Linhas brutas do estado.
+        estado (str): Sigla do estado.
+        estrategia (str): Estratégia repassada a _processar.
+        referencia (str): Tabela de municípios do IBGE repassada a _processar.
+        window_size (int): Tamanho da janela da suavização.
+        threshold (int): Número de desvios padrão da suavização.
+
+    Returns:
+        tuple[str, pd.DataFrame | None, list[str]]: Estado, dados limpos (None
+        se o estado inteiro falhou) e as falhas ocorridas.
+    """
+    falhas = []
+
+    try:
+        processado_df = _processar(df, estrategia, referencia, falhas,
+                                   window_size, threshold)
+        return estado, processado_df, falhas
+    except Exception as e:
+        falhas.append(f"{estado}: {e}")
+        return estado, None, falhas
+
+
+def _registrar_falhas(falhas_por_shard):
+    """
+    Registra no log as falhas de cada shard, em ordem de estado, e interrompe a limpeza.
+
+    Uma limpeza com municípios ou estados faltando não pode ser entregue
+    como se estivesse completa (nem reaproveitada pelo cache de etapas),
+    então qualquer falha vira uma exceção depois do relatório.
+
+    Args:
+        falhas_por_shard (dict[str, list[str]]): Falhas de cada shard.
+
+    Returns:
+        None
+
+    Raises:
+        FalhaNaLimpeza: Se algum shard tiver falhas.
+    """
+    for estado, falhas in sorted(falhas_por_shard.items()):
+        logging.error(f"Shard {estado}: {len(falhas)} falha(s)")
+        for falha in falhas:
+            logging.error(falha)
+
+    if falhas_por_shard:
+        total = sum(len(falhas) for falhas in falhas_por_shard.values())
+        raise FalhaNaLimpeza(
+            f"{total} falha(s) na limpeza dos shards "
+            f"{', '.join(sorted(falhas_por_shard))}")
+
+
+def _juntar_shards(arquivos, name_file, metadados, particionar=False):
+    """
+    Junta os shards de limpeza em um único arquivo Parquet ou Arrow IPC.
+
+    Todos os shards são gravados com ESQUEMA_LIMPO, então podem ser
+    copiados um por vez para o mesmo arquivo. Com particionar=True
+    cada shard (um estado) é gravado na sua própria partição do dataset.
+
+    Args:
+        arquivos (list[Path]): Shards a serem unidos, na ordem de saída.
+        name_file (str): Caminho do arquivo final.
+        metadados (dict): Metadados do pipeline gravados no arquivo final.
+        particionar (bool, optional): Grava um dataset particionado. Default=False
+
+    Returns:
+        None
+    """
+    esquema = com_metadados(ESQUEMA_LIMPO, metadados)
+
+    if particionar:
+        remover_artefato(name_file)
+        for arquivo in arquivos:
+            tabela = pq.read_table(arquivo, schema=esquema)
+            salvar_dataset(com_particoes(tabela.sort_by(ORDEM_DATASET)),
+                           name_file, nome_base=f'{arquivo.stem}-{{i}}.parquet',
+                           substituir=False)
+        return
+
+    gravar_lotes((pq.read_table(arquivo, schema=ESQUEMA_LIMPO) for arquivo in arquivos),
+                 name_file, esquema)
+
+
+def _limpar_em_shards(nome_arquivo, name_file, workers, estrategia, referencia,
+                      window_size, threshold, particionar=False):
+    """
+    Limpa o Parquet bruto em paralelo, usando um shard por estado.
+
+    Cada estado é processado por um processo do pool e gravado em
+    '<name_file>.shards/<estado>.parquet'. Ao final os shards são unidos em
+    ordem alfabética de estado. Se algum shard ou município falhar, as
+    falhas são registradas por shard e a limpeza é interrompida sem gravar
+    a saída.
+
+    Args:
+        nome_arquivo (str): Caminho do '0.raw.parquet'.
+        name_file (str): Caminho do '1.limpo.parquet' a ser gerado.
+        workers (int): Número de processos do pool.
+        estrategia (str): Estratégia repassada a _processar.
+        referencia (str): Tabela de municípios do IBGE repassada a _processar.
+        window_size (int): Tamanho da janela da suavização.
+        threshold (int): Número de desvios padrão da suavização.
+        particionar (bool, optional): Grava um dataset particionado. Default=False
+
+    Returns:
+        None
+
+    Raises:
+        FalhaNaLimpeza: Se algum shard ou município falhar.
+    """
+    estados = ler_tabela(nome_arquivo, ESQUEMA_RAW, colunas=['estado'])['estado']
+    registrar_metricas(linhas_entrada=len(estados),
+                       bytes_lidos=tamanho_em_disco(nome_arquivo))
+    estados = sorted(e for e in estados.unique().to_pylist() if e is not None)
+
+    pasta_shards = Path(f'{name_file}.shards')
+    pasta_shards.mkdir(exist_ok=True)
+
+    falhas_por_shard = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = [
+            executor.submit(_limpar_shard, nome_arquivo, estado,
+                            pasta_shards, estrategia, referencia,
+                            window_size, threshold)
+            for estado in estados
+        ]
+
+        for futuro in tqdm(as_completed(futuros), total=len(futuros),
+                           desc="Processando shards"):
+            estado, linhas, falhas = futuro.result()
+            logging.info(f"Shard {estado} concluído com {linhas} linhas")
+            registrar_metricas(linhas_saida=linhas)
+
+            if falhas:
+                falhas_por_shard[estado] = falhas
+
+    try:
+        _registrar_falhas(falhas_por_shard)
+    except FalhaNaLimpeza:
+        shutil.rmtree(pasta_shards)
+        raise
+
+    arquivos = [pasta_shards / f'{estado}.parquet' for estado in estados
+                if (pasta_shards / f'{estado}.parquet').exists()]
+    _juntar_shards(arquivos, name_file,
+                   {'window_size': window_size, 'threshold': threshold},
+                   particionar)
+    registrar_metricas(bytes_gravados=tamanho_em_disco(name_file))
+    shutil.rmtree(pasta_shards)
+
+
+def _limpar_em_memoria(df, workers, estrategia, referencia, window_size,
+                      threshold):
+    """
+    Limpa um DataFrame em memória em paralelo, usando um shard por estado.
+
+    Equivalente a _limpar_em_shards, mas as linhas de cada estado são
+    enviadas aos processos do pool e os resultados voltam ao processo
+    principal, sem shards em disco.
+
+    Args:
+        df (pd.DataFrame): Colunas de cálculo do bruto (ver _projetar).
+        workers (int): Número de processos do pool.
+        estrategia (str): Estratégia repassada a _processar.
+        referencia (str): Tabela de municípios do IBGE repassada a _processar.
+        window_size (int): Tamanho da janela da suavização.
+        threshold (int): Número de desvios padrão da suavização.
+
+    Returns:
+        pd.DataFrame: Dados limpos, em ordem alfabética de estado e
+        indexados pelas linhas de `df`.
+
+    Raises:
+        FalhaNaLimpeza: Se algum shard ou município falhar.
+    """
+    partes = {}
+    falhas_por_shard = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = [
+            executor.submit(_limpar_estado, grupo_df, estado, estrategia,
+                            referencia, window_size, threshold)
+            for estado, grupo_df in df.groupby('estado', observed=True)
+        ]
+
+        for futuro in tqdm(as_completed(futuros), total=len(futuros),
+                           desc="Processando shards"):
+            estado, processado_df, falhas = futuro.result()
+
+            if processado_df is not None:
+                partes[estado] = processado_df
+                logging.info(f"Shard {estado} concluído com "
+                             f"{len(processado_df)} linhas")
+            if falhas:
+                falhas_por_shard[estado] = falhas
+
+    _registrar_falhas(falhas_por_shard)
+
+    return pd.concat([partes[estado] for estado in sorted(partes)])
+
+
+def _ler_manifesto(caminho, identificacao):
+    """
+    Lê o manifesto de progresso do spool, se ele for da mesma limpeza.
+
+    Args:
+        caminho (Path): Arquivo 'manifesto.json' do spool.
+        identificacao (dict): Parâmetros, tamanho de lote e identificação do
+            bruto da execução atual.
+
+    Returns:
+        dict[str, int]: Linhas de cada lote já concluído, ou vazio se o
+        manifesto não existe ou é de outra limpeza.
+    """
+    if not caminho.exists():
+        return {}
+
+    manifesto = json.loads(caminho.read_text())
+    if manifesto.get('identificacao') != identificacao:
+        return {}
+    return manifesto['concluidos']
+
+
+def _gravar_manifesto(caminho, identificacao, concluidos):
+    """
+    Grava o manifesto de progresso de forma atômica.
+
+    O arquivo é gravado ao lado e renomeado por cima do anterior, então uma
+    interrupção durante a gravação nunca deixa um manifesto corrompido.
+
+    Args:
+        caminho (Path): Arquivo 'manifesto.json' do spool.
+        identificacao (dict): Ver _ler_manifesto.
+        concluidos (dict[str, int]): Linhas de cada lote concluído.
+
+    Returns:
+        None
+    """
+    temporario = caminho.with_suffix('.tmp')
+    temporario.write_text(json.dumps(
+        {'identificacao': identificacao, 'concluidos': concluidos}, indent=2))
+    os.replace(temporario, caminho)
+
+
+def _ler_lote(nome_arquivo, municipios):
+    """
+    Lê do bruto apenas as linhas de um lote de municípios.
+
+    Args:
+        nome_arquivo (str): Caminho do bruto.
+        municipios (pd.MultiIndex): Pares (municipio, estado) do lote.
+
+    Returns:
+        pa.Table: Linhas dos municípios, com o esquema ESQUEMA_RAW.
+    """
+    nomes = [str(nome) for nome in municipios.get_level_values('municipio').unique()]
+    estados = [str(uf) for uf in municipios.get_level_values('estado').unique()]
+    tabela = ler_tabela(nome_arquivo, ESQUEMA_RAW,
+                        filtros=[('municipio', 'in', nomes), ('estado', 'in', estados)])
+
+    # O filtro acima aceita combinações de nome e estado fora do lote
+    chave = pc.binary_join_element_wise(
+        tabela['municipio'].cast(pa.string()), tabela['estado'].cast(pa.string()), '|')
+    pares = pa.array([f'{nome}|{uf}' for nome, uf in municipios], pa.string())
+    return tabela.filter(pc.is_in(chave, pares))
+
+
+def _limpar_retomavel(nome_arquivo, name_file, estrategia, referencia,
+                      window_size, threshold, parametros, particionar=False,
+                      municipios_por_lote=MUNICIPIOS_POR_LOTE):
+    """
+    Limpa o bruto em lotes de municípios, com checkpoint de cada lote.
+
+    Os municípios são numerados em ordem alfabética de (municipio, estado) e
+    divididos em lotes de `municipios_por_lote`. Cada lote limpo é gravado
+    em '<name_file>.spool/lote-<n>.parquet' e registrado em
+    'manifesto.json'. Se a execução for interrompida, a próxima chamada com
+    os mesmos parâmetros e o mesmo bruto pula os lotes já registrados e
+    processa só o restante. Ao final os lotes são unidos no arquivo da
+    limpeza (ver _juntar_shards) e o spool é removido.
+
+    Do bruto inteiro são lidas apenas as colunas CHAVES_MUNICIPIO, para
+    numerar os municípios; as linhas de cada lote são lidas com um filtro
+    por município quando o lote é processado (ver _ler_lote). Em memória
+    fica um lote por vez, ao custo de uma leitura filtrada do bruto por
+    lote.
+
+    Args:
+        nome_arquivo (str): Caminho do bruto.
+        name_file (str): Caminho da limpeza a ser gerada.
+        estrategia (str): Estratégia repassada a _processar.
+        referencia (str): Tabela de municípios do IBGE repassada a _processar.
+        window_size (int): Tamanho da janela da suavização.
+        threshold (int): Número de desvios padrão da suavização.
+        parametros (dict): Parâmetros gravados nos metadados do Parquet.
+        particionar (bool, optional): Grava um dataset particionado. Default=False
+        municipios_por_lote (int, optional): Municípios em cada lote.
+            Default=MUNICIPIOS_POR_LOTE
+
+    Returns:
+        None
+    """
+    pasta_spool = Path(f'{name_file}.spool')
+    caminho_manifesto = pasta_spool / 'manifesto.json'
+
+    registrar_metricas(bytes_lidos=tamanho_em_disco(nome_arquivo))
+    identificacao = {
+        'parametros': {**parametros, 'estrategia': estrategia,
+                       'referencia_municipios': referencia},
+        'municipios_por_lote': municipios_por_lote,
+        'bruto': [tamanho_em_disco(nome_arquivo),
+                  Path(nome_arquivo).stat().st_mtime_ns],
+    }
+
+    concluidos = _ler_manifesto(caminho_manifesto, identificacao)
+    if not concluidos and pasta_spool.exists():
+        logging.info(f"Descartando spool de outra limpeza em {pasta_spool}")
+        shutil.rmtree(pasta_spool)
+    pasta_spool.mkdir(exist_ok=True)
+
+    chaves = ler_tabela(nome_arquivo, ESQUEMA_RAW, colunas=CHAVES_MUNICIPIO)
+    registrar_metricas(linhas_entrada=chaves.num_rows)
+    # Linhas sem município (Brasil e estados) seriam descartadas pelo filtro
+    municipios = (para_dataframe(chaves, ESQUEMA_RAW)
+                  .groupby(CHAVES_MUNICIPIO, observed=True, sort=True).size().index)
+    del chaves
+
+    lotes = [str(n) for n in range(-(-len(municipios) // municipios_por_lote))]
+
+    pendentes = [n for n in lotes if n not in concluidos]
+    logging.info(f"{len(lotes) - len(pendentes)} de {len(lotes)} lotes já "
+                 f"concluídos em {pasta_spool}")
+
+    for n in tqdm(pendentes, desc="Processando lotes"):
+        inicio = int(n) * municipios_por_lote
+        tabela = _ler_lote(nome_arquivo,
+                           municipios[inicio:inicio + municipios_por_lote])
+        processado_df = _processar(_projetar(tabela), estrategia, referencia,
+                                   window_size=window_size, threshold=threshold)
+
+        arquivo = pasta_spool / f'lote-{int(n):05d}.parquet'
+        temporario = arquivo.with_suffix('.tmp')
+        salvar_tabela(_costurar(tabela, processado_df), temporario)
+        os.replace(temporario, arquivo)
+
+        concluidos[n] = len(processado_df)
+        _gravar_manifesto(caminho_manifesto, identificacao, concluidos)
+
+    registrar_metricas(linhas_saida=sum(concluidos.values()))
+
+    _juntar_shards([pasta_spool / f'lote-{int(n):05d}.parquet' for n in lotes],
+                   name_file, parametros, particionar)
+    registrar_metricas(bytes_gravados=tamanho_em_disco(name_file))
+    shutil.rmtree(pasta_spool)
+
+
+def _municipios_completos(lotes):
+    """
+    Reagrupa os lotes do bruto em tabelas que só contêm municípios completos.
+
+    Pressupõe um bruto agrupado por município (todas as linhas de cada
+    município contíguas, como em um bruto ordenado por município e data;
+    ver _lotes_agrupados).
+    As linhas do último município de cada lote ficam pendentes até que
+    apareça o município seguinte, de modo que em memória ficam no máximo um
+    lote e a série do maior município. As linhas sem município (Brasil e
+    estados) são descartadas, como em _filtrar_municipios_validos.
+
+    Args:
+        lotes (Iterable[pa.RecordBatch]): Lotes com o esquema ESQUEMA_RAW.
+
+    Yields:
+        pa.Table: Linhas de um ou mais municípios inteiros.
+
+    Raises:
+        ValueError: Se um município reaparece depois de concluído, isto é,
+            se o bruto não está agrupado por município.
+    """
+    pendente = None
+    concluidos = set()
+
+    for lote in lotes:
+        tabela = pa.Table.from_batches([lote])
+        tabela = tabela.filter(pc.and_(pc.is_valid(tabela['municipio']),
+                                       pc.is_valid(tabela['estado'])))
+        if pendente is not None:
+            tabela = pa.concat_tables([pendente, tabela])
+        if tabela.num_rows == 0:
+            continue
+
+        chave = pc.binary_join_element_wise(
+            tabela['municipio'].cast(pa.string()),
+            tabela['estado'].cast(pa.string()), '|').to_numpy(zero_copy_only=False)
+        inicios = np.concatenate(
+            [[0], np.flatnonzero(chave[1:] != chave[:-1]) + 1])
+        chaves = chave[inicios]
+
+        if len(set(chaves)) < len(chaves) or not concluidos.isdisjoint(chaves):
+            raise ValueError("O bruto não está agrupado por município; "
+                             "ordene-o por município e data antes da "
+                             "limpeza fora da memória")
+
+        ultimo = int(inicios[-1])
+        if ultimo:
+            concluidos.update(chaves[:-1])
+            yield tabela.slice(0, ultimo)
+        pendente = tabela.slice(ultimo)
+
+    if pendente is not None and pendente.num_rows:
+        yield pendente
+
+
+def _agrupado_por_municipio(dataset, linhas_por_lote):
+    """
+    Verifica se as linhas de cada município do bruto são contíguas.
+
+    Percorre apenas as colunas CHAVES_MUNICIPIO, em lotes, com as mesmas
+    regras de _municipios_completos.
+
+    Args:
+        dataset (ds.Dataset): Bruto aberto com abrir_dataset.
+        linhas_por_lote (int): Linhas lidas por vez.
+
+    Returns:
+        bool: True se o bruto está agrupado por município.
+    """
+    lotes = dataset.to_batches(columns=CHAVES_MUNICIPIO,
+                               batch_size=linhas_por_lote, use_threads=False)
+    try:
+        for _ in _municipios_completos(lotes):
+            pass
+    except ValueError:
+        return False
+    return True
+
+
+def _estados(dataset):
+    """
+    Lista os estados de um dataset particionado por estado, sem ler os dados.
+
+    Args:
+        dataset (ds.Dataset): Dataset com partições hive 'estado=<UF>'.
+
+    Returns:
+        list[str]: Estados em ordem alfabética (vazia se o dataset não é
+        particionado por estado). A partição das linhas sem estado é ignorada.
+    """
+    estados = {ds.get_partition_keys(fragmento.partition_expression).get('estado')
+               for fragmento in dataset.get_fragments()}
+    return sorted(estado for estado in estados if estado is not None)
+
+
+def _lotes_por_estado(dataset, linhas_por_lote):
+    """
+    Lê um dataset particionado por estado, um estado por vez, em ordem de codmun e data.
+
+    Args:
+        dataset (ds.Dataset): Bruto particionado por estado.
+        linhas_por_lote (int): Linhas de cada lote devolvido.
+
+    Yields:
+        pa.RecordBatch: Lotes de um estado, com os municípios contíguos.
+    """
+    for estado in _estados(dataset):
+        tabela = dataset.to_table(columns=ESQUEMA_RAW.names,
+                                  filter=pc.field('estado') == estado)
+        yield from tabela.sort_by(ORDEM_DATASET).to_batches(linhas_por_lote)
+
+
+def _lotes_agrupados(nome_arquivo, pasta_agrupamento, linhas_por_lote):
+    """
+    Lê o bruto em lotes com as linhas de cada município contíguas.
+
+    Um bruto já agrupado por município (ex.: CSVs divididos por município)
+    é lido em streaming, na ordem do arquivo. Um bruto particionado por
+    estado e ano, ou dividido por período como no download real, é lido um
+    estado por vez e ordenado por codmun e data; no segundo caso o bruto é
+    antes regravado em `pasta_agrupamento`, particionado por estado. Em
+    memória fica no máximo um estado, em vez do bruto inteiro.
+
+    Args:
+        nome_arquivo (str): Caminho do '0.raw.parquet' (arquivo ou dataset).
+        pasta_agrupamento (Path): Pasta temporária do bruto particionado por
+            estado; quem chama remove a pasta ao final.
+        linhas_por_lote (int): Linhas lidas por vez.
+
+    Returns:
+        Iterator[pa.RecordBatch]: Lotes do bruto.
+    """
+    dataset = abrir_dataset(nome_arquivo)
+
+    if _estados(dataset):
+        logging.info("Lendo o bruto particionado um estado por vez")
+        return _lotes_por_estado(dataset, linhas_por_lote)
+
+    if _agrupado_por_municipio(dataset, linhas_por_lote):
+        return dataset.to_batches(columns=ESQUEMA_RAW.names,
+                                  batch_size=linhas_por_lote, use_threads=False)
+
+    logging.info(f"Bruto não agrupado por município, particionando por "
+                 f"estado em {pasta_agrupamento}")
+    with medir('agrupamento'):
+        remover_artefato(pasta_agrupamento)
+        ds.write_dataset(
+            dataset.scanner(columns=ESQUEMA_RAW.names,
+                            filter=pc.field('estado').is_valid()),
+            pasta_agrupamento, format='parquet', partitioning=['estado'],
+            partitioning_flavor='hive')
+    return _lotes_por_estado(
+        ds.dataset(pasta_agrupamento, format='parquet',
+                   partitioning=PARTICIONAMENTO),
+        linhas_por_lote)
+
+
+def _limpar_fora_da_memoria(nome_arquivo, name_file, estrategia, referencia,
+                            window_size, threshold, parametros,
+                            particionar=False, linhas_por_lote=LINHAS_POR_LOTE):
+    """
+    Limpa o Parquet bruto em streaming, com memória limitada.
+
+    Os lotes do bruto (ver _lotes_agrupados) são reagrupados por
+    _municipios_completos; cada grupo de municípios completos é limpo e
+    gravado assim que termina. Com um bruto agrupado por município o uso de
+    memória fica limitado por um lote mais a série do maior município. Com
+    um bruto não agrupado (dividido por período, como o download real) o
+    pico de memória é o do maior estado, lido e ordenado de uma vez, e o
+    bruto é antes regravado inteiro em '<name_file>.agrupamento',
+    particionado por estado: isso exige em disco o espaço de uma cópia do
+    bruto, e a pasta é removida ao final. Um bruto já particionado por
+    estado (agrupar com particionar=True) é lido por estado sem a cópia. O
+    resultado segue a ordem dos municípios nos lotes.
+
+    Args:
+        nome_arquivo (str): Caminho do '0.raw.parquet' (arquivo ou dataset).
+        name_file (str): Caminho do '1.limpo.parquet' a ser gerado.
+        estrategia (str): Estratégia repassada a _processar.
+        referencia (str): Tabela de municípios do IBGE usada no filtro.
+        window_size (int): Tamanho da janela da suavização.
+        threshold (int): Número de desvios padrão da suavização.
+        parametros (dict): Parâmetros gravados nos metadados do Parquet.
+        particionar (bool, optional): Grava um dataset particionado. Default=False
+        linhas_por_lote (int, optional): Linhas lidas por vez.
+            Default=LINHAS_POR_LOTE
+
+    Returns:
+        None
+    """
+    registrar_metricas(bytes_lidos=tamanho_em_disco(nome_arquivo))
+
+    # A referência é carregada uma única vez, e não a cada lote
+    codigos = (pa.array(_carregar_codigos_ibge(referencia))
+               if referencia is not None else None)
+
+    pasta_agrupamento = Path(f'{name_file}.agrupamento')
+    lotes = _lotes_agrupados(nome_arquivo, pasta_agrupamento, linhas_por_lote)
+
+    def limpos():
+        for lote in lotes:
+            registrar_metricas(linhas_entrada=lote.num_rows)
+            yield lote.cast(ESQUEMA_RAW)
+
+    def gravaveis():
+        for tabela in _municipios_completos(limpos()):
+            if codigos is not None:
+                tabela = tabela.filter(pc.is_in(tabela['codmun'], codigos))
+            processado_df = _processar(_projetar(tabela), estrategia,
+                                       window_size=window_size,
+                                       threshold=threshold)
+            saida = _costurar(tabela, processado_df)
+            registrar_metricas(linhas_saida=saida.num_rows)
+            yield saida
+
+    esquema = com_metadados(ESQUEMA_LIMPO, parametros)
+
+    try:
+        if particionar:
+            salvar_dataset(
+                no_contexto_atual(lote for saida in gravaveis()
+                                  for lote in com_particoes(
+                                      saida.sort_by(ORDEM_DATASET)).to_batches()),
+                name_file, esquema=esquema.append(pa.field('ano', pa.int16())))
+        else:
+            gravar_lotes(gravaveis(), name_file, esquema)
+    finally:
+        remover_artefato(pasta_agrupamento)
+
+    registrar_metricas(bytes_gravados=tamanho_em_disco(name_file))
+
+
+def _ler_bruto(nome_arquivo, dados):
+    """
+    Obtém os dados brutos da etapa anterior, em memória ou do Parquet.
+
+    Args:
+        nome_arquivo (str): Caminho do '0.raw.parquet'.
+        dados (pa.Table | pd.DataFrame | None): Dados devolvidos por agrupar.
+
+    Returns:
+        pa.Table: Dados brutos com o esquema ESQUEMA_RAW.
+    """
+    if dados is None:
+        logging.info(f"Lendo {nome_arquivo}")
+        registrar_metricas(bytes_lidos=tamanho_em_disco(nome_arquivo))
+        return ler_tabela(nome_arquivo, ESQUEMA_RAW)
+    if isinstance(dados, pa.Table):
+        return dados.select(ESQUEMA_RAW.names).cast(ESQUEMA_RAW)
+    return para_tabela(dados, ESQUEMA_RAW)
+
+
+def _entregar(tabela, name_file, parametros, particionar, em_memoria,
+              checkpoint):
+    """
+    Grava o checkpoint da limpeza e devolve o resultado no modo em memória.
+
+    Args:
+        tabela (pa.Table): Dados limpos, montados por _costurar.
+        name_file (str): Caminho do '1.limpo.parquet'.
+        parametros (dict): Parâmetros gravados nos metadados do Parquet.
+        particionar (bool): Grava um dataset particionado.
+        em_memoria (bool): Devolve os dados limpos.
+        checkpoint (bool): Grava o Parquet em disco.
+
+    Returns:
+        pa.Table | None: Os dados limpos, se em_memoria=True.
+    """
+    registrar_metricas(linhas_saida=tabela.num_rows)
+
+    if checkpoint:
+        salvar_tabela(tabela, name_file, parametros, particionar)
+        registrar_metricas(bytes_gravados=tamanho_em_disco(name_file))
+        logging.info(f"Limpeza salva com nome {name_file}")
+
+    return tabela if em_memoria else None
+
+
 @registrar_execucao
-def limpar(pasta):
+def limpar(pasta, estrategia='vetorizada', referencia_municipios=None,
+           workers=1, window_size=3, threshold=2, incremental=False,
+           particionar=False, dados=None, em_memoria=False, checkpoint=True,
+           fora_da_memoria=False, formato='parquet', retomavel=False):
     """
     Realiza a limpeza e pré-processamento de dados contidos em um arquivo Parquet.
 
     Lê um arquivo Parquet bruto, aplica transformações de limpeza através da função
     _processar e salva o resultado em um novo arquivo Parquet pré-processado.
 
+    Apenas as colunas COLUNAS_LIMPEZA passam pelo pandas; as demais colunas
+    do bruto ficam em Arrow e são repassadas para a saída (ver _costurar).
+
+    Com workers > 1 a limpeza é dividida em um shard por estado e executada
+    em um pool de processos (ver _limpar_em_shards).
+
+    Com incremental=True e um '1.limpo.parquet' anterior gerado com os mesmos
+    window_size e threshold, apenas o trecho final afetado de cada município
+    alterado é recalculado (ver _limpar_incremental).
+
+    No modo em memória os dados brutos podem vir de agrupar em `dados`, em
+    vez de relidos do '0.raw.parquet', e com em_memoria=True o resultado é
+    devolvido para a etapa seguinte. O '1.limpo.parquet' passa a ser um
+    checkpoint opcional (checkpoint=False não grava nada em disco).
+
+    Com fora_da_memoria=True o '0.raw.parquet' é limpo em streaming, um
+    grupo de municípios completos por vez (ver _limpar_fora_da_memoria).
+    Um bruto agrupado por município, como o gerado a partir de CSVs
+    divididos por município (ver sintetico.gerar_dados), é lido na ordem do
+    arquivo; os demais são lidos um estado por vez, com memória limitada
+    pelo maior estado, e um bruto não particionado é antes copiado para uma
+    pasta temporária particionada por estado. Ignora workers. Só vale para
+    o bruto lido do disco: com `dados` ou em_memoria=True a opção é
+    ignorada, com um aviso.
+
+    Com retomavel=True a limpeza é feita em lotes de municípios, cada um
+    gravado em um spool com um manifesto de progresso; se a execução for
+    interrompida, a próxima processa apenas os lotes que faltam (ver
+    _limpar_retomavel). O spool só existe para o bruto lido do disco: com
+    `dados` ou em_memoria=True a opção é ignorada, com um aviso.
+
+    O bruto é lido no formato em que agrupar o gravou ('0.raw.parquet' ou
+    '0.raw.arrow', este com memory map). Com formato='arrow' a limpeza é
+    gravada como '1.limpo.arrow' (Arrow IPC sem compressão).
+
     Args:
         pasta (str): Caminho da pasta base contendo o arquivo '0.raw.parquet'
             e onde será salvo o resultado ('1.limpo.parquet').
+        estrategia (str, optional): Estratégia repassada a _processar.
+            Default='vetorizada'
+        referencia_municipios (str, optional): Tabela de municípios do IBGE
+            usada para validar 'codmun'. Default=None
+        workers (int, optional): Número de processos usados na limpeza. Default=1
+        window_size (int, optional): Tamanho da janela da suavização. Default=3
+        threshold (int, optional): Número de desvios padrão da suavização. Default=2
+        incremental (bool, optional): Reaproveita a limpeza anterior. Default=False
+        particionar (bool, optional): Grava um dataset particionado por estado
+            e ano (ver esquema.salvar_dataset). Default=False
+        dados (pa.Table | pd.DataFrame, optional): Dados brutos já em memória,
+            como devolvidos por agrupar. Default=None
+        em_memoria (bool, optional): Devolve os dados limpos. Default=False
+        checkpoint (bool, optional): Grava o Parquet em disco. Default=True
+        fora_da_memoria (bool, optional): Limpa o bruto em streaming, com
+            memória limitada. Default=False
+        formato (str, optional): 'parquet' ou 'arrow' (ver esquema.FORMATOS).
+            Default='parquet'
+        retomavel (bool, optional): Grava checkpoints por lote de municípios
+            e retoma a partir deles. Default=False
 
     Returns:
-        None: A função não retorna valores, mas gera um novo arquivo Parquet
-        com os dados limpos e processados.
+        pa.Table | None: Com em_memoria=True, os dados limpos com o esquema
+        ESQUEMA_LIMPO. Caso contrário não retorna valores, mas gera um novo
+        arquivo Parquet com os dados limpos e processados.
 
     Example:
         >>> limpar('dados/processados')
@@ -177,17 +1577,78 @@ def limpar(pasta):
         # e salva em 'dados/processados/1.limpo.parquet'
     """
 
-    nome_arquivo = f'{pasta}/0.raw.parquet'
+    nome_arquivo = localizar_artefato(pasta, '0.raw')
+    name_file = caminho_artefato(pasta, '1.limpo', formato, particionar)
+    parametros = {'window_size': window_size, 'threshold': threshold}
+    anterior_file = localizar_artefato(pasta, '1.limpo')
 
-    logging.info(f"Lendo {nome_arquivo}")
+    if incremental and Path(anterior_file).exists():
+        if ler_metadados(anterior_file) == parametros:
+            tabela = _ler_bruto(nome_arquivo, dados)
+            df = _filtrar_municipios_validos(_projetar(tabela),
+                                             referencia_municipios)
 
-    df = pd.read_parquet(f'{pasta}/0.raw.parquet')
+            logging.info(f"Lendo {anterior_file}")
+            registrar_metricas(linhas_entrada=tabela.num_rows,
+                               bytes_lidos=tamanho_em_disco(anterior_file))
+            anterior = ler_parquet(anterior_file, ESQUEMA_LIMPO,
+                                   colunas=COLUNAS_LIMPEZA + COLUNAS_GERADAS)
 
-    logging.info("Lido")
+            processado_df = _limpar_incremental(
+                df, anterior, window_size, threshold)
+
+            return _entregar(_costurar(tabela, processado_df), name_file,
+                             parametros, particionar, em_memoria, checkpoint)
+
+        logging.info("Parâmetros diferentes da limpeza anterior, "
+                     "recalculando tudo")
 
-    processado_df = _processar(df)
+    if fora_da_memoria and dados is None and not em_memoria:
+        logging.info(f"Limpando {nome_arquivo} fora da memória")
+        _limpar_fora_da_memoria(nome_arquivo, name_file, estrategia,
+                                referencia_municipios, window_size, threshold,
+                                parametros, particionar)
+        logging.info(f"Limpeza salva com nome {name_file}")
+        return
+
+    if fora_da_memoria and (dados is not None or em_memoria):
+        logging.warning("fora_da_memoria=True é ignorado com dados em memória "
+                        "ou em_memoria=True: o bruto inteiro é limpo em memória")
+
+    if retomavel and (dados is not None or em_memoria):
+        logging.warning("retomavel=True é ignorado com dados em memória ou "
+                        "em_memoria=True: a limpeza não grava checkpoints por lote")
+
+    if retomavel and dados is None and not em_memoria:
+        logging.info(f"Limpando {nome_arquivo} em lotes retomáveis")
+        _limpar_retomavel(nome_arquivo, name_file, estrategia,
+                          referencia_municipios, window_size, threshold,
+                          parametros, particionar)
+        logging.info(f"Limpeza salva com nome {name_file}")
+        return
+
+    if workers > 1 and dados is None and not em_memoria:
+        logging.info(f"Limpando {nome_arquivo} com {workers} processos")
+        _limpar_em_shards(nome_arquivo, name_file, workers,
+                          estrategia, referencia_municipios,
+                          window_size, threshold, particionar)
+        logging.info(f"Limpeza salva com nome {name_file}")
+        return
+
+    tabela = _ler_bruto(nome_arquivo, dados)
+    registrar_metricas(linhas_entrada=tabela.num_rows)
+    df = _projetar(tabela)
+
+    logging.info("Lido")
 
-    name_file = f'{pasta}/1.limpo.parquet'
-    processado_df.to_parquet(name_file, index=False)
+    if workers > 1:
+        logging.info(f"Limpando em memória com {workers} processos")
+        processado_df = _limpar_em_memoria(df, workers, estrategia,
+                                           referencia_municipios,
+                                           window_size, threshold)
+    else:
+        processado_df = _processar(df, estrategia, referencia_municipios,
+                                   window_size=window_size, threshold=threshold)
 
-    logging.info(f"Parquet salvo com nome {name_file}")
+    return _entregar(_costurar(tabela, processado_df), name_file, parametros,
+                     particionar, em_memoria, checkpoint)
@@ -2,9 +2,17 @@
 from agrupar import agrupar
 from limpar import limpar
 from atributos import computar_atributos
-from salvar_sql import salvar_sql
+from agregar import agregar
+from estrela import exportar_estrela
+from salvar_sql import VARIAVEL_DSN, salvar_sql
+from cache import executar_com_cache
+from esquema import FORMATOS, caminho_artefato
+from motores import MOTORES
+from utils import configurar_metricas
 
+import argparse
 import logging
+import os
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,13 +21,168 @@ logging.basicConfig(
 )
 
 
+def _argumentos():
+    parser = argparse.ArgumentParser(
+        description='Pipeline de engenharia dos dados de COVID-19')
+    parser.add_argument('--pasta', default='dados',
+                        help='Pasta base com a subpasta raw/ e os artefatos')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Número de processos/threads usados nas etapas')
+    parser.add_argument('--referencia-municipios', default=None,
+                        help='Tabela do IBGE (coluna codmun) usada para '
+                             'validar os municípios na limpeza')
+    parser.add_argument('--dsn', default=None,
+                        help='URL do PostgreSQL (padrão: variável COVID_DSN)')
+    parser.add_argument('--modo-carga', default='copy',
+                        choices=['copy', 'incremental', 'insert'],
+                        help='Modo de carga da tabela no PostgreSQL')
+    parser.add_argument('--carregar-agregados', action='store_true',
+                        help='Carrega no PostgreSQL também as tabelas '
+                             'agregadas por região, estado e região de saúde')
+    parser.add_argument('--estrela', action='store_true',
+                        help='Grava e carrega os atributos no layout estrela: '
+                             'tabela fato por (codmun, data) e dimensões de '
+                             'município e calendário')
+    parser.add_argument('--window-size', type=int, default=3,
+                        help='Janela da suavização de outliers')
+    parser.add_argument('--threshold', type=float, default=2,
+                        help='Desvios padrão que definem um outlier')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Recalcula na limpeza apenas os trechos alterados')
+    parser.add_argument('--retomavel', action='store_true',
+                        help='Grava a limpeza em lotes de municípios com '
+                             'checkpoint, retomando de onde parou')
+    parser.add_argument('--fora-da-memoria', action='store_true',
+                        help='Limpa o bruto em streaming, com memória '
+                             'limitada pelo maior município (bruto agrupado '
+                             'por município) ou pelo maior estado')
+    parser.add_argument('--particionar', action='store_true',
+                        help='Grava os artefatos como datasets particionados '
+                             'por estado e ano')
+    parser.add_argument('--formato-intermediario', default='parquet',
+                        choices=FORMATOS,
+                        help='Formato do bruto e da limpeza; arrow grava '
+                             'Arrow IPC sem compressão, lido com memory map')
+    parser.add_argument('--motor', default='pandas', choices=MOTORES,
+                        help='Motor das transformações de limpeza e '
+                             'atributos; duckdb usa todos os núcleos e '
+                             'despeja em disco o que não cabe na memória')
+    parser.add_argument('--em-memoria', action='store_true',
+                        help='Passa os dados entre as etapas em memória, '
+                             'sem reler os arquivos intermediários')
+    parser.add_argument('--checkpoints', action='store_true',
+                        help='No modo em memória, grava também os arquivos '
+                             'intermediários')
+    parser.add_argument('--metricas', default=None,
+                        help='Arquivo JSON lines onde são acrescentadas as '
+                             'métricas de cada etapa (padrão: o log)')
+    parser.add_argument('--forcar', action='store_true',
+                        help='Executa todas as etapas mesmo sem mudanças')
+    return parser.parse_args()
+
+
+def _estrategia_limpeza(motor):
+    return 'duckdb' if motor == 'duckdb' else 'vetorizada'
+
+
+def _executar_em_memoria(args):
+    """
+    Executa o pipeline passando os dados de uma etapa para a seguinte em memória.
+
+    Os arquivos intermediários só são gravados com --checkpoints e o cache
+    de etapas não é usado, pois ele depende desses arquivos.
+
+    Args:
+        args (argparse.Namespace): Argumentos da linha de comando.
+
+    Returns:
+        None
+    """
+    pasta = args.pasta
+    comum = {'particionar': args.particionar, 'em_memoria': True,
+             'checkpoint': args.checkpoints}
+
+    bruto = agrupar(pasta, workers=args.workers,
+                    formato=args.formato_intermediario, **comum)
+    limpo = limpar(pasta, referencia_municipios=args.referencia_municipios,
+                   workers=args.workers, window_size=args.window_size,
+                   threshold=args.threshold, incremental=args.incremental,
+                   formato=args.formato_intermediario, dados=bruto,
+                   estrategia=_estrategia_limpeza(args.motor), **comum)
+    del bruto
+    atributos = computar_atributos(pasta, dados=limpo, motor=args.motor,
+                                   **comum)
+    del limpo
+    agregar(pasta, dados=atributos)
+    if args.estrela:
+        exportar_estrela(pasta, dados=atributos)
+    salvar_sql(pasta, dsn=args.dsn or os.environ.get(VARIAVEL_DSN),
+               modo=args.modo_carga, dados=atributos,
+               agregados=args.carregar_agregados, estrela=args.estrela)
+
+
 def main():
-    pasta = 'dados'
+    args = _argumentos()
+    pasta = args.pasta
+
+    if args.metricas:
+        configurar_metricas(args.metricas)
+
+    if args.em_memoria:
+        _executar_em_memoria(args)
+        return
+
+    referencia = [args.referencia_municipios] if args.referencia_municipios else []
+    bruto = caminho_artefato(pasta, '0.raw', args.formato_intermediario,
+                             args.particionar)
+    limpo = caminho_artefato(pasta, '1.limpo', args.formato_intermediario,
+                             args.particionar)
 
-    agrupar(pasta)
-    limpar(pasta)
-    computar_atributos(pasta)
-    salvar_sql(pasta)
+    executar_com_cache(
+        agrupar, pasta,
+        entradas=[f'{pasta}/raw'],
+        saidas=[bruto],
+        parametros={'particionar': args.particionar,
+                    'formato': args.formato_intermediario},
+        opcoes={'workers': args.workers},
+        forcar=args.forcar)
+    executar_com_cache(
+        limpar, pasta,
+        entradas=[bruto] + referencia,
+        saidas=[limpo],
+        parametros={'referencia_municipios': args.referencia_municipios,
+                    'window_size': args.window_size,
+                    'threshold': args.threshold,
+                    'particionar': args.particionar,
+                    'formato': args.formato_intermediario,
+                    'estrategia': _estrategia_limpeza(args.motor)},
+        opcoes={'workers': args.workers, 'incremental': args.incremental,
+                'fora_da_memoria': args.fora_da_memoria,
+                'retomavel': args.retomavel},
+        forcar=args.forcar)
+    executar_com_cache(
+        computar_atributos, pasta,
+        entradas=[limpo],
+        saidas=[f'{pasta}/2.atributos.parquet'],
+        parametros={'particionar': args.particionar, 'motor': args.motor},
+        forcar=args.forcar)
+    executar_com_cache(
+        agregar, pasta,
+        entradas=[f'{pasta}/2.atributos.parquet'],
+        saidas=[f'{pasta}/3.agregados'],
+        forcar=args.forcar)
+    if args.estrela:
+        executar_com_cache(
+            exportar_estrela, pasta,
+            entradas=[f'{pasta}/2.atributos.parquet'],
+            saidas=[f'{pasta}/3.estrela'],
+            forcar=args.forcar)
+    # A carga não passa pelo cache: o resultado depende do estado do banco,
+    # que não é um arquivo da pasta, e pular a etapa deixaria o banco
+    # desatualizado se ele for recriado ou alterado por fora
+    salvar_sql(pasta, dsn=args.dsn or os.environ.get(VARIAVEL_DSN),
+               modo=args.modo_carga, agregados=args.carregar_agregados,
+               estrela=args.estrela)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+from pathlib import Path
+import tempfile
+
+
+# Motores de execução das transformações de limpar e computar_atributos.
+# O pandas é a implementação de referência; o duckdb é opcional.
+MOTORES = ['pandas', 'duckdb']
+
+# Pasta onde o DuckDB despeja em disco as operações maiores que a memória
+PASTA_TEMPORARIA = Path(tempfile.gettempdir()) / 'covid_duckdb'
+
+
+def _importar_duckdb():
+    """
+    Importa o DuckDB apenas quando o motor 'duckdb' é usado.
+
+    Returns:
+        module: O módulo duckdb.
+
+    Raises:
+        ImportError: Se o pacote não estiver instalado.
+    """
+    try:
+        import duckdb
+    except ImportError as erro:
+        raise ImportError("O motor 'duckdb' exige o pacote duckdb "
+                          "(pip install duckdb)") from erro
+    return duckdb
+
+
+def validar_motor(motor):
+    """
+    Verifica se o motor é conhecido e, no caso do DuckDB, se está instalado.
+
+    Args:
+        motor (str): Um dos MOTORES.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: Se o motor não estiver em MOTORES.
+        ImportError: Se o motor for 'duckdb' e o pacote não estiver instalado.
+    """
+    if motor not in MOTORES:
+        raise ValueError(f"Motor desconhecido: {motor} (use {MOTORES})")
+    if motor == 'duckdb':
+        _importar_duckdb()
+
+
+def consultar(sql, parametros=None, **tabelas):
+    """
+    Executa uma consulta SQL no DuckDB sobre DataFrames ou tabelas Arrow.
+
+    Cada argumento nomeado é registrado como uma tabela com o mesmo nome,
+    lida pelo DuckDB sem cópia. A consulta usa todos os núcleos e, quando
+    não cabe na memória, despeja os dados intermediários em
+    PASTA_TEMPORARIA. A conexão é em memória e descartada ao final.
+
+    Args:
+        sql (str): Consulta, com '?' no lugar dos parâmetros.
+        parametros (list, optional): Valores dos parâmetros. Default=None
+        **tabelas (pd.DataFrame | pa.Table): Tabelas usadas na consulta.
+
+    Returns:
+        pa.Table: Resultado da consulta.
+
+    Example:
+        >>> consultar('SELECT estado, count(*) AS n FROM df GROUP BY estado', df=df)
+    """
+    duckdb = _importar_duckdb()
+
+    PASTA_TEMPORARIA.mkdir(parents=True, exist_ok=True)
+    configuracao = {'temp_directory': str(PASTA_TEMPORARIA),
+                    'preserve_insertion_order': False}
+
+    with duckdb.connect(config=configuracao) as conexao:
+        for nome, tabela in tabelas.items():
+            conexao.register(nome, tabela)
+        return conexao.execute(sql, parametros or []).to_arrow_table()
@@ -0,0 +1,266 @@
+from pathlib import Path
+import argparse
+import logging
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+from esquema import ESQUEMA_RAW
+
+
+# (sigla, código IBGE, região) das 27 unidades da federação
+ESTADOS = [
+    ('RO', 11, 'Norte'), ('AC', 12, 'Norte'), ('AM', 13, 'Norte'),
+    ('RR', 14, 'Norte'), ('PA', 15, 'Norte'), ('AP', 16, 'Norte'),
+    ('TO', 17, 'Norte'), ('MA', 21, 'Nordeste'), ('PI', 22, 'Nordeste'),
+    ('CE', 23, 'Nordeste'), ('RN', 24, 'Nordeste'), ('PB', 25, 'Nordeste'),
+    ('PE', 26, 'Nordeste'), ('AL', 27, 'Nordeste'), ('SE', 28, 'Nordeste'),
+    ('BA', 29, 'Nordeste'), ('MG', 31, 'Sudeste'), ('ES', 32, 'Sudeste'),
+    ('RJ', 33, 'Sudeste'), ('SP', 35, 'Sudeste'), ('PR', 41, 'Sul'),
+    ('SC', 42, 'Sul'), ('RS', 43, 'Sul'), ('MS', 50, 'Centro-Oeste'),
+    ('MT', 51, 'Centro-Oeste'), ('GO', 52, 'Centro-Oeste'),
+    ('DF', 53, 'Centro-Oeste'),
+]
+
+REGIOES_DE_SAUDE_POR_ESTADO = 10
+
+
+def _municipios(quantidade, rng):
+    """
+    Sorteia os atributos fixos de cada município sintético.
+
+    Os municípios são distribuídos entre os estados em rodízio e recebem
+    códigos no formato do IBGE usado pelo painel (6 dígitos, começando pelo
+    código da UF).
+
+    Args:
+        quantidade (int): Número de municípios.
+        rng (np.random.Generator): Gerador de números aleatórios.
+
+    Returns:
+        dict[str, np.ndarray]: Uma posição por município para cada coluna fixa.
+    """
+    indice = np.arange(quantidade)
+    estado = indice % len(ESTADOS)
+    sequencia = indice // len(ESTADOS) + 1
+    coduf = np.array([e[1] for e in ESTADOS])[estado]
+    regiao_saude = sequencia % REGIOES_DE_SAUDE_POR_ESTADO
+
+    return {
+        'regiao': np.array([e[2] for e in ESTADOS])[estado],
+        'estado': np.array([e[0] for e in ESTADOS])[estado],
+        'municipio': np.char.add('Município ', indice.astype(str)),
+        'coduf': coduf,
+        'codmun': coduf * 10000 + sequencia,
+        'codRegiaoSaude': coduf * 1000 + regiao_saude,
+        'nomeRegiaoSaude': np.char.add(
+            np.array([e[0] for e in ESTADOS])[estado],
+            np.char.add(' Região ', regiao_saude.astype(str))),
+        'populacaoTCU2019': np.round(rng.lognormal(9.5, 1.2, quantidade)).astype(np.int64),
+        'interior/metropolitana': (rng.random(quantidade) < 0.2).astype(np.int64),
+    }
+
+
+def _serie_de_casos(municipios, dias, taxa_outliers, rng):
+    """
+    Sorteia os casos e óbitos diários de todos os municípios.
+
+    A série segue uma onda suave proporcional à população, com ruído de
+    Poisson. Uma fração `taxa_outliers` dos dias recebe um pico (lote de
+    notificações atrasadas) ou uma correção negativa, como no painel real.
+
+    Args:
+        municipios (dict[str, np.ndarray]): Resultado de _municipios.
+        dias (int): Número de dias da série.
+        taxa_outliers (float): Fração dos dias com valores atípicos.
+        rng (np.random.Generator): Gerador de números aleatórios.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Casos e óbitos novos, com forma
+        (municípios, dias).
+    """
+    quantidade = len(municipios['codmun'])
+    fase = rng.uniform(0, 2 * np.pi, (quantidade, 1))
+    onda = 1 + np.sin(np.linspace(0, 4 * np.pi, dias)[None, :] + fase)
+    taxa = municipios['populacaoTCU2019'][:, None] * 2e-4 * onda
+
+    casos = rng.poisson(taxa)
+
+    atipico = rng.random(casos.shape) < taxa_outliers
+    pico = rng.integers(10, 50, casos.shape) * (casos + 1)
+    correcao = -rng.integers(1, 20, casos.shape)
+    casos = np.where(atipico, np.where(rng.random(casos.shape) < 0.8, pico, correcao),
+                     casos)
+
+    obitos = rng.binomial(np.clip(casos, 0, None), 0.02)
+    return casos, obitos
+
+
+def _tabela(municipios, datas, series, municipais=True, agregados=True):
+    """
+    Monta a tabela no formato do painel para um intervalo de datas.
+
+    Inclui, como no arquivo do Ministério da Saúde, uma linha diária do
+    Brasil e uma por estado, ambas sem município. As linhas municipais
+    ficam agrupadas por município e, dentro dele, em ordem de data.
+
+    Args:
+        municipios (dict[str, np.ndarray]): Resultado de _municipios.
+        datas (np.ndarray): Datas do intervalo (datetime64[D]).
+        series (dict[str, np.ndarray]): Casos e óbitos (novos e acumulados)
+            dos municípios no intervalo, com forma (municípios, dias).
+        municipais (bool, optional): Inclui as linhas dos municípios. Default=True
+        agregados (bool, optional): Inclui as linhas do Brasil e dos estados.
+            Default=True
+
+    Returns:
+        pa.Table: Tabela com as colunas de ESQUEMA_RAW.
+    """
+    quantidade, dias = series['casosNovos'].shape
+    partes = []
+
+    if municipais:
+        colunas = {nome: np.repeat(valores, dias) for nome, valores in municipios.items()}
+        colunas['data'] = np.tile(datas, quantidade)
+        colunas.update({nome: valores.ravel() for nome, valores in series.items()})
+        partes.append(pa.table(colunas))
+
+    estado = municipios['estado']
+    for sigla, coduf, regiao in ESTADOS + [(None, 76, 'Brasil')]:
+        filtro = estado == sigla if sigla else np.ones(quantidade, bool)
+        if not agregados or not filtro.any():
+            continue
+        partes.append(pa.table({
+            'regiao': [regiao] * dias,
+            'estado': [sigla] * dias,
+            'coduf': [coduf] * dias,
+            'data': datas,
+            'populacaoTCU2019': [int(municipios['populacaoTCU2019'][filtro].sum())] * dias,
+            **{nome: valores[filtro].sum(axis=0) for nome, valores in series.items()},
+        }))
+
+    tabela = pa.concat_tables(
+        [p.select([c for c in ESQUEMA_RAW.names if c in p.column_names])
+         for p in partes], promote_options='default')
+
+    # A semana epidemiológica começa no domingo
+    data = tabela['data'].cast(pa.timestamp('s'))
+    semana = pc.iso_week(pc.add(data, pa.scalar(86400, pa.duration('s'))))
+
+    colunas = []
+    for campo in ESQUEMA_RAW:
+        tipo = (campo.type.value_type if pa.types.is_dictionary(campo.type)
+                else campo.type)
+        if campo.name == 'semanaEpi':
+            colunas.append(semana.cast(tipo))
+        elif campo.name in tabela.column_names:
+            colunas.append(tabela[campo.name].cast(tipo))
+        else:
+            colunas.append(pa.nulls(tabela.num_rows, tipo))
+    return pa.table(colunas, names=ESQUEMA_RAW.names)
+
+
+def gerar_dados(pasta, municipios=100, dias=365, arquivos=4, taxa_outliers=0.01,
+                inicio='2020-03-27', semente=0, por_municipio=False):
+    """
+    Gera CSVs sintéticos no formato do painel do Ministério da Saúde.
+
+    Os arquivos têm as mesmas colunas (ESQUEMA_RAW), o separador ';' e os
+    campos vazios do HIST_PAINEL_COVIDBR, e são gravados em '<pasta>/raw'
+    para serem lidos por agrupar. Como no download real, o período é
+    dividido entre os arquivos ('..._Parte1.csv', '..._Parte2.csv', ...).
+    O resultado é determinístico para a mesma semente.
+
+    Com por_municipio=True são os municípios que se dividem entre os
+    arquivos, cada um com a série inteira, e o bruto resultante fica
+    agrupado por município (ver limpar com fora_da_memoria=True). As linhas
+    do Brasil e dos estados vão para o último arquivo.
+
+    Args:
+        pasta (str): Pasta base; os CSVs vão para a subpasta 'raw'.
+        municipios (int, optional): Número de municípios. Default=100
+        dias (int, optional): Número de dias da série. Default=365
+        arquivos (int, optional): Número de arquivos CSV. Default=4
+        taxa_outliers (float, optional): Fração dos dias com picos ou
+            correções negativas. Default=0.01
+        inicio (str, optional): Primeira data, 'AAAA-MM-DD'. Default='2020-03-27'
+        semente (int, optional): Semente do gerador aleatório. Default=0
+        por_municipio (bool, optional): Divide os arquivos por município em
+            vez de por período. Default=False
+
+    Returns:
+        list[Path]: Arquivos gerados.
+
+    Example:
+        >>> gerar_dados('/tmp/bench', municipios=1000, dias=180, arquivos=2)
+        # Gera '/tmp/bench/raw/HIST_PAINEL_COVIDBR_Parte1.csv' e '..._Parte2.csv'
+    """
+    rng = np.random.default_rng(semente)
+
+    pasta_raw = Path(pasta) / 'raw'
+    pasta_raw.mkdir(parents=True, exist_ok=True)
+
+    fixos = _municipios(municipios, rng)
+    casos, obitos = _serie_de_casos(fixos, dias, taxa_outliers, rng)
+    series = {
+        'casosAcumulado': casos.cumsum(axis=1),
+        'casosNovos': casos,
+        'obitosAcumulado': obitos.cumsum(axis=1),
+        'obitosNovos': obitos,
+    }
+    datas = np.datetime64(inicio, 'D') + np.arange(dias)
+
+    gerados = []
+    opcoes = pv.WriteOptions(delimiter=';', quoting_style='none')
+
+    if por_municipio:
+        divisoes = np.array_split(np.arange(municipios), arquivos)
+    else:
+        divisoes = np.array_split(np.arange(dias), arquivos)
+
+    for parte, indices in enumerate(divisoes, 1):
+        if por_municipio:
+            tabela = _tabela({nome: valores[indices] for nome, valores in fixos.items()},
+                             datas, {nome: valores[indices] for nome, valores in series.items()},
+                             agregados=False)
+            if parte == arquivos:
+                tabela = pa.concat_tables(
+                    [tabela, _tabela(fixos, datas, series, municipais=False)])
+        else:
+            tabela = _tabela(fixos, datas[indices],
+                             {nome: valores[:, indices] for nome, valores in series.items()})
+
+        arquivo = pasta_raw / f'HIST_PAINEL_COVIDBR_Parte{parte}.csv'
+        pv.write_csv(tabela, arquivo, opcoes)
+        gerados.append(arquivo)
+
+        logging.info(f"Arquivo {arquivo.name} gerado com {tabela.num_rows} linhas")
+
+    return gerados
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(
+        description='Gera CSVs sintéticos no formato do painel de COVID-19')
+    parser.add_argument('--pasta', default='dados',
+                        help='Pasta base; os CSVs vão para a subpasta raw/')
+    parser.add_argument('--municipios', type=int, default=100)
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--arquivos', type=int, default=4)
+    parser.add_argument('--taxa-outliers', type=float, default=0.01)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--por-municipio', action='store_true',
+                        help='Divide os arquivos por município, e não por período')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    args = _argumentos()
+    gerar_dados(args.pasta, args.municipios, args.dias, args.arquivos,
+                args.taxa_outliers, semente=args.semente,
+                por_municipio=args.por_municipio)
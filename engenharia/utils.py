@@ -1,5 +1,255 @@
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import datetime
 from functools import wraps
+from pathlib import Path
+import json
 import logging
+import os
+import sys
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Métricas das etapas, uma linha JSON por span (ver configurar_metricas)
+metricas = logging.getLogger('metricas')
+
+# Identifica as linhas de uma mesma execução do pipeline
+EXECUCAO = uuid.uuid4().hex[:12]
+
+_span_atual = ContextVar('span_atual', default=None)
+
+# ru_maxrss vem em KiB no Linux e em bytes no macOS
+_ESCALA_RUSAGE = 1024 if sys.platform == 'darwin' else 1
+
+
+def configurar_metricas(caminho):
+    """
+    Grava as métricas das etapas em um arquivo JSON lines.
+
+    Sem esta configuração as linhas JSON vão para o log principal. O arquivo
+    é aberto em modo de acréscimo, de modo que execuções diferentes podem ser
+    comparadas pelo campo 'execucao'.
+
+    Args:
+        caminho (str): Arquivo de saída (ex.: 'dados/metricas.jsonl').
+
+    Returns:
+        None
+
+    Example:
+        >>> configurar_metricas('dados/metricas.jsonl')
+    """
+    handler = logging.FileHandler(caminho, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    metricas.addHandler(handler)
+    metricas.setLevel(logging.INFO)
+    metricas.propagate = False
+
+
+def tamanho_em_disco(caminho):
+    """
+    Calcula o tamanho de um arquivo ou de todos os arquivos de um diretório.
+
+    Args:
+        caminho (str): Arquivo ou diretório (ex.: dataset particionado).
+
+    Returns:
+        int: Tamanho em bytes, 0 se o caminho não existir.
+    """
+    caminho = Path(caminho)
+    if caminho.is_dir():
+        return sum(a.stat().st_size for a in caminho.rglob('*') if a.is_file())
+    return caminho.stat().st_size if caminho.exists() else 0
+
+
+def registrar_metricas(**valores):
+    """
+    Soma contadores ao span em execução (etapa ou sub-etapa).
+
+    Os contadores usuais são linhas_entrada, linhas_saida, bytes_lidos e
+    bytes_gravados. Fora de um span a chamada não tem efeito.
+
+    Args:
+        **valores (int): Valores somados aos contadores de mesmo nome.
+
+    Returns:
+        None
+
+    Example:
+        >>> registrar_metricas(linhas_entrada=len(df))
+    """
+    span = _span_atual.get()
+    if span is None:
+        return
+    for nome, valor in valores.items():
+        span['contadores'][nome] = span['contadores'].get(nome, 0) + valor
+
+
+def no_contexto_atual(iteravel):
+    """
+    Consome um iterável sempre no contexto do span atual.
+
+    Necessário quando o iterável é consumido por outra thread (ex.: o
+    pyarrow.dataset.write_dataset lendo um gerador de lotes), para que as
+    chamadas a registrar_metricas dentro dele cheguem ao span da etapa.
+
+    Args:
+        iteravel (Iterable): Iterável a ser consumido.
+
+    Returns:
+        Iterator: Os mesmos itens de `iteravel`.
+    """
+    # O contexto é copiado aqui, na thread da etapa, e não na primeira
+    # iteração do gerador, que já acontece na thread consumidora
+    contexto = copy_context()
+    iterador = iter(iteravel)
+
+    def consumir():
+        while True:
+            try:
+                yield contexto.run(next, iterador)
+            except StopIteration:
+                return
+
+    return consumir()
+
+
+def _tempo_cpu():
+    """
+    Tempo de CPU do processo e dos processos filhos já finalizados.
+
+    Returns:
+        float: Segundos de CPU (usuário + sistema).
+    """
+    tempos = os.times()
+    return (tempos.user + tempos.system
+            + tempos.children_user + tempos.children_system)
+
+
+def _reiniciar_pico_rss():
+    """
+    Zera o pico de memória residente do processo, quando o sistema permite.
+
+    No Linux, escrever '5' em /proc/self/clear_refs reinicia o VmHWM, e o
+    pico medido passa a ser o da etapa e não o da vida do processo.
+
+    Returns:
+        None
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as arquivo:
+            arquivo.write('5')
+    except OSError:
+        pass
+
+
+def _pico_rss_mb():
+    """
+    Pico de memória residente do processo, em MiB.
+
+    Returns:
+        float | None: Pico em MiB, ou None se não houver como medir.
+    """
+    pico_kb = 0
+    try:
+        with open('/proc/self/status') as arquivo:
+            for linha in arquivo:
+                if linha.startswith('VmHWM:'):
+                    pico_kb = int(linha.split()[1])
+    except OSError:
+        pass
+
+    if not pico_kb and resource is not None:
+        pico_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / _ESCALA_RUSAGE
+
+    return round(pico_kb / 1024, 1) if pico_kb else None
+
+
+def _pico_rss_filhos_mb():
+    """
+    Maior pico de memória residente entre os processos filhos já encerrados, em MiB.
+
+    É um máximo acumulado desde o início do processo (RUSAGE_CHILDREN), que
+    não pode ser reiniciado: medir só o reporta quando ele cresce durante o
+    span.
+
+    Returns:
+        float | None: Pico em MiB, ou None se não houver como medir.
+    """
+    if resource is None:
+        return None
+    pico_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / _ESCALA_RUSAGE
+    return round(pico_kb / 1024, 1) if pico_kb else None
+
+
+@contextmanager
+def medir(nome):
+    """
+    Mede um trecho do pipeline e emite suas métricas como uma linha JSON.
+
+    Spans podem ser aninhados: o nome emitido inclui o dos spans externos
+    (ex.: 'limpar/filtro'). Cada linha traz tempo de parede e de CPU, pico
+    de memória residente do processo, os contadores de registrar_metricas
+    e, havendo linhas, a vazão em linhas por segundo. Se um processo filho
+    (ex.: do pool de limpar com workers > 1) encerrou durante o span com um
+    pico maior que o de todos os filhos anteriores, esse pico vem em
+    'pico_rss_filhos_mb'.
+
+    Args:
+        nome (str): Nome do trecho.
+
+    Yields:
+        None
+
+    Example:
+        >>> with medir('filtro'):
+        ...     df = _filtrar_municipios_validos(df)
+    """
+    pai = _span_atual.get()
+    span = {'span': f"{pai['span']}/{nome}" if pai else nome, 'contadores': {}}
+    token = _span_atual.set(span)
+
+    if pai is None:
+        _reiniciar_pico_rss()
+
+    inicio = datetime.now().isoformat(timespec='seconds')
+    relogio = time.perf_counter()
+    filhos = _pico_rss_filhos_mb()
+    cpu = _tempo_cpu()
+    status = 'erro'
+
+    try:
+        yield
+        status = 'ok'
+    finally:
+        _span_atual.reset(token)
+        duracao = time.perf_counter() - relogio
+        contadores = span['contadores']
+
+        registro = {
+            'execucao': EXECUCAO,
+            'span': span['span'],
+            'status': status,
+            'inicio': inicio,
+            'duracao_s': round(duracao, 3),
+            'cpu_s': round(_tempo_cpu() - cpu, 3),
+            'pico_rss_mb': _pico_rss_mb(),
+            **contadores,
+        }
+        filhos_fim = _pico_rss_filhos_mb()
+        if filhos_fim and filhos_fim != filhos:
+            registro['pico_rss_filhos_mb'] = filhos_fim
+        linhas = contadores.get('linhas_saida', contadores.get('linhas_entrada'))
+        if linhas is not None:
+            registro['linhas_por_s'] = round(linhas / max(duracao, 1e-9))
+
+        metricas.info(json.dumps(registro, ensure_ascii=False))
 
 
 def registrar_execucao(fn):
@@ -11,6 +261,9 @@ def registrar_execucao(fn):
     - INFO quando a função é concluída com sucesso
     - ERROR quando ocorre uma exceção
 
+    A execução também é medida como um span (ver medir), que emite uma linha
+    JSON com tempo, CPU, memória e os contadores da etapa.
+
     Parâmetros
     ----------
     fn : callable
@@ -54,14 +307,15 @@ def registrar_execucao(fn):
     def wrapper(*args, **kwargs):
         logging.info(f"Iniciando processo: {fn.__name__}")
 
-        try:
-            resultado = fn(*args, **kwargs)
-            logging.info(f"Processo concluído com sucesso: {fn.__name__}")
-            return resultado
+        with medir(fn.__name__):
+            try:
+                resultado = fn(*args, **kwargs)
+                logging.info(f"Processo concluído com sucesso: {fn.__name__}")
+                return resultado
 
-        except Exception as e:
-            logging.error(
-                f"Erro no processo {fn.__name__}: {str(e)}", exc_info=True)
-            raise
+            except Exception as e:
+                logging.error(
+                    f"Erro no processo {fn.__name__}: {str(e)}", exc_info=True)
+                raise
 
     return wrapper
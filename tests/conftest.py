@@ -0,0 +1,46 @@
+from pathlib import Path
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# Os módulos do pipeline importam uns aos outros pelo nome (from esquema import ...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'engenharia'))
+
+from agrupar import agrupar  # noqa: E402
+from esquema import ESQUEMA_RAW, ler_parquet  # noqa: E402
+from sintetico import gerar_dados  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def pasta_sintetica(tmp_path_factory):
+    """Pasta com o '0.raw.parquet' de uma amostra sintética com outliers."""
+    pasta = tmp_path_factory.mktemp('sintetico')
+    gerar_dados(pasta, municipios=60, dias=250, arquivos=2, taxa_outliers=0.05)
+    agrupar(pasta)
+    return pasta
+
+
+@pytest.fixture(scope='session')
+def bruto(pasta_sintetica):
+    """Bruto sintético como DataFrame, com o esquema ESQUEMA_RAW."""
+    return ler_parquet(pasta_sintetica / '0.raw.parquet', ESQUEMA_RAW)
+
+
+@pytest.fixture
+def empate():
+    """
+    Município cujo último dia fica exatamente sobre o limite de outlier.
+
+    Com window_size=7 a janela da última linha tem só ela e os três dias
+    anteriores, [0, 0, 0, x]: média x/4, desvio x/2 e x a exatamente 1,5
+    desvio da média. Com este histórico o desvio do pandas (algoritmo
+    online) sai arredondado para baixo, e sem a margem de _eh_outlier o
+    último dia seria marcado como outlier.
+    """
+    casos = np.r_[np.random.default_rng(4).integers(0, 5000, 60), [0, 0, 0, 1000]]
+    return pd.DataFrame({
+        'municipio': 'Empate', 'estado': 'MG', 'codmun': 310000,
+        'data': pd.date_range('2021-01-01', periods=len(casos)),
+        'casosNovos': casos.astype('int32'),
+    })
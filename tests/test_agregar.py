@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+from agregar import _construir_agregados, _semanas_epidemiologicas
+
+
+def _atributos(datas, municipios):
+    """Atributos mínimos (COLUNAS_LIDAS) de municípios com casos e óbitos constantes."""
+    return pd.DataFrame([
+        {'codmun': codmun, 'populacao_tcu_2019': populacao, 'data': data,
+         'novos_casos_novos': casos, 'obitos_novos': 1,
+         'regiao': 'Sudeste', 'estado': estado, 'cod_regiao_saude': regiao_saude,
+         'nome_regiao_saude': f'Região {regiao_saude}'}
+        for codmun, populacao, estado, regiao_saude, casos in municipios
+        for data in pd.to_datetime(datas)
+    ])
+
+
+def test_semanas_epidemiologicas_na_virada_do_ano():
+    datas = pd.Series(pd.to_datetime([
+        '2019-12-28',  # sábado: última semana de 2019
+        '2019-12-29',  # domingo: semana 1 de 2020 (quarta-feira é 01/01)
+        '2020-12-31',  # 2020 tem 53 semanas
+        '2021-01-02',  # sábado: ainda na semana 53 de 2020
+        '2021-01-03',  # domingo: semana 1 de 2021
+    ]))
+    semanas = _semanas_epidemiologicas(datas)
+
+    assert semanas['ano_epi'].tolist() == [2019, 2020, 2020, 2020, 2021]
+    assert semanas['semana_epi'].tolist() == [52, 1, 53, 53, 1]
+    assert semanas['inicio_semana'].tolist() == list(pd.to_datetime([
+        '2019-12-22', '2019-12-29', '2020-12-27', '2020-12-27', '2021-01-03']))
+
+
+def test_semana_soma_os_dias_da_semana_epidemiologica():
+    df = _atributos(pd.date_range('2020-12-30', '2021-01-05'),
+                    [(1, 1000, 'SP', 1, 10)])
+    semana = _construir_agregados(df)['brasil_semana']
+
+    # 30/12 a 02/01 caem na semana 53 de 2020; 03/01 a 05/01 na semana 1 de 2021
+    assert semana[['ano_epi', 'semana_epi']].values.tolist() == [[2020, 53], [2021, 1]]
+    assert semana['novos_casos_novos'].tolist() == [40, 30]
+    assert semana['obitos_novos'].tolist() == [4, 3]
+
+
+def test_populacao_contada_uma_vez_por_municipio():
+    df = _atributos(pd.date_range('2021-03-01', periods=10),
+                    [(1, 1000, 'SP', 1, 10), (2, 3000, 'SP', 2, 30),
+                     (3, 500, 'RJ', 3, 5)])
+    agregados = _construir_agregados(df)
+
+    estado = agregados['estado_dia'].set_index(['estado', 'data'])
+    assert (estado.loc['SP', 'populacao'] == 4000).all()
+    assert (estado.loc['RJ', 'populacao'] == 500).all()
+    np.testing.assert_allclose(estado.loc['SP', 'casos_por_100k'], 40 / 4000 * 1e5)
+
+    assert (agregados['brasil_semana']['populacao'] == 4500).all()
+    assert (agregados['regiao_saude_dia'].groupby('cod_regiao_saude')['populacao']
+            .unique().map(list).tolist() == [[1000], [3000], [500]])
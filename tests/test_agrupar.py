@@ -0,0 +1,41 @@
+import pyarrow as pa
+import pytest
+from agrupar import agrupar
+from sintetico import gerar_dados
+
+# Blocos pequenos para que cada arquivo chegue em vários lotes
+TAMANHO_BLOCO = 64 << 10
+
+
+@pytest.fixture(scope='module')
+def pasta(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp('agrupar')
+    gerar_dados(pasta, municipios=40, dias=200, arquivos=5)
+    return pasta
+
+
+def _agrupar(pasta, workers):
+    return agrupar(pasta, tamanho_bloco=TAMANHO_BLOCO, workers=workers,
+                   em_memoria=True, checkpoint=False)
+
+
+@pytest.mark.parametrize('workers', [2, 4])
+def test_paralelo_igual_sequencial(pasta, workers):
+    assert _agrupar(pasta, workers).equals(_agrupar(pasta, 1))
+
+
+def test_erro_de_um_arquivo_interrompe_leitura(pasta, tmp_path):
+    (tmp_path / 'raw').mkdir()
+    for arquivo in sorted((pasta / 'raw').iterdir()):
+        (tmp_path / 'raw' / arquivo.name).write_bytes(arquivo.read_bytes())
+
+    # Um valor não numérico no meio do segundo arquivo
+    arquivo = sorted((tmp_path / 'raw').iterdir())[1]
+    linhas = arquivo.read_text().splitlines()
+    campos = linhas[len(linhas) // 2].split(';')
+    campos[4] = 'x'
+    linhas[len(linhas) // 2] = ';'.join(campos)
+    arquivo.write_text('\n'.join(linhas) + '\n')
+
+    with pytest.raises(pa.ArrowInvalid):
+        _agrupar(tmp_path, 3)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from atributos import _adicionar_series_temporais
+
+POPULACAO = 100_000
+
+
+def _serie(codmun, valores, faltando=()):
+    """Município com um valor por dia a partir de 01/01/2021, sem os dias de `faltando`."""
+    df = pd.DataFrame({
+        'codmun': codmun,
+        'data': pd.date_range('2021-01-01', periods=len(valores)),
+        'populacao_tcu_2019': POPULACAO,
+        'obitos_novos': np.array(valores, dtype='float64'),
+    })
+    return df[~df['data'].dt.day.isin(faltando)]
+
+
+@pytest.fixture(scope='module')
+def atributos():
+    # Em 1 e 2 o valor de cada dia é o próprio dia do mês (1, 2, ..., 22);
+    # o 2 não tem o dia 10. O 3 tem zeros, cinco casos por dia na segunda
+    # semana e zeros depois; o 4 só tem zeros
+    dias = list(range(1, 23))
+    df = pd.concat([
+        _serie(1, dias),
+        _serie(2, dias, faltando=[10]),
+        _serie(3, [0] * 7 + [5] * 7 + [0] * 8),
+        _serie(4, [0] * 22),
+    ])
+    # A ordem das linhas não pode influir no resultado
+    df = df.sample(frac=1, random_state=0)
+    resultado = _adicionar_series_temporais(df, series=['obitos_novos'])
+    pd.testing.assert_index_equal(resultado.index, df.index)
+    return resultado.set_index(['codmun', resultado['data'].dt.day])
+
+
+def _valor(atributos, codmun, dia, coluna):
+    return atributos.at[(codmun, dia), f'obitos_novos_{coluna}']
+
+
+@pytest.mark.parametrize('dia, coluna, esperado', [
+    # Defasagens: o valor de n dias antes, nulo antes do início da série
+    (15, 'lag_1', 14), (15, 'lag_7', 8), (15, 'lag_14', 1),
+    (7, 'lag_7', np.nan), (8, 'lag_7', 1), (1, 'lag_1', np.nan),
+    # As janelas terminam no dia anterior: em 15, os dias 8 a 14
+    (15, 'soma_movel_7', 77), (15, 'media_movel_7', 11),
+    (15, 'soma_movel_14', 105), (15, 'media_movel_14', 7.5),
+    (15, 'incidencia_7', 77 / POPULACAO * 1e5),
+    # Nulas enquanto a janela não está inteira na série
+    (7, 'soma_movel_7', np.nan), (8, 'soma_movel_7', 28),
+    (14, 'soma_movel_14', np.nan),
+    # Dias 8 a 14 contra dias 1 a 7
+    (15, 'crescimento_semanal', 77 / 28 - 1),
+    (14, 'crescimento_semanal', np.nan),
+])
+def test_janelas_terminam_no_dia_anterior(atributos, dia, coluna, esperado):
+    np.testing.assert_allclose(_valor(atributos, 1, dia, coluna), esperado)
+
+
+@pytest.mark.parametrize('dia, coluna, esperado', [
+    # A defasagem procura a data, não a linha anterior
+    (11, 'lag_1', np.nan), (17, 'lag_7', np.nan), (12, 'lag_1', 11),
+    # A janela soma só os dias presentes e a média divide por eles
+    (12, 'soma_movel_7', 5 + 6 + 7 + 8 + 9 + 11),
+    (12, 'media_movel_7', (5 + 6 + 7 + 8 + 9 + 11) / 6),
+    (15, 'crescimento_semanal', (8 + 9 + 11 + 12 + 13 + 14) / 28 - 1),
+])
+def test_lacuna_no_calendario(atributos, dia, coluna, esperado):
+    np.testing.assert_allclose(_valor(atributos, 2, dia, coluna), esperado)
+
+
+@pytest.mark.parametrize('codmun, dia, esperado', [
+    (3, 15, np.nan),  # 35 contra 0: infinito vira nulo
+    (3, 22, -1),      # 0 contra 35: queda de 100%
+    (4, 15, np.nan),  # 0 contra 0
+])
+def test_crescimento_com_semanas_zeradas(atributos, codmun, dia, esperado):
+    np.testing.assert_allclose(_valor(atributos, codmun, dia, 'crescimento_semanal'),
+                               esperado)
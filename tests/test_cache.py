@@ -0,0 +1,69 @@
+import importlib
+import sys
+import pytest
+import cache
+from cache import executar_com_cache
+
+ETAPA = '''from auxiliar import FATOR
+
+
+def etapa(pasta, fator=1):
+    entrada = open(f'{pasta}/entrada.txt').read()
+    open(f'{pasta}/saida.txt', 'w').write(entrada * fator * FATOR)
+'''
+
+
+@pytest.fixture
+def pasta(tmp_path, monkeypatch):
+    # Módulos da etapa em uma pasta de código própria do teste
+    codigo = tmp_path / 'codigo'
+    codigo.mkdir()
+    (codigo / 'etapa.py').write_text(ETAPA)
+    (codigo / 'auxiliar.py').write_text('FATOR = 1\n')
+    monkeypatch.setattr(cache, 'PASTA_CODIGO', codigo)
+    monkeypatch.syspath_prepend(str(codigo))
+    yield tmp_path
+    for nome in ['etapa', 'auxiliar']:
+        sys.modules.pop(nome, None)
+
+
+def _executar(pasta, fator=1):
+    etapa = importlib.import_module('etapa').etapa
+    return executar_com_cache(etapa, pasta, entradas=[f'{pasta}/entrada.txt'],
+                              saidas=[f'{pasta}/saida.txt'],
+                              parametros={'fator': fator})
+
+
+def test_reexecuta_apenas_quando_algo_muda(pasta):
+    (pasta / 'entrada.txt').write_text('a')
+    assert _executar(pasta)
+    assert not _executar(pasta)
+
+    assert _executar(pasta, fator=2)
+    assert not _executar(pasta, fator=2)
+
+    (pasta / 'entrada.txt').write_text('b')
+    assert _executar(pasta, fator=2)
+
+    (pasta / 'saida.txt').unlink()
+    assert _executar(pasta, fator=2)
+    assert not _executar(pasta, fator=2)
+
+
+def test_mudanca_em_modulo_importado_invalida_cache(pasta):
+    (pasta / 'entrada.txt').write_text('a')
+    assert _executar(pasta)
+
+    (pasta / 'codigo' / 'auxiliar.py').write_text('FATOR = 2\n')
+    assert _executar(pasta)
+    assert not _executar(pasta)
+
+
+def test_falha_nao_grava_manifesto(pasta):
+    (pasta / 'entrada.txt').write_text('a')
+    assert _executar(pasta)
+
+    (pasta / 'entrada.txt').unlink()
+    with pytest.raises(FileNotFoundError):
+        _executar(pasta)
+    assert not (pasta / '.cache' / 'etapa.json').exists()
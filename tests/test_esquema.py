@@ -0,0 +1,17 @@
+import pyarrow as pa
+from esquema import ESQUEMA_RAW, gravar_lotes, ler_tabela
+
+
+def test_arrow_grava_dicionarios_com_deltas(bruto, tmp_path):
+    # Um lote por estado, cada um com o seu próprio dicionário
+    lotes = [pa.Table.from_pandas(parte, schema=ESQUEMA_RAW, preserve_index=False)
+             for _, parte in bruto.groupby('estado', observed=True)]
+    caminho = tmp_path / '0.raw.arrow'
+    gravar_lotes(lotes, caminho, ESQUEMA_RAW)
+
+    with pa.memory_map(str(caminho)) as fonte:
+        armazenado = pa.ipc.open_file(fonte).read_all()
+    assert armazenado.schema.equals(ESQUEMA_RAW)
+
+    lido = ler_tabela(caminho, ESQUEMA_RAW)
+    assert lido.to_pylist() == pa.concat_tables(lotes).to_pylist()
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+from atributos import computar_atributos
+from esquema import ESQUEMA_ATRIBUTOS, para_dataframe, para_tabela
+from estrela import construir_estrela
+from limpar import limpar
+
+
+@pytest.fixture(scope='module')
+def atributos(pasta_sintetica, bruto):
+    comum = {'em_memoria': True, 'checkpoint': False}
+    limpo = limpar(pasta_sintetica, dados=bruto, **comum)
+    return computar_atributos(pasta_sintetica, dados=limpo, **comum)
+
+
+def test_dim_municipio_usa_a_descricao_mais_recente(atributos):
+    df = atributos.copy()
+    codmun = df['codmun'].iloc[0]
+    recentes = (df['codmun'] == codmun) & (df['data'] >= df['data'].max() - pd.Timedelta(days=9))
+    antiga = df.loc[recentes, 'populacao_tcu_2019'].iloc[0]
+    df.loc[recentes, 'populacao_tcu_2019'] = antiga + 1
+
+    # A ordem das linhas não decide a descrição escolhida
+    tabela = para_tabela(df.sample(frac=1, random_state=0), ESQUEMA_ATRIBUTOS)
+    dim = para_dataframe(construir_estrela(tabela)['dim_municipio'], ESQUEMA_ATRIBUTOS)
+
+    assert dim['codmun'].is_unique
+    assert len(dim) == df['codmun'].nunique()
+    assert dim.set_index('codmun').at[codmun, 'populacao_tcu_2019'] == antiga + 1
+
+
+def test_juncao_reconstroi_os_atributos(atributos):
+    estrela = construir_estrela(para_tabela(atributos, ESQUEMA_ATRIBUTOS))
+    fato, dim_municipio, dim_calendario = (
+        para_dataframe(estrela[nome], ESQUEMA_ATRIBUTOS)
+        for nome in ['fato', 'dim_municipio', 'dim_calendario'])
+
+    assert dim_calendario['data'].is_monotonic_increasing
+    assert dim_calendario['data'].is_unique
+
+    juntos = (fato.merge(dim_municipio, on='codmun', validate='many_to_one')
+              .merge(dim_calendario, on='data', validate='many_to_one'))
+    colunas = ESQUEMA_ATRIBUTOS.names
+    esperado = atributos[colunas].sort_values(['codmun', 'data'], ignore_index=True)
+    obtido = juntos[colunas].sort_values(['codmun', 'data'], ignore_index=True)
+    pd.testing.assert_frame_equal(obtido, esperado, check_dtype=False,
+                                  check_categorical=False)
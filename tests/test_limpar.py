@@ -0,0 +1,192 @@
+import functools
+import importlib.util
+import json
+import logging
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import limpar
+from agrupar import agrupar
+from esquema import ESQUEMA_LIMPO, caminho_artefato, ler_parquet, para_dataframe
+from limpar import (COLUNAS_GERADAS, COLUNAS_LIMPEZA, FalhaNaLimpeza,
+                    _filtrar_municipios_validos, _limpar, _limpar_duckdb,
+                    _limpar_incremental, _limpar_vetorizado, _processar,
+                    verificar_paridade)
+from sintetico import gerar_dados
+
+# Com window_size=3 um valor nunca se afasta mais de ~1,15 desvio padrão da
+# média da própria janela, então threshold=2 não marca nenhum outlier; os
+# pares abaixo marcam
+PARAMETROS = [(5, 1.5), (7, 1.5), (7, 2)]
+
+ESTRATEGIAS = [_limpar, _limpar_vetorizado, pytest.param(
+    _limpar_duckdb, marks=pytest.mark.skipif(importlib.util.find_spec('duckdb') is None,
+                                             reason='duckdb não instalado'))]
+
+# Séries com o resultado calculado à mão, com window_size=7. Em uma janela
+# de n valores [0, ..., 0, x] o valor x fica a exatamente (n-1)/sqrt(n)
+# desvios da média: 1,5 para n=4 (empate, nas pontas da série) e 4/sqrt(5)
+# para n=5. Empates não são outliers; um outlier vira o valor do dia
+# anterior, ou do seguinte no primeiro dia
+EMPATES = [
+    ([0, 0, 0, 0, 1000], 1.5, [0, 0, 0, 0, 1000]),
+    ([0, 0, 0, 0, 1000], 1.25, [0, 0, 0, 0, 0]),
+    ([1000, 0, 0, 0, 0], 1.5, [1000, 0, 0, 0, 0]),
+    ([1000, 0, 0, 0, 0], 1.25, [0, 0, 0, 0, 0]),
+    ([7, 7, 7, 7, 7, 7, 7, 1007, 7], 1.5, [7] * 9),
+    ([7, 7, 7, 7, 7, 7, 7, 1007, 7], 1.8, [7, 7, 7, 7, 7, 7, 7, 1007, 7]),
+]
+
+
+@pytest.fixture(scope='module')
+def amostra(bruto):
+    return _filtrar_municipios_validos(bruto[COLUNAS_LIMPEZA])
+
+
+@pytest.mark.parametrize('window_size, threshold', PARAMETROS)
+def test_parametros_marcam_outliers(amostra, window_size, threshold):
+    limpo = _limpar_vetorizado(amostra, window_size, threshold)
+    alterados = limpo['novos_casos_novos'] != limpo['casosNovos']
+    assert alterados.sum() > 0
+
+
+@pytest.mark.parametrize('window_size, threshold', PARAMETROS)
+def test_vetorizada_igual_por_grupo(amostra, window_size, threshold):
+    verificar_paridade(amostra, window_size, threshold)
+
+
+def test_valor_sobre_o_limite_nao_e_outlier(empate):
+    for limpo in (_limpar(empate.copy(), 7, 1.5), _limpar_vetorizado(empate, 7, 1.5)):
+        assert limpo['novos_casos_novos'].iloc[-1] == 1000
+
+
+@pytest.mark.parametrize('estrategia', ESTRATEGIAS)
+@pytest.mark.parametrize('casos, threshold, esperado', EMPATES)
+def test_empates_calculados_a_mao(estrategia, casos, threshold, esperado):
+    df = pd.DataFrame({
+        'municipio': 'Empate', 'estado': 'MG', 'codmun': 310000,
+        'data': pd.date_range('2021-01-01', periods=len(casos)),
+        'casosNovos': np.array(casos, dtype='int32'),
+    })
+    limpo = estrategia(df, 7, threshold)
+    assert limpo['novos_casos_novos'].tolist() == esperado
+
+
+@pytest.mark.parametrize('window_size, threshold', PARAMETROS)
+def test_incremental_igual_a_limpeza_completa(amostra, window_size, threshold):
+    base = amostra[amostra['data'] <= amostra['data'].max() - pd.Timedelta(days=10)]
+    anterior = _limpar_vetorizado(base, window_size, threshold)
+
+    # Dias novos em todos os municípios, um dia antigo revisado em um deles
+    # e outro município removido dos dados
+    revisado, removido = amostra['municipio'].unique()[:2]
+    atual = amostra[amostra['municipio'] != removido].copy()
+    dia = (atual['municipio'] == revisado) & (atual['data'] == atual['data'].min()
+                                              + pd.Timedelta(days=40))
+    atual.loc[dia, 'casosNovos'] += 5000
+
+    esperado = _limpar_vetorizado(atual, window_size, threshold)
+    obtido = _limpar_incremental(atual, anterior, window_size, threshold)
+
+    assert obtido.index.equals(esperado.index)
+    for coluna in COLUNAS_GERADAS:
+        pd.testing.assert_series_equal(obtido[coluna].astype('float64'),
+                                       esperado[coluna].astype('float64'))
+
+
+def test_acumulados_sao_soma_dos_suavizados(amostra):
+    limpo = _limpar_vetorizado(amostra, 7, 1.5)
+    for _, grupo in limpo.groupby(['municipio', 'estado'], observed=True):
+        np.testing.assert_array_equal(grupo['novos_casos_acumulados'],
+                                      grupo['novos_casos_novos'].cumsum())
+
+
+def test_falha_de_municipio_interrompe_limpeza(amostra, monkeypatch):
+    primeiro = amostra['municipio'].iloc[0]
+    _limpar_original = limpar._limpar
+
+    def _falhar_no_primeiro(df, window_size, threshold):
+        if df['municipio'].iloc[0] == primeiro:
+            raise ValueError('falha simulada')
+        return _limpar_original(df, window_size, threshold)
+
+    monkeypatch.setattr(limpar, '_limpar', _falhar_no_primeiro)
+    with pytest.raises(FalhaNaLimpeza):
+        _processar(amostra, estrategia='por_grupo')
+
+    falhas = []
+    _processar(amostra, estrategia='por_grupo', falhas=falhas)
+    assert len(falhas) == 1
+
+
+@pytest.mark.parametrize('particionar', [False, True])
+def test_fora_da_memoria_com_bruto_dividido_por_periodo(tmp_path, particionar):
+    # Mais de um ano e arquivos divididos por período: as linhas de cada
+    # município ficam espalhadas pelo bruto (ou pelas partições de ano)
+    gerar_dados(tmp_path, municipios=80, dias=400, arquivos=3, taxa_outliers=0.05)
+    agrupar(tmp_path, particionar=particionar)
+
+    colunas = COLUNAS_LIMPEZA + COLUNAS_GERADAS
+    esperado = para_dataframe(
+        limpar.limpar(tmp_path, particionar=particionar, em_memoria=True,
+                      checkpoint=False), ESQUEMA_LIMPO)[colunas]
+    limpar.limpar(tmp_path, particionar=particionar, fora_da_memoria=True)
+    obtido = ler_parquet(caminho_artefato(tmp_path, '1.limpo', 'parquet', particionar),
+                         ESQUEMA_LIMPO, colunas=colunas)
+
+    def ordenar(df):
+        return df.sort_values(['codmun', 'data']).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(ordenar(obtido), ordenar(esperado),
+                                  check_categorical=False)
+    assert not list(tmp_path.glob('*.agrupamento'))
+
+
+def test_retomavel_continua_de_onde_parou(pasta_sintetica, tmp_path, monkeypatch):
+    shutil.copy(pasta_sintetica / '0.raw.parquet', tmp_path)
+    monkeypatch.setattr(limpar, '_limpar_retomavel', functools.partial(
+        limpar._limpar_retomavel, municipios_por_lote=10))
+    processar = limpar._processar
+    chamadas = []
+    interromper = True
+
+    def contar(df, *args, **kwargs):
+        chamadas.append(df['municipio'].nunique())
+        if interromper and len(chamadas) == 3:
+            raise RuntimeError('execução interrompida')
+        return processar(df, *args, **kwargs)
+
+    monkeypatch.setattr(limpar, '_processar', contar)
+    with pytest.raises(RuntimeError):
+        limpar.limpar(tmp_path, retomavel=True)
+
+    manifesto = json.loads((tmp_path / '1.limpo.parquet.spool' / 'manifesto.json').read_text())
+    assert sorted(manifesto['concluidos']) == ['0', '1']
+
+    # A nova execução processa só os lotes que faltam
+    chamadas.clear()
+    interromper = False
+    limpar.limpar(tmp_path, retomavel=True)
+    assert chamadas == [10] * 4
+    assert not (tmp_path / '1.limpo.parquet.spool').exists()
+
+    colunas = COLUNAS_LIMPEZA + COLUNAS_GERADAS
+    monkeypatch.setattr(limpar, '_processar', processar)
+    esperado = para_dataframe(limpar.limpar(tmp_path, em_memoria=True, checkpoint=False),
+                              ESQUEMA_LIMPO)[colunas]
+    obtido = ler_parquet(tmp_path / '1.limpo.parquet', ESQUEMA_LIMPO, colunas=colunas)
+
+    def ordenar(df):
+        return df.sort_values(['codmun', 'data']).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(ordenar(obtido), ordenar(esperado),
+                                  check_categorical=False)
+
+
+@pytest.mark.parametrize('opcao', ['retomavel', 'fora_da_memoria'])
+def test_opcoes_de_disco_em_memoria_avisam(bruto, tmp_path, caplog, opcao):
+    with caplog.at_level(logging.WARNING):
+        limpar.limpar(tmp_path, dados=bruto, em_memoria=True, checkpoint=False,
+                      **{opcao: True})
+    assert f'{opcao}=True é ignorado' in caplog.text
@@ -0,0 +1,31 @@
+import pytest
+from esquema import ESQUEMA_LIMPO, para_dataframe
+from limpar import COLUNAS_LIMPEZA, _filtrar_municipios_validos, _limpar_duckdb, limpar
+from limpar import verificar_paridade as paridade_limpeza
+from atributos import verificar_paridade as paridade_atributos
+
+pytest.importorskip('duckdb')
+
+# Inclui pares com valores exatamente sobre o limite de outlier, em que o
+# desvio padrão do DuckDB e o do pandas diferem no arredondamento
+PARAMETROS = [(3, 2), (5, 1.5), (7, 1.5), (7, 2)]
+
+
+@pytest.fixture(scope='module')
+def limpo(pasta_sintetica):
+    return para_dataframe(limpar(pasta_sintetica, em_memoria=True, checkpoint=False),
+                          ESQUEMA_LIMPO)
+
+
+@pytest.mark.parametrize('window_size, threshold', PARAMETROS)
+def test_limpeza_duckdb_igual_pandas(bruto, window_size, threshold):
+    amostra = _filtrar_municipios_validos(bruto[COLUNAS_LIMPEZA])
+    paridade_limpeza(amostra, window_size, threshold, estrategia='duckdb')
+
+
+def test_valor_sobre_o_limite_nao_e_outlier(empate):
+    assert _limpar_duckdb(empate, 7, 1.5)['novos_casos_novos'].iloc[-1] == 1000
+
+
+def test_atributos_duckdb_igual_pandas(limpo):
+    paridade_atributos(limpo, motor='duckdb')
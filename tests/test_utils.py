@@ -0,0 +1,33 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import pytest
+from utils import _pico_rss_filhos_mb, medir
+
+pytest.importorskip('resource')
+
+
+def _alocar(mb):
+    return len(bytearray(mb << 20))
+
+
+def _spans(caplog):
+    return {registro['span']: registro for registro in
+            (json.loads(r.getMessage()) for r in caplog.records if r.name == 'metricas')}
+
+
+def test_pico_dos_filhos_so_no_span_em_que_muda(caplog):
+    caplog.set_level(logging.INFO, logger='metricas')
+    # O filho precisa superar o pico de todos os filhos anteriores do processo
+    mb = int(_pico_rss_filhos_mb() or 0) + 64
+
+    with medir('pool'):
+        with ProcessPoolExecutor(1) as pool:
+            pool.submit(_alocar, mb).result()
+    with medir('depois'):
+        pass
+
+    spans = _spans(caplog)
+    assert spans['pool']['pico_rss_filhos_mb'] >= mb
+    assert spans['pool']['pico_rss_mb'] is not None
+    assert 'pico_rss_filhos_mb' not in spans['depois']